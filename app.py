@@ -1,102 +1,129 @@
 import streamlit as st
 import os
-from io import BytesIO
 from utils.geocode_utils import GeocodeUtils
 from utils.text_processing import FileProcessor
-from utils.model_back import ModelBack
 from utils.map import Map
-from utils.rag import RAG
+from utils.pipeline import ExtractionPipeline
+from utils.jobs import ExtractionJob
+from utils.chunker import TokenChunker
+from utils.uploads import get_upload_store
+from utils.sqlite_store import content_hash
+from utils.spatial_index import EventSpatialIndex
+from utils.model_registry import get_registry, get_model_back, get_rag
+
+# 模型闲置超过该时长(秒)后从进程中释放
+MODEL_IDLE_TTL = int(os.getenv("MODEL_IDLE_TTL", "1800"))
+# 文本块的 token 预算和相邻块的重叠 token 数
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "2000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "0"))
+# 地图渲染方式：cluster 为单个 GeoJSON 图层加浏览器端聚合，markers 为每个事件一个标记
+MAP_RENDER_MODE = os.getenv("MAP_RENDER_MODE", "cluster")
+# 地图上一次最多绘制的事件标记数；聚合模式下标记不单独生成 HTML，上限可以更高
+MAP_MAX_MARKERS = int(os.getenv("MAP_MAX_MARKERS", "20000" if MAP_RENDER_MODE == "cluster" else "2000"))
+# 地图组件的 key，组件最近一次返回的视图状态保存在 st.session_state[MAP_KEY]
+MAP_KEY = "event_map"
+# 尚未渲染过地图时的视野和缩放级别，与 Map.init_map 一致
+WORLD_BBOX = (-180, -90, 180, 90)
+DEFAULT_ZOOM = 2
 
 def upload_and_process_file(llm,rag,processing_info,row1_col1,row1_col2,row2):
     uploaded_file = st.sidebar.file_uploader("上传文件", type=["pdf", "txt"])
-    # 确保 data 文件夹存在
-    data_dir = './data'
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
+    uploads = get_upload_store()
     if uploaded_file is not None:
-        if uploaded_file != st.session_state.uploaded_file:
-            st.session_state.uploaded_file = uploaded_file
+        file_content = uploaded_file.getvalue()
+        # 以内容哈希判断是否为新文件，同一本书换文件名或换会话上传都视为同一文件
+        upload_sha = content_hash(file_content)
+        if upload_sha != st.session_state.upload_sha:
+            st.session_state.upload_sha = upload_sha
             st.session_state.processed = False
             st.session_state.file_changed = True
+            st.session_state.RAGed = False
             st.session_state.geo_info_list = []  # 重置geo_info_list
-            st.session_state.processed_event_ids = [] # 事件ID列表
-            # 获取文件名
-            file_name = uploaded_file.name
-            
-            # 构建保存路径
-            save_path = os.path.join(data_dir, file_name)
-            
-            # 将文件内容写入到指定位置
-            with open(save_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+            record, created = uploads.put(file_content, uploaded_file.name)
             with row1_col1:
-                st.success(f"文件已保存到: {save_path}")
+                if created:
+                    st.success(f"文件已保存到: {record['file_path']}")
+                else:
+                    st.success(f"文件已上传过，复用已保存的副本: {record['file_path']}")
 
         else:
             st.session_state.file_changed = False
 
         if st.session_state.isRAG and not st.session_state.RAGed:
-                rag.build_index_from_file()
+                # 增量同步：只为新增或变化的文件计算向量
+                sync_stats = rag.sync_index()
+                uploads.mark_indexed()
+                if sync_stats["added"] or sync_stats["updated"] or sync_stats["removed"]:
+                    message = (f"RAG索引已更新: 新增 {sync_stats['added']} 个文件，更新 {sync_stats['updated']} 个，"
+                               f"删除 {sync_stats['removed']} 个")
+                else:
+                    message = "RAG索引已是最新，直接复用"
                 st.session_state.RAGed = True
                 with row2:
-                    st.success("RAG索引已构建")
+                    st.success(message)
+
+        if llm and not st.session_state.processed:
+            # 按当前模型的 tokenizer 装箱整句，块数与模型上下文相匹配
+            chunker = TokenChunker(llm.count_tokens, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                                   tokenizer_id=llm.model_id)
+            # 以文件内容哈希(加上切分配置)为任务ID，会话中断或调用失败后重新上传只处理未完成的部分
+            job = ExtractionJob(f"{st.session_state.upload_sha}-{chunker.signature}", name=uploaded_file.name)
+            if job.done:
+                # 处理过的文件直接从检查点渲染，不再解析文本和调用 LLM
+                geo_info_list = list(job.iter_events())
+                for event_info in geo_info_list:
+                    display_event_info(event_info,row1_col1)
+                st.session_state.geo_info_list = geo_info_list
+                st.session_state.processed = True
+                with row1_col1:
+                    st.success(f"文件已处理过，已加载 {len(geo_info_list)} 个事件")
+                return
 
-        if not st.session_state.processed:
-            
             file_processor = FileProcessor()
-            file_content = uploaded_file.read()
-            file_stream = BytesIO(file_content)
+            file_path = uploads.get(st.session_state.upload_sha)["file_path"]
             if uploaded_file.name.endswith('.pdf'):
-                text_list = file_processor.extract_text_from_pdf(file_stream)
+                # 逐页流式解析，处理流水线在后续页面解析的同时开始处理前面的页面
+                pages = file_processor.iter_pdf_pages(file_path)
             elif uploaded_file.name.endswith('.txt'):
-                text_list = file_processor.extract_text_from_txt(file_stream)
+                pages = file_processor.iter_text_from_txt(file_path)
             else:
                 st.error("不支持的文件类型")
-            if llm and not st.session_state.processed:
-                geo_info_list = st.session_state.geo_info_list
+                return
+            text_list = chunker.chunk(pages)
+            if not st.session_state.processed:
+                # 每次重新处理都从检查点回放，避免重复追加
+                geo_info_list = []
                 geocode_utils = GeocodeUtils(api_type=st.session_state.geocode_type, baidu_key=st.session_state.baidu_key, user_agent=st.session_state.username)
                 with row1_col1:
                     processing_info.info("正在处理文件，请稍候...")
                 
-                for text in text_list:
-                    processed_event_ids = []
-                    event_list = llm.get_event_list(text)
-                    if event_list:
-                        for i, event in enumerate(event_list):
-                            event_id = i  # 假设event对象有一个唯一的id属性
-                            if event_id is None:
-                                st.warning("事件缺少唯一标识符")
-                                continue
-                            
-                            print(f"这是第 {i} 事件，ID: {event_id}")
-                            try:
-                                if event_id not in processed_event_ids:
-
-                                    event_info = llm.process_event(event, language="英文")
-                                    print(event_info)
-                                    address = event_info["address"]
-                                    print(address,"地址")
-                                    geocode_info = geocode_utils.geocode(address)
-                                    print(geocode_info,"地理编码")
-                                    if geocode_info:
-                                        event_info["geocode"] = geocode_info
-                                        processed_event_ids.append(event_id)  # 添加到已处理事件的集合中
-                                    else:
-                                        continue 
-                            except Exception as e:
-                                print(f"处理事件时出错: {e}")
-                                continue
-                            event_info["geocode"] = geocode_info
-                            processed_event_ids.append(event_id)
-                            geo_info_list.append(event_info)
-                            if event_info:
-                                display_event_info(event_info,row1_col1)
-                
+                # 分阶段并发处理，事件按原文顺序陆续返回
+                pipeline = ExtractionPipeline(llm, geocode_utils, language="英文", mode=st.session_state.extract_mode)
+                for event_info in pipeline.run(text_list, job=job):
+                    print(event_info)
+                    geo_info_list.append(event_info)
+                    display_event_info(event_info,row1_col1)
+                    progress = job.progress()
+                    processing_info.info(f"正在处理文件: 文本块 {progress['chunks_done']}/{progress['total_chunks'] or '?'}，"
+                                         f"事件 {progress['events_done']}/{progress['events_total']}")
+
                 processing_info.empty()  # 清空处理信息
                 st.session_state.geo_info_list = geo_info_list  # 保存更新后的geo_info_list
                 st.session_state.processed = True
                 with row1_col1:
-                    st.success("文件处理完成")
+                    if job.done:
+                        st.success("文件处理完成")
+                    else:
+                        st.warning("部分文本块或事件处理失败，刷新页面并重新上传该文件可继续处理未完成的部分")
+                    chunk_report = chunker.report()
+                    if chunk_report["inputs"]:
+                        st.caption(f"按 token 预算切分为 {chunk_report['chunks']} 个文本块(原切分 {chunk_report['inputs']} 块)，"
+                                   f"节省LLM调用 {chunk_report['saved_calls']} 次")
+                    if st.session_state.extract_mode == "single":
+                        report = llm.extraction_report()
+                        print(report)
+                        st.caption(f"单次抽取节省LLM调用 {report['saved_calls']} 次，节省提示词 {report['saved_prompt_tokens']} tokens，"
+                                   f"缓存命中 {report['cache_hits']} 次")
         
 
 
@@ -110,9 +137,16 @@ def display_event_info(event_info,row1_col1):
 def update_map(m):
     geo_info_list = st.session_state.geo_info_list
     if len(geo_info_list) > 0:
-        for idx, info in enumerate(geo_info_list):
-            geo_info = info["geocode"]
-            m.add_marker(info, geo_info)
+        # 只绘制当前视野和缩放级别下需要显示的事件
+        spatial_index = get_spatial_index()
+        ids = spatial_index.query_viewport(map_view_bbox() or WORLD_BBOX, map_view_zoom(),
+                                           max_events=MAP_MAX_MARKERS, thin=m.render_mode == "markers")
+        for info in spatial_index.get(ids):
+            m.add_marker(info, info["geocode"])
+        if len(ids) < len(spatial_index):
+            st.caption(f"当前视野显示 {len(ids)}/{len(spatial_index)} 个事件，放大地图查看更多")
+        # 路线始终连接全部事件，不随视野筛选和抽稀断开
+        m.add_polyline(spatial_index.route())
     else:
         pass
     # 导出按钮
@@ -122,7 +156,7 @@ def update_map(m):
         # export_shp = st.sidebar.button("导出 SHP")
 
         if export_geojson:
-            b = m.export_geojson()
+            b = m.export_geojson(geo_info_list)
             st.sidebar.download_button(
                 label="下载 GeoJSON",
                 data=b,
@@ -139,6 +173,38 @@ def update_map(m):
         #         mime="application/zip"
         #     )
 
+def get_spatial_index():
+    # 事件列表被整体替换时才重建空间索引
+    events = st.session_state.geo_info_list
+    spatial_index = st.session_state.get("spatial_index")
+    if spatial_index is None or spatial_index.events is not events:
+        spatial_index = EventSpatialIndex(events)
+        st.session_state.spatial_index = spatial_index
+    return spatial_index
+
+def map_view():
+    # 地图组件最近一次返回的视图状态，平移、缩放后的重新运行在绘制前即可读到
+    return st.session_state.get(MAP_KEY) or {}
+
+def map_view_zoom():
+    return map_view().get("zoom") or DEFAULT_ZOOM
+
+def map_view_bbox():
+    """
+    当前地图视野的 (min_lon, min_lat, max_lon, max_lat)，尚未渲染过地图时返回 None
+    """
+    bounds = map_view().get("bounds") or {}
+    south_west, north_east = bounds.get("_southWest"), bounds.get("_northEast")
+    if not south_west or not north_east or south_west.get("lat") is None:
+        return None
+    min_lon, max_lon = south_west["lng"], north_east["lng"]
+    if max_lon - min_lon >= 360:
+        min_lon, max_lon = -180, 180
+    else:
+        # 地图平移超过 180 度经线后经度会超出 [-180, 180]
+        min_lon, max_lon = (min_lon + 180) % 360 - 180, (max_lon + 180) % 360 - 180
+    return min_lon, south_west["lat"], max_lon, north_east["lat"]
+
 def output(chat_container,placeholder,response):
     with chat_container:
             placeholder.markdown(response + "▌")
@@ -146,6 +212,9 @@ def output(chat_container,placeholder,response):
 def toggle_isRAG():
     st.session_state.isRAG = not st.session_state.isRAG
 
+def toggle_isGeoFilter():
+    st.session_state.isGeoFilter = not st.session_state.isGeoFilter
+
 def toggle_isSmartMap():
     st.session_state.isSmartMap = not st.session_state.isSmartMap
 
@@ -162,8 +231,8 @@ if 'baidu_key' not in st.session_state:
     st.session_state.baidu_key = ""
 if 'geocode_type' not in st.session_state:
     st.session_state.geocode_type = "free"
-if 'uploaded_file' not in st.session_state:
-    st.session_state.uploaded_file = None
+if 'upload_sha' not in st.session_state:
+    st.session_state.upload_sha = None
 if 'file_changed' not in st.session_state:
     st.session_state.file_changed = False
 if 'processed' not in st.session_state:
@@ -174,6 +243,8 @@ if 'selected_info' not in st.session_state:
     st.session_state.selected_info = None
 if 'model_type' not in st.session_state:
     st.session_state.model_type = "deepseek"
+if 'extract_mode' not in st.session_state:
+    st.session_state.extract_mode = "single"
 # 初始化会话状态
 if 'isRAG' not in st.session_state:
     st.session_state.isRAG = False
@@ -181,11 +252,20 @@ if 'isSmartMap' not in st.session_state:
     st.session_state.isSmartMap = False
 if 'RAGed' not in st.session_state:
     st.session_state.RAGed = False
+if 'isGeoFilter' not in st.session_state:
+    st.session_state.isGeoFilter = False
 
 def main():
-    st.session_state.map = Map() # 地图类实例化
-    llm = ModelBack(api_key=st.session_state.api_key, model_type=st.session_state.model_type) # 模型初始化
-    rag = RAG(api_key=st.session_state.api_key, model_type=st.session_state.model_type) # RAG模型初始化
+    llm = get_model_back(api_key=st.session_state.api_key, model_type=st.session_state.model_type) # 模型初始化(进程内共享)
+    rag = get_rag(api_key=st.session_state.api_key, model_type=st.session_state.model_type) # RAG模型初始化(进程内共享)
+    registry = get_registry()
+    registry.evict_idle(MODEL_IDLE_TTL)
+    # 本次运行(包括长时间的抽取和对话)期间持有租约，其他会话重跑时的闲置清理不会关闭正在使用的模型
+    with registry.lease(llm), registry.lease(rag):
+        render(llm, rag)
+
+def render(llm, rag):
+    st.session_state.map = Map(render_mode=MAP_RENDER_MODE) # 地图类实例化
     # 地图布局
     st.title("AI-MapBook")
 
@@ -198,12 +278,16 @@ def main():
             st.session_state.api_key = st.sidebar.text_input("请输入deepseek_key", value=st.session_state.api_key, key="api_key_input")
 
 
-        st.session_state.geocode_type = st.sidebar.selectbox("地理编码类型", ["free", "baidu"], index=0)
+        st.session_state.extract_mode = st.sidebar.selectbox("事件抽取模式(single为单次调用抽取)", ["single", "split"], index=0)
+
+        st.session_state.geocode_type = st.sidebar.selectbox("地理编码类型", ["free", "baidu", "offline"], index=0)
         if st.session_state.geocode_type == "baidu":
             st.session_state.baidu_key = st.sidebar.text_input("百度地图API", value=st.session_state.baidu_key, key="baidu_key_input")
         else:
             st.session_state.username = st.sidebar.text_input("请输入用户名", value=st.session_state.username, key="username_input")
 
+        with st.sidebar.expander("已加载模型"):
+            st.dataframe(get_registry().stats())
 
     with tab2:
         st.markdown(
@@ -269,8 +353,7 @@ def main():
                     selected_tile = tiles_options[selected_tile_name]
                     m.init_map(selected_tile=selected_tile)
                     update_map(m)
-                    m.add_polyline()
-                    m.display()
+                    m.display(key=MAP_KEY)
 
         with row2:
             # 创建一个容器来存放聊天记录
@@ -289,6 +372,13 @@ def main():
                 # 添加多选框
                 # 添加复选框分组
                 st.checkbox("RAG", value=st.session_state.isRAG, help="启用RAG功能", key="RAG_checkbox", on_change=lambda: toggle_isRAG())
+                st.checkbox("地图范围", value=st.session_state.isGeoFilter, help="RAG只检索地图范围内的事件及提到这些地点的原文",
+                            key="geo_checkbox", on_change=lambda: toggle_isGeoFilter())
+                geo_place, geo_radius = "", 0
+                if st.session_state.isGeoFilter:
+                    geo_cols = st.columns([3, 1])
+                    geo_place = geo_cols[0].text_input("地点(留空则使用当前地图视野)", key="geo_place")
+                    geo_radius = geo_cols[1].number_input("半径(km)", min_value=1, value=200, key="geo_radius")
                 # st.checkbox("智能地图", value=st.session_state.isSmartMap, help="启用智能地图功能", key="smartMap_checkbox", on_change=lambda: toggle_isSmartMap())
 
                 prompt = st.chat_input("你想聊点什么?")
@@ -298,7 +388,25 @@ def main():
                     with st.chat_message("user"):
                         st.markdown(prompt)
                     if st.session_state.isRAG and st.session_state.RAGed:
-                        query = rag.query_index(prompt)
+                        bbox, center = map_view_bbox(), None
+                        if geo_place:
+                            geocode_utils = GeocodeUtils(api_type=st.session_state.geocode_type, baidu_key=st.session_state.baidu_key, user_agent=st.session_state.username)
+                            location = geocode_utils.geocode(geo_place)
+                            if "latitude" in location:
+                                center = (location["latitude"], location["longitude"])
+                            else:
+                                st.warning(f"未找到地点 {geo_place}，改用当前地图视野")
+                        if st.session_state.isGeoFilter and st.session_state.geo_info_list and (center or bbox):
+                            # 先按空间范围筛选事件，再在提到这些地点的原文中检索
+                            upload = get_upload_store().get(st.session_state.upload_sha) if st.session_state.upload_sha else None
+                            file_path = upload["file_path"] if upload else None
+                            if center:
+                                query = rag.query_geo(prompt, get_spatial_index(), center=center, radius_km=geo_radius,
+                                                      file_path=file_path)
+                            else:
+                                query = rag.query_geo(prompt, get_spatial_index(), bbox=bbox, file_path=file_path)
+                        else:
+                            query = rag.query_index(prompt)
                         prompt = f'''
                             辅助信息：{query};
                             ___________________
@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.vector_store import build_faiss_index, set_search_params, IncrementalFaissVectorStore
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """
+    生成带聚类结构的归一化向量，近似真实文本向量的分布
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.normal(size=(n, dim)).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def embed_corpus(data_dir: str, model_name: str) -> np.ndarray:
+    """
+    用 bge 向量模型对数据目录中的文档分块后计算向量
+    """
+    from llama_index.core import SimpleDirectoryReader
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    documents = SimpleDirectoryReader(data_dir).load_data()
+    nodes = SentenceSplitter().get_nodes_from_documents(documents)
+    embed_model = HuggingFaceEmbedding(model_name=model_name)
+    vectors = np.array(embed_model.get_text_embedding_batch([n.get_content() for n in nodes]), dtype="float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def make_queries(corpus: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    # 在语料向量上加噪声作为查询，避免查询与某个向量完全重合
+    rng = np.random.default_rng(seed)
+    queries = corpus[rng.integers(0, len(corpus), n)] + 0.1 * rng.normal(size=(n, corpus.shape[1])).astype("float32")
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def evaluate(index, queries: np.ndarray, ground_truth: np.ndarray, k: int) -> dict:
+    timings = []
+    hits = 0
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        timings.append(time.perf_counter() - start)
+        hits += len(set(ids[0].tolist()) & set(ground_truth[i].tolist()))
+    timings = np.array(timings) * 1000
+    return {"recall": hits / ground_truth.size, "mean_ms": timings.mean(), "p95_ms": np.percentile(timings, 95)}
+
+
+def grow(corpus: np.ndarray, index_type: str, batch: int, retrain_factor) -> tuple:
+    """
+    按批增量写入 IncrementalFaissVectorStore，模拟语料随上传逐步增长，返回 (存储, 写入总耗时)
+    """
+    from llama_index.core.schema import TextNode
+    store = IncrementalFaissVectorStore.create(corpus.shape[1], {"index_type": index_type,
+                                                                 "retrain_factor": retrain_factor})
+    start = time.perf_counter()
+    for offset in range(0, len(corpus), batch):
+        store.add([TextNode(text="", id_=str(offset + i), embedding=vector.tolist())
+                   for i, vector in enumerate(corpus[offset:offset + batch])])
+    return store, time.perf_counter() - start
+
+
+def growth_report(corpus: np.ndarray, queries: np.ndarray, k: int, batch: int, nprobe: int):
+    """
+    增量写入后是否按语料增长重新训练 IVF 的召回率/延迟对比；向量 ID 即语料中的位置
+    """
+    exact = build_faiss_index("flat", corpus.shape[1])
+    exact.add(corpus)
+    _, ground_truth = exact.search(queries, k)
+    print(f"增量写入(每批 {batch} 个向量)，nprobe={nprobe}")
+    print(f"{'索引':<10}{'重新训练':<10}{'nlist':>8}{'写入(s)':>10}{'召回率':>10}{'平均(ms)':>10}{'P95(ms)':>10}")
+    for index_type in ("ivf_flat", "ivf_pq"):
+        for retrain_factor in (None, 4):
+            store, add_time = grow(corpus, index_type, batch, retrain_factor)
+            index = store._faiss_index
+            set_search_params(index, nprobe=nprobe)
+            result = evaluate(index, queries, ground_truth, k)
+            label = f"x{retrain_factor}" if retrain_factor else "否"
+            print(f"{index_type:<10}{label:<10}{getattr(index, 'nlist', 0):>8}{add_time:>10.2f}"
+                  f"{result['recall']:>10.3f}{result['mean_ms']:>10.3f}{result['p95_ms']:>10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="FAISS 索引类型的召回率/延迟对比(以 Flat 精确检索为基准)")
+    parser.add_argument("--data", default=None, help="用 bge 模型对该目录的文档计算向量；不指定时使用合成向量")
+    parser.add_argument("--model", default="models/AI-ModelScope/bge-small-zh-v1___5")
+    parser.add_argument("--synthetic", type=int, default=100000, help="合成向量数")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", default="1,4,16,64")
+    parser.add_argument("--ef-search", default="16,64,256")
+    parser.add_argument("--growth", type=int, default=0,
+                        help="大于 0 时改为按该批大小增量写入，对比 IVF 是否随语料增长重新训练")
+    args = parser.parse_args()
+
+    corpus = embed_corpus(args.data, args.model) if args.data else synthetic_corpus(args.synthetic, args.dim)
+    queries = make_queries(corpus, args.queries)
+    n, dim = corpus.shape
+    print(f"向量数: {n}，维度: {dim}，查询数: {len(queries)}，k={args.k}")
+    if args.growth:
+        growth_report(corpus, queries, args.k, args.growth, int(args.nprobe.split(",")[-1]))
+        sys.exit()
+
+    configs = [("flat", {})]
+    configs += [("ivf_flat", {"nprobe": int(p)}) for p in args.nprobe.split(",")]
+    configs += [("ivf_pq", {"nprobe": int(p)}) for p in args.nprobe.split(",")]
+    configs += [("hnsw", {"ef_search": int(e)}) for e in args.ef_search.split(",")]
+
+    built = {}
+    ground_truth = None
+    print(f"{'索引':<10}{'参数':<16}{'构建(s)':>10}{'大小(MB)':>10}{'召回率':>10}{'平均(ms)':>10}{'P95(ms)':>10}")
+    for index_type, params in configs:
+        if index_type not in built:
+            if index_type == "ivf_pq" and n < 256 * 39:
+                print(f"{index_type:<10}向量数不足 {256 * 39}，跳过")
+                built[index_type] = None
+                continue
+            start = time.perf_counter()
+            index = build_faiss_index(index_type, dim, n_vectors=n)
+            index.train(corpus)
+            index.add(corpus)
+            built[index_type] = (index, time.perf_counter() - start, faiss.serialize_index(index).nbytes)
+        if built[index_type] is None:
+            continue
+        index, build_time, size = built[index_type]
+        set_search_params(index, **params)
+        if ground_truth is None:
+            _, ground_truth = index.search(queries, args.k)
+        result = evaluate(index, queries, ground_truth, args.k)
+        label = ",".join(f"{key}={value}" for key, value in params.items()) or "-"
+        print(f"{index_type:<10}{label:<16}{build_time:>10.2f}{size / 1024 / 1024:>10.1f}"
+              f"{result['recall']:>10.3f}{result['mean_ms']:>10.3f}{result['p95_ms']:>10.3f}")
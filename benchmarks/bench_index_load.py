@@ -0,0 +1,101 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import multiprocessing
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.model_registry import current_rss
+
+
+def build(persist_dir: str, layout: str, n: int, dim: int, text_len: int):
+    """
+    用合成节点构建索引并按指定格式持久化：legacy 为原先的 JSON 文档库 + FaissVectorStore，
+    binary 为 SQLite 文档库 + IncrementalFaissVectorStore
+    """
+    import faiss
+    from llama_index.core import StorageContext, VectorStoreIndex
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.schema import TextNode
+    from utils.vector_store import IncrementalFaissVectorStore
+    from utils.kv_store import SqliteKVStore, SqliteDocumentStore, SqliteIndexStore
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, dim)).astype("float32")
+    text = "某年某月，主人公从长安出发，经洛阳抵达汴京。" * (text_len // 22 + 1)
+    nodes = [TextNode(text=f"{i} {text[:text_len]}", embedding=vectors[i].tolist()) for i in range(n)]
+    if layout == "legacy":
+        from llama_index.vector_stores.faiss import FaissVectorStore
+        storage_context = StorageContext.from_defaults(vector_store=FaissVectorStore(faiss.IndexFlatL2(dim)))
+    else:
+        kvstore = SqliteKVStore(os.path.join(persist_dir, "index_store.sqlite"))
+        storage_context = StorageContext.from_defaults(vector_store=IncrementalFaissVectorStore.create(dim),
+                                                       docstore=SqliteDocumentStore(kvstore),
+                                                       index_store=SqliteIndexStore(kvstore))
+    index = VectorStoreIndex(nodes, storage_context=storage_context, embed_model=MockEmbedding(embed_dim=dim))
+    index.storage_context.persist(persist_dir=persist_dir)
+
+
+def load_and_query(persist_dir: str, layout: str, dim: int, queue):
+    from llama_index.core import StorageContext, Settings, load_index_from_storage
+    from llama_index.core.embeddings import MockEmbedding
+    from utils.vector_store import IncrementalFaissVectorStore
+    from utils.kv_store import SqliteKVStore, SqliteDocumentStore, SqliteIndexStore
+
+    # 默认分词器(tiktoken)在进程内只加载一次，与索引格式和大小无关，不计入加载耗时
+    Settings.node_parser
+    rss_before = current_rss()
+    start = time.perf_counter()
+    if layout == "legacy":
+        from llama_index.vector_stores.faiss import FaissVectorStore
+        storage_context = StorageContext.from_defaults(
+            vector_store=FaissVectorStore.from_persist_dir(persist_dir), persist_dir=persist_dir)
+    else:
+        kvstore = SqliteKVStore(os.path.join(persist_dir, "index_store.sqlite"), read_only=True)
+        storage_context = StorageContext.from_defaults(
+            vector_store=IncrementalFaissVectorStore.from_persist_dir(persist_dir, mmap=True),
+            docstore=SqliteDocumentStore(kvstore), index_store=SqliteIndexStore(kvstore))
+    index = load_index_from_storage(storage_context=storage_context, embed_model=MockEmbedding(embed_dim=dim))
+    load_time = time.perf_counter() - start
+    rss_loaded = current_rss() - rss_before
+    start = time.perf_counter()
+    index.as_retriever(similarity_top_k=5).retrieve("主人公去了哪里")
+    queue.put((load_time, rss_loaded, time.perf_counter() - start))
+
+
+def disk_size(persist_dir: str) -> int:
+    return sum(os.path.getsize(os.path.join(persist_dir, name)) for name in os.listdir(persist_dir))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="索引冷启动对比：JSON 文档库 vs SQLite 文档库 + 内存映射 FAISS")
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--text-len", type=int, default=500, help="每个节点的文本字符数")
+    parser.add_argument("--dir", default="./storage/bench_index_load")
+    args = parser.parse_args()
+
+    # 每次加载都在新进程中进行，避免页缓存以外的状态影响结果
+    context = multiprocessing.get_context("spawn")
+    print(f"节点数: {args.nodes}，维度: {args.dim}，文本长度: {args.text_len}")
+    print(f"{'格式':<10}{'构建(s)':>10}{'磁盘(MB)':>10}{'加载(s)':>10}{'内存(MB)':>10}{'首次查询(ms)':>14}")
+    for layout in ("legacy", "binary"):
+        persist_dir = os.path.join(args.dir, layout)
+        shutil.rmtree(persist_dir, ignore_errors=True)
+        os.makedirs(persist_dir)
+        start = time.perf_counter()
+        process = context.Process(target=build, args=(persist_dir, layout, args.nodes, args.dim, args.text_len))
+        process.start()
+        process.join()
+        build_time = time.perf_counter() - start
+        queue = context.Queue()
+        process = context.Process(target=load_and_query, args=(persist_dir, layout, args.dim, queue))
+        process.start()
+        load_time, rss, query_time = queue.get()
+        process.join()
+        print(f"{layout:<10}{build_time:>10.1f}{disk_size(persist_dir) / 1024 / 1024:>10.1f}"
+              f"{load_time:>10.2f}{rss / 1024 / 1024:>10.1f}{query_time * 1000:>14.1f}")
+    shutil.rmtree(args.dir, ignore_errors=True)
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.map import Map, RENDER_MODES
+
+
+def synthetic_events(n: int, seed: int = 0) -> list:
+    """
+    生成 n 个分布在中国范围内的合成事件，字段与抽取结果一致
+    """
+    rng = np.random.default_rng(seed)
+    latitudes = rng.uniform(20, 50, n)
+    longitudes = rng.uniform(90, 130, n)
+    content = "某年某月，主人公从长安出发，经洛阳抵达汴京，沿途拜访故友。"
+    return [{"event_title": f"事件{i}", "event_type": "旅行", "event_content": content, "keys": ["长安", "洛阳"],
+             "geocode": {"latitude": float(latitudes[i]), "longitude": float(longitudes[i])}}
+            for i in range(n)]
+
+
+def render(events: list, mode: str):
+    """
+    按指定方式添加全部事件和路线，返回 (构建耗时, 生成 HTML 耗时, HTML 字节数)
+    """
+    start = time.perf_counter()
+    m = Map(render_mode=mode)
+    m.init_map("OpenStreetMap")
+    for info in events:
+        m.add_marker(info, info["geocode"])
+    m.add_polyline()
+    # st_folium 中事件图层单独传入，这里直接加到地图上一起输出
+    m.events_layer.add_to(m.map)
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    html = m.map.get_root().render()
+    return build_time, time.perf_counter() - start, len(html.encode("utf-8"))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="地图渲染对比：逐个标记 vs GeoJSON 图层 + 浏览器端聚合")
+    parser.add_argument("--events", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--modes", nargs="+", default=list(RENDER_MODES), choices=RENDER_MODES)
+    args = parser.parse_args()
+
+    # 只统计服务端生成和传输的部分；浏览器中的解析和绘制耗时与 HTML/JS 体积大致成正比
+    print(f"{'事件数':>8}{'方式':>10}{'构建(s)':>10}{'生成HTML(s)':>14}{'体积(MB)':>10}{'每事件(B)':>12}")
+    for n in args.events:
+        events = synthetic_events(n)
+        for mode in args.modes:
+            build_time, render_time, size = render(events, mode)
+            print(f"{n:>8}{mode:>10}{build_time:>10.2f}{render_time:>14.2f}{size / 1024 / 1024:>10.1f}{size / n:>12.0f}")
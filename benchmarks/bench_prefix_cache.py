@@ -0,0 +1,57 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.model_back import ModelBack, PROCESS_EVENT_PROMPT
+
+
+def load_events(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [p.strip() for p in f.read().split("\n\n") if p.strip()]
+
+
+def time_to_first_token(llm: ModelBack, events: list, language: str, use_prefix: bool) -> list:
+    """
+    以 max_new_tokens=1 的生成耗时近似首 token 延迟(即预填充耗时)
+    """
+    llm.prefix_cache_size = 8 if use_prefix else 0
+    prefix = ModelBack.template_prefix(PROCESS_EVENT_PROMPT, "event_text", language=language)
+    timings = []
+    for event in events:
+        prompt = PROCESS_EVENT_PROMPT.format(event_text=event, language=language)
+        start = time.perf_counter()
+        llm.ipex_llm_generate(prompt, max_new_tokens=1, prefix=prefix if use_prefix else None)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="process_event 提示词前缀 KV 缓存的首 token 延迟对比")
+    parser.add_argument("--data", default="data/test.txt")
+    parser.add_argument("--model-path", default="models/qwen2chat_int4")
+    parser.add_argument("--language", default="英文")
+    # 与应用默认配置一致(utils.model_registry.get_model_back)：请求经动态批处理提交，
+    # 逐个到达的请求单独成批，走前缀缓存路径
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("IPEX_BATCH_SIZE", "4")))
+    args = parser.parse_args()
+
+    llm = ModelBack(model_type="ipex_llm", model_path=args.model_path, cache_responses=False,
+                    batch_size=args.batch_size)
+    events = load_events(args.data)
+    prefix_tokens = llm.count_tokens(ModelBack.template_prefix(PROCESS_EVENT_PROMPT, "event_text", language=args.language))
+    print(f"事件数: {len(events)}，静态前缀 token 数: {prefix_tokens}，批大小: {args.batch_size}")
+
+    # 预热，避免首次调用的初始化开销计入结果
+    llm.ipex_llm_generate("你好", max_new_tokens=1)
+    baseline = time_to_first_token(llm, events, args.language, use_prefix=False)
+    # 第一次调用负责计算前缀 KV，单独统计
+    cached = time_to_first_token(llm, events, args.language, use_prefix=True)
+
+    print(f"{'':<10}{'平均(s)':>10}{'最小(s)':>10}{'最大(s)':>10}")
+    for name, timings in (("无前缀缓存", baseline), ("前缀缓存", cached[1:] or cached)):
+        print(f"{name:<10}{sum(timings) / len(timings):>10.3f}{min(timings):>10.3f}{max(timings):>10.3f}")
+    print(f"前缀 KV 首次计算耗时: {cached[0]:.3f}s")
+    print(f"平均首 token 延迟加速: {(sum(baseline) / len(baseline)) / (sum(cached[1:] or cached) / len(cached[1:] or cached)):.2f}x")
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.model_back import ModelBack, PROCESS_EVENT_PROMPT
+
+
+def load_events(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [p.strip() for p in f.read().split("\n\n") if p.strip()]
+
+
+def run(llm: ModelBack, prompts: list, max_new_tokens: int, speculative: bool):
+    llm.speculative = speculative
+    outputs, tokens, elapsed = [], 0, 0.0
+    for prompt in prompts:
+        start = time.perf_counter()
+        response = llm.ipex_llm_generate(prompt, max_new_tokens=max_new_tokens)
+        elapsed += time.perf_counter() - start
+        tokens += llm.count_tokens(response)
+        outputs.append(response)
+    return outputs, tokens, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="process_event 的提示词查找投机解码速度对比")
+    parser.add_argument("--data", default="data/test.txt")
+    parser.add_argument("--model-path", default="models/qwen2chat_int4")
+    parser.add_argument("--max-new-tokens", type=int, default=512)
+    parser.add_argument("--language", default="英文")
+    args = parser.parse_args()
+
+    # 关闭响应缓存和前缀缓存，只比较解码本身
+    llm = ModelBack(model_type="ipex_llm", model_path=args.model_path, cache_responses=False)
+    llm.prefix_cache_size = 0
+    prompts = [PROCESS_EVENT_PROMPT.format(event_text=e, language=args.language) for e in load_events(args.data)]
+    llm.ipex_llm_generate("你好", max_new_tokens=1)
+
+    greedy_out, greedy_tokens, greedy_time = run(llm, prompts, args.max_new_tokens, speculative=False)
+    spec_out, spec_tokens, spec_time = run(llm, prompts, args.max_new_tokens, speculative=True)
+
+    stats = llm.speculative_stats
+    mismatches = sum(a != b for a, b in zip(greedy_out, spec_out))
+    print(f"提示词数: {len(prompts)}")
+    print(f"贪心解码:     {greedy_tokens} tokens, {greedy_time:.1f}s, {greedy_tokens / greedy_time:.2f} tokens/s")
+    print(f"投机解码:     {spec_tokens} tokens, {spec_time:.1f}s, {spec_tokens / spec_time:.2f} tokens/s")
+    print(f"加速比: {greedy_time / spec_time:.2f}x，输出不一致: {mismatches}/{len(prompts)}")
+    if stats.get("drafted"):
+        print(f"草稿接受率: {stats['accepted'] / stats['drafted']:.1%}，"
+              f"平均每次前向生成 {stats['tokens'] / stats['forwards']:.2f} tokens")
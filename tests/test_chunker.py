@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from utils.chunker import TokenChunker, text_anchors
+
+SENTENCES = ["天宝三年春，李白离开长安。", "他经洛阳东行，与杜甫相识！", "二人同游梁宋，又遇高适；",
+             "秋天到达齐州。", "He wrote many poems on the road. ", "次年各自南北……\n", "“此去何时见也？”他问道。"]
+
+
+def _text(n, seed=0):
+    rng = random.Random(seed)
+    return "".join(rng.choice(SENTENCES) for _ in range(n))
+
+
+def _pages(text, seed=0):
+    # 在任意位置切成若干页，包括句子中间
+    rng = random.Random(seed)
+    cuts = sorted(rng.sample(range(1, len(text)), 20))
+    return [text[i:j] for i, j in zip([0] + cuts, cuts + [len(text)])]
+
+
+def test_chunks_respect_budget_and_keep_all_text():
+    text = _text(200)
+    chunker = TokenChunker(len, max_tokens=120)
+    chunks = list(chunker.chunk([text]))
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_incremental_feed_matches_single_input():
+    text = _text(200)
+    whole = list(TokenChunker(len, max_tokens=150).chunk([text]))
+    paged = list(TokenChunker(len, max_tokens=150).chunk(_pages(text)))
+    assert paged == whole
+
+
+def test_chunks_end_on_sentence_boundaries():
+    chunks = list(TokenChunker(len, max_tokens=100).chunk([_text(100)]))
+    for chunk in chunks[:-1]:
+        assert chunk.rstrip(" \n")[-1] in "。！？；.…”"
+
+
+def test_overlap_repeats_tail_sentences():
+    text = _text(200, seed=1)
+    chunker = TokenChunker(len, max_tokens=120, overlap_tokens=40)
+    chunks = list(chunker.chunk([text]))
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        overlap = max(n for n in range(0, 41) if previous.endswith(current[:n]))
+        assert 0 < overlap <= 40
+    # 去掉重叠部分后仍是原文
+    rebuilt = chunks[0]
+    for previous, current in zip(chunks, chunks[1:]):
+        overlap = max(n for n in range(0, 41) if previous.endswith(current[:n]))
+        rebuilt += current[overlap:]
+    assert rebuilt == text
+
+
+def test_last_chunk_is_not_only_overlap():
+    text = "".join(f"第{i}句话写在这里。" for i in range(10))
+    chunks = list(TokenChunker(len, max_tokens=30, overlap_tokens=20).chunk([text]))
+    assert chunks[-1].endswith("第9句话写在这里。")
+    assert chunks[-1] not in chunks[-2]
+
+
+def test_long_sentence_is_hard_split():
+    text = "长" * 1000 + "。"
+    chunks = list(TokenChunker(len, max_tokens=100).chunk([text]))
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_overlap_must_be_smaller_than_budget():
+    with pytest.raises(ValueError):
+        TokenChunker(len, max_tokens=100, overlap_tokens=100)
+
+
+def test_report_counts_saved_calls():
+    chunker = TokenChunker(len, max_tokens=500)
+    list(chunker.chunk(_pages(_text(100))))
+    report = chunker.report()
+    assert report["inputs"] == 21
+    assert report["saved_calls"] == report["inputs"] - report["chunks"]
+
+
+def test_text_anchors_are_verbatim_and_bounded():
+    text = _text(2000)
+    anchors = text_anchors(text)
+    assert 0 < len(anchors) <= 33
+    for anchor in anchors:
+        assert len(anchor) == 16 and anchor in text
+        assert not any(ch.isspace() or ch in '"\\' for ch in anchor)
+    assert text_anchors("短文本") == []
+
+
+def test_text_anchors_hit_every_overlapping_node():
+    rng = random.Random(2)
+    text = "".join(rng.choice("甲乙丙丁戊己庚辛壬癸子丑寅卯辰巳午未申酉戌亥") for _ in range(3000))
+    anchors = text_anchors(text, step=200)
+    # 以另一种方式切分，与文本有 step+16 个字符以上重合的节点至少包含一个锚点
+    for start in range(0, len(text) - 216, 37):
+        node = text[start:start + 216]
+        assert any(anchor in node for anchor in anchors)
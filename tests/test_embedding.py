@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from utils.embedding import CachedEmbedding, EmbeddingCache, model_revision
+
+
+class RecordingEmbedding(BaseEmbedding):
+    """
+    向量为 [文本长度, 首字符编码]，记录每次送入模型的批
+    """
+
+    _batches: list = PrivateAttr(default_factory=list)
+    _lock: object = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(model_name="fake", **kwargs)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def vector(text):
+        return [float(len(text)), float(ord(text[0]))]
+
+    def _get_query_embedding(self, query):
+        with self._lock:
+            self._batches.append(("query", [query]))
+        return self.vector(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        with self._lock:
+            self._batches.append(("text", list(texts)))
+        return [self.vector(text) for text in texts]
+
+
+TEXTS = ["长安" * n for n in (9, 1, 5, 3, 7, 2, 8, 4, 6, 10)]
+
+
+def _embedding(tmp_path, **kwargs):
+    model_dir = tmp_path / "bge"
+    model_dir.mkdir(exist_ok=True)
+    (model_dir / "config.json").write_text("{}", encoding="utf-8")
+    inner = RecordingEmbedding()
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    return CachedEmbedding(inner, str(model_dir), cache=cache, **kwargs), inner
+
+
+def test_batches_are_length_sorted_and_results_keep_input_order(tmp_path):
+    embedding, inner = _embedding(tmp_path, batch_size=4)
+    assert embedding.get_text_embedding_batch(TEXTS) == [RecordingEmbedding.vector(t) for t in TEXTS]
+    lengths = [[len(t) for t in batch] for _, batch in inner._batches]
+    assert lengths == [[2, 4, 6, 8], [10, 12, 14, 16], [18, 20]]
+    assert embedding.report() == {"texts": 10, "cache_hits": 0, "embedded": 10, "batches": 3}
+
+
+def test_cached_and_duplicate_texts_are_not_embedded_again(tmp_path):
+    embedding, inner = _embedding(tmp_path, batch_size=4)
+    embedding.get_text_embedding_batch(TEXTS[:5] + TEXTS[:2])
+    assert sum(len(batch) for _, batch in inner._batches) == 5
+    # 新实例(如重启后)从持久化缓存读取
+    embedding, inner = _embedding(tmp_path, batch_size=4)
+    assert embedding.get_text_embedding_batch(TEXTS) == [RecordingEmbedding.vector(t) for t in TEXTS]
+    assert sorted(t for _, batch in inner._batches for t in batch) == sorted(TEXTS[5:])
+    # 问题向量与文本向量分开缓存
+    embedding.get_query_embedding(TEXTS[0])
+    embedding.get_query_embedding(TEXTS[0])
+    assert [kind for kind, _ in inner._batches].count("query") == 1
+
+
+def test_model_files_changing_invalidates_the_cache(tmp_path):
+    embedding, _ = _embedding(tmp_path)
+    revision = embedding.revision
+    assert revision == model_revision(str(tmp_path / "bge"))
+    (tmp_path / "bge" / "model.safetensors").write_bytes(b"new weights")
+    embedding, _ = _embedding(tmp_path)
+    assert embedding.revision != revision
+    assert model_revision("BAAI/bge-small-zh") == "BAAI/bge-small-zh"
+
+
+def test_thread_pool_gives_the_same_results(tmp_path):
+    embedding, inner = _embedding(tmp_path, batch_size=2, workers=4)
+    try:
+        assert embedding.get_text_embedding_batch(TEXTS) == [RecordingEmbedding.vector(t) for t in TEXTS]
+        assert len(inner._batches) == 5
+    finally:
+        embedding.close()
+    with pytest.raises(ValueError):
+        _embedding(tmp_path, pool="gpu")
+
+
+def test_cache_lookups_are_batched_past_the_parameter_limit(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    items = {f"{i:064x}": [float(i)] for i in range(1200)}
+    cache.put_many("m", "text", items)
+    assert cache.get_many("m", "text", list(items)) == items
+    assert cache.get_many("other", "text", list(items)[:3]) == {}
+    assert cache.count("m") == 1200 and cache.count() == 1200
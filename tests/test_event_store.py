@@ -0,0 +1,59 @@
+import json
+import threading
+
+import pytest
+
+from utils.event_store import EventStore
+
+
+def _event(i, event_type="旅行"):
+    return {"event_title": f"事件{i}", "event_type": event_type, "create_time": f"2024-01-{i % 28 + 1:02d}",
+            "event_content": "第一行\n第二行"}
+
+
+def test_filters_paging_and_iteration(tmp_path):
+    store = EventStore(str(tmp_path / "events.sqlite"))
+    store.append_many([_event(i, "旅行" if i % 2 else "战争") for i in range(10)], document="book-a")
+    store.append(_event(10), document="book-b")
+    assert store.count() == 11
+    assert store.count(document="book-a", event_type="旅行") == 5
+    assert [e["event_title"] for e in store.page(1, 3, document="book-a")] == ["事件3", "事件4", "事件5"]
+    assert store.page(0, 2, order_by="create_time")[0]["create_time"] == "2024-01-01"
+    assert [e["event_title"] for e in store.iter_events(event_type="旅行", batch_size=2)] == [
+        f"事件{i}" for i in (1, 3, 5, 7, 9, 10)]
+    with pytest.raises(ValueError):
+        store.page(order_by="data; DROP TABLE events")
+
+
+def test_concurrent_appends_are_all_kept(tmp_path):
+    path = str(tmp_path / "events.sqlite")
+    EventStore(path)
+
+    def writer(n):
+        # 每个线程(会话)各自打开存储
+        store = EventStore(path)
+        for i in range(25):
+            store.append(_event(n * 100 + i), document=f"book-{n}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store = EventStore(path)
+    assert store.count() == 100
+    assert all(store.count(document=f"book-{n}") == 25 for n in range(4))
+
+
+def test_migrate_and_export_round_trip(tmp_path):
+    legacy = tmp_path / "event_list.json"
+    events = [_event(i) for i in range(3)]
+    legacy.write_text(json.dumps(events, ensure_ascii=False), encoding="utf-8")
+    store = EventStore(str(tmp_path / "events.sqlite"))
+    assert store.migrate_json(str(legacy)) == 3
+    # 已导入过的文件不重复导入
+    assert store.migrate_json(str(legacy)) == 0
+    assert store.migrate_json(str(tmp_path / "missing.json")) == 0
+    exported = tmp_path / "export.json"
+    store.export_json(str(exported))
+    assert json.loads(exported.read_text(encoding="utf-8")) == events
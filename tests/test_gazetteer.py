@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from utils.gazetteer import Gazetteer
+from utils.geocode_utils import GeocodeUtils
+
+# GeoNames 主表的一行：id、名称、ASCII 名、别名、纬度、经度 …… 国家(第 8 列)…… 人口(第 14 列)
+PLACES = [
+    ("1", "Xi'an", "Xi'an", "Chang'an,西安,长安", 34.25833, 108.92861, "CN", 12000000),
+    ("2", "Luoyang", "Luoyang", "洛阳,Loyang", 34.68361, 112.45361, "CN", 6000000),
+    ("3", "Chengdu", "Chengdu", "成都", 30.66667, 104.06667, "CN", 16000000),
+    ("4", "Chang'an", "Chang'an", "", 22.8, 113.8, "CN", 1000),
+    ("5", "São Paulo", "Sao Paulo", "", -23.5475, -46.63611, "BR", 12000000),
+]
+ALIASES = [("100", "2", "zh", "東都"), ("101", "3", "fr", "Chengtou")]
+
+
+def _write_tsv(path):
+    with open(path, "w", encoding="utf-8") as f:
+        for gid, name, ascii_name, alt, lat, lon, country, population in PLACES:
+            cols = [gid, name, ascii_name, alt, str(lat), str(lon), "P", "PPLA", country] + [""] * 5 + [str(population)]
+            f.write("\t".join(cols) + "\n")
+        f.write("broken line\n")
+
+
+@pytest.fixture
+def source(tmp_path):
+    tsv = tmp_path / "cities.txt"
+    _write_tsv(tsv)
+    aliases = tmp_path / "alternateNames.txt"
+    aliases.write_text("".join("\t".join(row) + "\n" for row in ALIASES), encoding="utf-8")
+    return str(tsv), str(aliases)
+
+
+@pytest.fixture
+def gazetteer(source, tmp_path):
+    return Gazetteer.build(source[0], str(tmp_path / "index"), alias_path=source[1])
+
+
+def test_lookup_matches_names_and_aliases(gazetteer):
+    assert len(gazetteer) == 5
+    assert gazetteer.lookup("西安")["address"] == "Xi'an, CN"
+    assert gazetteer.lookup("  LUOYANG ")["address"] == "Luoyang, CN"
+    assert gazetteer.lookup("東都")["address"] == "Luoyang, CN"
+    assert gazetteer.lookup("Sao Paulo")["address"] == "São Paulo, BR"
+    # 只导入指定语言的别名
+    assert gazetteer.lookup("Chengtou") is None
+    assert gazetteer.lookup("不存在") is None
+
+
+def test_same_name_prefers_larger_population(gazetteer):
+    assert gazetteer.lookup("Chang'an")["population"] == 12000000
+    assert [p["address"] for p in gazetteer.prefix("chang")] == ["Xi'an, CN", "Chang'an, CN"]
+
+
+def test_geocode_tries_comma_separated_parts(gazetteer):
+    assert gazetteer.geocode("Longmen Grottoes, Luoyang, China")["address"] == "Luoyang, CN"
+    assert gazetteer.geocode("Nowhere, Atlantis") is None
+
+
+def test_nearest_respects_max_distance(gazetteer):
+    place = gazetteer.nearest(34.3, 108.9)
+    assert place["address"] == "Xi'an, CN" and place["distance_km"] < 10
+    assert gazetteer.nearest(0, 0, max_distance_km=100) is None
+
+
+def test_open_or_build_reuses_index_until_source_changes(source, tmp_path):
+    index_dir = str(tmp_path / "index")
+    Gazetteer.build(source[0], index_dir)
+    stamp = os.path.getmtime(os.path.join(index_dir, "meta.json"))
+    assert len(Gazetteer.open_or_build(source[0], index_dir)) == 5
+    assert os.path.getmtime(os.path.join(index_dir, "meta.json")) == stamp
+    with open(source[0], "a", encoding="utf-8") as f:
+        f.write("\t".join(["6", "Kaifeng", "Kaifeng", "汴京", "34.79", "114.35", "P", "PPLA", "CN"]
+                          + [""] * 5 + ["5000000"]) + "\n")
+    os.utime(source[0], (stamp + 10, stamp + 10))
+    assert Gazetteer.open_or_build(source[0], index_dir).lookup("汴京")["address"] == "Kaifeng, CN"
+    # 源文件缺失时沿用已有索引
+    os.remove(source[0])
+    assert len(Gazetteer.open_or_build(source[0], index_dir)) == 6
+    with pytest.raises(FileNotFoundError):
+        Gazetteer.open_or_build(source[0], str(tmp_path / "other"))
+
+
+def test_offline_geocoder_uses_gazetteer_without_network(gazetteer):
+    geo = GeocodeUtils(api_type="offline", gazetteer=gazetteer, fallback_type=None)
+    assert geo.geocode("长安")["address"] == "Xi'an, CN"
+    assert geo.geocode("Atlantis") == {"error": "Address not found"}
+    assert geo.reverse_geocode(30.7, 104.1)["address"] == "Chengdu, CN"
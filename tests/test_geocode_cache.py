@@ -0,0 +1,70 @@
+import time
+from types import SimpleNamespace
+
+from geopy.exc import GeocoderTimedOut
+
+from utils.geocode_cache import GeocodeCache
+from utils.geocode_utils import GeocodeUtils
+
+
+class FakeGeolocator:
+    """
+    记录请求的服务商接口：fail 中的地址超时，missing 中的地址查不到
+    """
+
+    def __init__(self, fail=(), missing=()):
+        self.fail = set(fail)
+        self.missing = set(missing)
+        self.calls = []
+
+    def geocode(self, address, **kwargs):
+        self.calls.append(address)
+        if address in self.fail:
+            raise GeocoderTimedOut("timed out")
+        if address in self.missing:
+            return None
+        return SimpleNamespace(latitude=34.26, longitude=108.94, address=f"{address}, China")
+
+
+def _geocoder(tmp_path, **kwargs):
+    cache = GeocodeCache(str(tmp_path / "geocode_cache.sqlite"))
+    geo = GeocodeUtils(api_type="baidu", baidu_key="test", cache=cache, max_retries=0)
+    geo.geolocator = FakeGeolocator(**kwargs)
+    return geo
+
+
+def test_normalized_addresses_share_an_entry(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "geocode_cache.sqlite"))
+    cache.set("Xi'an,  China", "free", {"latitude": 34.26, "longitude": 108.94})
+    assert cache.get("ＸＩ'ＡＮ, china", "free") == {"latitude": 34.26, "longitude": 108.94}
+    # 服务商和语言不同的结果分开保存
+    assert cache.get("Xi'an, China", "baidu") is None
+    assert cache.get("Xi'an, China", "free", "zh") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.333}
+
+
+def test_negative_results_expire_sooner(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "geocode_cache.sqlite"), ttl=60, negative_ttl=0.05)
+    cache.set("长安", "free", {"latitude": 34.26, "longitude": 108.94})
+    cache.set("不存在的地方", "free", {"error": "Address not found"}, found=False)
+    time.sleep(0.1)
+    assert cache.get("不存在的地方", "free") is None
+    assert cache.get("长安", "free") is not None
+    assert cache.purge_expired() == 1
+
+
+def test_geocode_requests_each_address_once(tmp_path):
+    geo = _geocoder(tmp_path, missing=["不存在的地方"])
+    for _ in range(2):
+        assert geo.geocode("Chang'an")["latitude"] == 34.26
+        assert geo.geocode("不存在的地方") == {"error": "Address not found"}
+    assert geo.geolocator.calls == ["Chang'an", "不存在的地方"]
+    assert geo.cache_stats()["hits"] == 2
+
+
+def test_transient_errors_are_not_cached(tmp_path):
+    geo = _geocoder(tmp_path, fail=["Luoyang"])
+    assert geo.geocode("Luoyang")["retry"]
+    geo.geolocator.fail.clear()
+    assert geo.geocode("Luoyang")["latitude"] == 34.26
+    assert geo.geolocator.calls == ["Luoyang", "Luoyang"]
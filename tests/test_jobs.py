@@ -0,0 +1,59 @@
+from utils.jobs import ExtractionJob
+
+
+def _job(tmp_path, name=""):
+    return ExtractionJob("sha-signature", root=str(tmp_path), name=name)
+
+
+def test_checkpoint_is_replayed_in_narrative_order(tmp_path):
+    job = _job(tmp_path, name="李白.txt")
+    job.record_chunk(1, "split", ["c", "d"])
+    job.record_chunk(0, "split", ["a", "b"])
+    job.record_event(1, 0, {"event_title": "c"})
+    job.record_event(0, 1, {"event_title": "b"})
+    job.record_event(0, 0, {"event_title": "a"})
+
+    job = _job(tmp_path)
+    assert job.manifest["name"] == "李白.txt"
+    assert [e["event_title"] for e in job.iter_events()] == ["a", "b", "c"]
+    assert job.is_chunk_done(0) and not job.is_chunk_done(1)
+    assert job.chunk_record(1) == {"mode": "split", "units": ["c", "d"]}
+    assert job.done_events(1) == {0: {"event_title": "c"}}
+    assert job.progress() == {"total_chunks": None, "chunks_done": 1, "events_total": 4, "events_done": 3}
+
+
+def test_finish_requires_total_and_every_event(tmp_path):
+    job = _job(tmp_path)
+    job.record_chunk(0, "single", [{"event_title": "a"}])
+    job.record_event(0, 0, {"event_title": "a"})
+    # 文本块总数未知(读取未完成)时不能结束
+    assert not job.finish()
+    job.set_total(2)
+    assert not job.finish()
+    job.record_chunk(1, "split", [])
+    assert job.finish()
+    assert _job(tmp_path).done
+
+
+def test_reset_discards_events_of_an_unrecorded_chunk(tmp_path):
+    job = _job(tmp_path)
+    job.record_event(0, 0, {"event_title": "上次中断前的事件"})
+    job.reset_chunk(0)
+    job.record_chunk(0, "split", ["a"])
+    job.record_event(0, 0, {"event_title": "a"})
+    assert [e["event_title"] for e in _job(tmp_path).iter_events()] == ["a"]
+
+
+def test_partial_last_line_is_ignored(tmp_path):
+    job = _job(tmp_path)
+    job.record_chunk(0, "split", ["a", "b"])
+    job.record_event(0, 0, {"event_title": "a"})
+    with open(job.events_path, "a", encoding="utf-8") as f:
+        # 进程在写入途中退出
+        f.write('{"chunk": 0, "event": 1, "info": {"event_ti')
+    job = _job(tmp_path)
+    assert job.done_events(0) == {0: {"event_title": "a"}}
+    assert not job.is_chunk_done(0)
+    # 续跑时写入的记录不会接在残缺的行后面
+    job.record_event(0, 1, {"event_title": "b"})
+    assert _job(tmp_path).is_chunk_done(0)
@@ -0,0 +1,60 @@
+import json
+import random
+
+from utils.json_stream import JsonObjectStreamParser, iter_json_objects
+
+EVENTS = [
+    {"event_title": "离开长安", "address": "长安", "keys": ["李白", "长安"]},
+    {"event_title": "含括号 {x} 和引号 \" 的标题", "address": "洛阳\\东门", "keys": []},
+    {"event_title": "嵌套", "address": "汴京", "meta": {"year": 744, "tags": [{"a": 1}]}},
+]
+
+
+def _pieces(text, seed=0):
+    # 随机切成 1~7 个字符的片段，模拟流式输出
+    rng = random.Random(seed)
+    pieces, pos = [], 0
+    while pos < len(text):
+        size = rng.randint(1, 7)
+        pieces.append(text[pos:pos + size])
+        pos += size
+    return pieces
+
+
+def test_objects_are_emitted_as_soon_as_they_close():
+    text = json.dumps(EVENTS, ensure_ascii=False)
+    parser = JsonObjectStreamParser()
+    seen = []
+    fed = ""
+    for piece in _pieces(text):
+        fed += piece
+        for obj in parser.feed(piece):
+            seen.append(obj)
+            # 前面的对象在整个输出结束之前就已产出
+            if len(seen) < len(EVENTS):
+                assert len(fed) < len(text)
+    assert seen == EVENTS
+    assert parser.errors == 0
+
+
+def test_tolerates_code_fences_prose_and_trailing_commas():
+    text = "好的，以下是事件：\n```json\n[\n" + ",\n".join(
+        json.dumps(e, ensure_ascii=False, indent=2) for e in EVENTS) + ',\n  {"a": 1, "b": [1, 2,],},\n]\n```\n完毕'
+    assert list(iter_json_objects(_pieces(text, seed=1))) == EVENTS + [{"a": 1, "b": [1, 2]}]
+
+
+def test_truncated_last_object_is_dropped():
+    text = json.dumps(EVENTS, ensure_ascii=False)
+    truncated = text[:text.rfind('"address"')]
+    assert list(iter_json_objects(_pieces(truncated))) == EVENTS[:2]
+
+
+def test_broken_object_is_counted_and_skipped():
+    parser = JsonObjectStreamParser()
+    objects = parser.feed('[{"a": 1}, {"b": oops}, {"c": 3}]')
+    assert objects == [{"a": 1}, {"c": 3}]
+    assert parser.errors == 1
+
+
+def test_raw_newlines_inside_strings_are_accepted():
+    assert list(iter_json_objects(['{"event_content": "第一行\n第二行"}'])) == [{"event_content": "第一行\n第二行"}]
@@ -0,0 +1,72 @@
+import json
+import os
+
+from llama_index.core.schema import Document, NodeRelationship, TextNode
+
+from utils.kv_store import SqliteDocumentStore, SqliteKVStore
+
+
+def _nodes(path, texts):
+    document = Document(text="".join(texts), id_=path, metadata={"file_path": path})
+    nodes = []
+    for i, text in enumerate(texts):
+        node = TextNode(text=text, id_=f"{path}-{i}", metadata={"file_path": path})
+        node.relationships[NodeRelationship.SOURCE] = document.as_related_node_info()
+        nodes.append(node)
+    return nodes
+
+
+def _docstore(tmp_path):
+    kvstore = SqliteKVStore(str(tmp_path / "index_store.sqlite"))
+    docstore = SqliteDocumentStore(kvstore)
+    docstore.add_documents(_nodes("./data/libai.txt", ["李白离开长安。", "李白到达洛阳。"]))
+    docstore.add_documents(_nodes("./data/dufu.txt", ["杜甫在长安。"]))
+    docstore.persist()
+    return docstore
+
+
+def test_node_ids_containing_is_limited_to_candidates(tmp_path):
+    docstore = _docstore(tmp_path)
+    assert sorted(docstore.node_ids_containing(["长安"])) == ["./data/dufu.txt-0", "./data/libai.txt-0"]
+    files = docstore.file_node_ids()
+    libai = files[os.path.abspath("data/libai.txt")]
+    assert sorted(libai) == ["./data/libai.txt-0", "./data/libai.txt-1"]
+    assert docstore.node_ids_containing(["长安"], node_ids=libai) == ["./data/libai.txt-0"]
+    assert docstore.node_ids_containing(["长安", "洛阳"], node_ids=libai + ["missing"]) == libai
+    assert docstore.node_ids_containing(["长安"], node_ids=[]) == []
+    assert docstore.node_ids_containing(["", None]) == []
+
+
+
+def test_read_only_snapshot_ignores_later_commits(tmp_path):
+    docstore = _docstore(tmp_path)
+    snapshot = SqliteDocumentStore(SqliteKVStore(str(tmp_path / "index_store.sqlite"), read_only=True))
+    docstore.add_documents(_nodes("./data/sushi.txt", ["苏轼在长安。"]))
+    docstore.persist()
+    assert len(docstore.node_ids_containing(["长安"])) == 3
+    assert len(snapshot.node_ids_containing(["长安"])) == 2
+    assert set(snapshot.file_node_ids()) == {os.path.abspath("data/libai.txt"), os.path.abspath("data/dufu.txt")}
+
+
+def test_uncommitted_writes_are_invisible_and_read_only_ignores_writes(tmp_path):
+    path = str(tmp_path / "index_store.sqlite")
+    writer = SqliteKVStore(path)
+    writer.put("a", {"x": 1})
+    # 同步途中的修改在 commit 前对其他连接不可见
+    assert SqliteKVStore(path).get("a") is None
+    writer.commit()
+    reader = SqliteKVStore(path, read_only=True)
+    reader.put("b", {"x": 2})
+    assert not reader.delete("a")
+    reader.close()
+    assert SqliteKVStore(path, read_only=True).get_all() == {"a": {"x": 1}}
+
+
+def test_legacy_json_store_is_imported(tmp_path):
+    legacy = tmp_path / "docstore.json"
+    legacy.write_text(json.dumps({"docstore/data": {"n1": {"text": "长安"}}, "docstore/metadata": {"n1": {}}},
+                                 ensure_ascii=False), encoding="utf-8")
+    kvstore = SqliteKVStore(str(tmp_path / "index_store.sqlite"))
+    assert kvstore.empty()
+    assert kvstore.import_json(str(legacy)) == 2
+    assert SqliteKVStore(str(tmp_path / "index_store.sqlite")).get("n1", collection="docstore/data") == {"text": "长安"}
@@ -0,0 +1,39 @@
+import time
+
+from utils.llm_cache import LLMCache
+
+
+def test_key_covers_every_input():
+    base = ("deepseek", "deepseek-chat", "v1", "正文", {"max_new_tokens": 512})
+    key = LLMCache.make_key(*base)
+    assert LLMCache.make_key(*base) == key
+    for i, value in enumerate(["ipex_llm", "qwen2", "v2", "正文。", {"max_new_tokens": 1024}]):
+        changed = list(base)
+        changed[i] = value
+        assert LLMCache.make_key(*changed) != key
+    # 参数顺序不影响缓存键
+    assert LLMCache.make_key("a", "b", "c", "d", {"x": 1, "y": 2}) == LLMCache.make_key("a", "b", "c", "d",
+                                                                                       {"y": 2, "x": 1})
+
+
+def test_entries_persist_and_can_be_deleted(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    LLMCache(path).set("k", "输出")
+    cache = LLMCache(path)
+    assert cache.get("k") == "输出"
+    assert cache.get("missing") is None
+    cache.delete("k")
+    assert cache.get("k") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 0, "bytes": 0}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LLMCache(str(tmp_path / "llm_cache.sqlite"), max_bytes=30)
+    for key in "abc":
+        cache.set(key, "x" * 10)
+        time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("d", "x" * 10)
+    assert [key for key in "abcd" if cache.get(key) is not None] == ["a", "c", "d"]
+    assert cache.stats()["bytes"] == 30
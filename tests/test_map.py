@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("streamlit_folium")
+pytest.importorskip("geopandas")
+
+from utils.map import Map  # noqa: E402
+
+EVENT = {"event_title": "离开长安", "event_type": "旅行", "event_content": "李白离开长安。", "keys": ["长安"],
+         "geocode": {"latitude": 34.26, "longitude": 108.94}}
+
+
+def _features(b):
+    return json.loads(b.getvalue().decode("utf-8"))["features"]
+
+
+def test_export_tolerates_events_with_missing_fields():
+    partial = {"event_title": "入蜀", "geocode": {"latitude": 30.66, "longitude": 104.06}}
+    unlocated = {"event_title": "未知地点", "geocode": {"error": "not found"}}
+    features = _features(Map().export_geojson([EVENT, partial, unlocated]))
+    assert [f["properties"]["description"]["title"] for f in features] == ["离开长安", "入蜀"]
+    assert features[1]["properties"]["description"] == {"title": "入蜀", "type": "", "content": "", "keys": []}
+    assert features[0]["geometry"]["coordinates"] == [108.94, 34.26]
+
+
+def test_export_defaults_to_added_markers():
+    m = Map(render_mode="markers")
+    m.init_map("OpenStreetMap")
+    m.add_marker({"event_title": "只有标题"}, EVENT["geocode"])
+    assert [f["properties"]["description"]["title"] for f in _features(m.export_geojson())] == ["只有标题"]
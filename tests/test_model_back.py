@@ -0,0 +1,116 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+
+from utils.model_back import (ModelBack, EVENT_LIST_SYSTEM, EXTRACT_EVENTS_PROMPT,  # noqa: E402
+                              PROCESS_EVENT_PROMPT, PROCESS_EVENT_SYSTEM)
+
+EVENT = {"event_title": "离开长安", "event_type": "旅行", "event_content": "李白离开长安。", "keys": ["长安"],
+         "address": "长安"}
+
+
+class FakeClient:
+    """
+    按顺序返回预设响应的 deepseek 客户端，记录调用次数
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, stream=False):
+        self.calls += 1
+        content = self.responses.pop(0)
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + 5]))])
+                         for i in range(0, len(content), 5)])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _llm(tmp_path, responses):
+    llm = ModelBack(api_key="test", file_path=str(tmp_path / "event_list.json"), model_type="deepseek",
+                    cache_path=str(tmp_path / "llm_cache.sqlite"))
+    llm.client = FakeClient(responses)
+    return llm
+
+
+def test_process_event_caches_only_parsed_responses(tmp_path):
+    good = json.dumps(EVENT, ensure_ascii=False)
+    llm = _llm(tmp_path, ["不是 JSON", json.dumps([EVENT], ensure_ascii=False), good, "unused"])
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            llm.process_event("李白离开长安。")
+    assert llm.llm_cache.stats()["entries"] == 0
+    assert llm.process_event("李白离开长安。") == EVENT
+    # 续跑时回放解析成功的响应，不再调用模型
+    assert llm.process_event("李白离开长安。") == EVENT
+    assert llm.client.calls == 3
+    assert llm.extraction_stats["split"]["cache_hits"] == 1
+
+
+def test_invalid_cached_response_is_regenerated(tmp_path):
+    llm = _llm(tmp_path, [json.dumps(EVENT, ensure_ascii=False)])
+    # 旧版本在解析前写入缓存的无效输出
+    key = llm._cache_key("process_event", PROCESS_EVENT_SYSTEM,
+                         PROCESS_EVENT_PROMPT.format(event_text="李白离开长安。", language="英语"))
+    llm.llm_cache.set(key, "截断的输出 {")
+    assert llm.process_event("李白离开长安。") == EVENT
+    assert llm.client.calls == 1
+    assert json.loads(llm.llm_cache.get(key)) == EVENT
+
+
+def test_empty_event_list_is_not_cached(tmp_path):
+    llm = _llm(tmp_path, ["", "事件一\n---\n事件二"])
+    assert llm.get_event_list("正文") == []
+    assert llm.get_event_list("正文") == ["事件一", "事件二"]
+    assert llm.get_event_list("正文") == ["事件一", "事件二"]
+    assert llm.client.calls == 2
+
+
+def test_single_call_output_without_events_is_not_cached(tmp_path):
+    good = json.dumps([EVENT], ensure_ascii=False)
+    llm = _llm(tmp_path, ["抱歉，无法处理。", good])
+    assert llm.extract_events("正文", fallback=False) == []
+    assert llm.llm_cache.stats()["entries"] == 0
+    assert llm.extract_events("正文", fallback=False) == [EVENT]
+    assert llm.extract_events("正文", fallback=False) == [EVENT]
+    assert llm.client.calls == 2
+
+
+def test_cached_single_call_output_without_events_is_dropped(tmp_path):
+    llm = _llm(tmp_path, [json.dumps([EVENT], ensure_ascii=False)])
+    key = llm._cache_key("extract_events", EVENT_LIST_SYSTEM,
+                         EXTRACT_EVENTS_PROMPT.format(text="正文", language="英文"))
+    llm.llm_cache.set(key, "[]")
+    assert llm.extract_events("正文", fallback=False) == []
+    assert llm.llm_cache.get(key) is None
+    assert llm.extract_events("正文", fallback=False) == [EVENT]
+    assert llm.client.calls == 1
+
+
+def test_failed_stream_is_not_cached(tmp_path):
+    llm = _llm(tmp_path, [])
+
+    def broken_stream(prompt, system_prompt, max_new_tokens=None):
+        yield json.dumps(EVENT, ensure_ascii=False) + ", {"
+        raise ConnectionError("stream reset")
+
+    llm._stream_backend = broken_stream
+    with pytest.raises(ConnectionError):
+        list(llm.iter_extract_events("正文", fallback=False))
+    assert llm.llm_cache.stats()["entries"] == 0
+
+
+def test_cache_hits_do_not_count_as_saved_calls(tmp_path):
+    llm = _llm(tmp_path, [json.dumps([EVENT, EVENT], ensure_ascii=False)])
+    for _ in range(3):
+        assert len(llm.extract_events("正文", fallback=False)) == 2
+    report = llm.extraction_report()
+    assert report["single"]["calls"] == 1
+    assert report["single"]["legacy_calls"] == 3
+    assert report["saved_calls"] == 2
+    assert report["cache_hits"] == 2
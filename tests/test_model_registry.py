@@ -0,0 +1,95 @@
+import threading
+import time
+
+from utils.model_registry import ModelRegistry, RegistryKey
+
+KEY = RegistryKey("ipex_llm", "models/qwen2chat_int4", "")
+
+
+class Closable:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _age(registry, seconds):
+    # 把所有条目的最近使用时间往前推
+    for entry in registry._entries.values():
+        entry.last_used -= seconds
+
+
+def test_get_loads_once_across_threads():
+    registry = ModelRegistry()
+    loads = []
+
+    def factory():
+        loads.append(1)
+        time.sleep(0.05)
+        return Closable("model")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("model_back", KEY, factory)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert all(result is results[0] for result in results)
+
+
+def _load_with_dependency(registry):
+    shared = {}
+
+    def backend_factory():
+        shared["model"] = registry.get("ipex_model", KEY, lambda: Closable("ipex"))
+        return Closable("model_back")
+
+    backend = registry.get("model_back", KEY, backend_factory)
+    return backend, shared["model"]
+
+
+def test_dependency_outlives_its_own_idle_time():
+    registry = ModelRegistry()
+    backend, model = _load_with_dependency(registry)
+    registry._entries[("ipex_model", KEY)].last_used -= 3600
+    assert registry.evict_idle(60) == []
+    assert not registry.evict("ipex_model", KEY)
+    # 依赖方被移除后，闲置的依赖一并释放
+    _age(registry, 3600)
+    assert set(registry.evict_idle(60)) == {("model_back", KEY), ("ipex_model", KEY)}
+    assert backend.closed and model.closed
+
+
+def test_leased_entry_and_its_dependencies_are_not_evicted():
+    registry = ModelRegistry()
+    backend, model = _load_with_dependency(registry)
+    with registry.lease(backend):
+        # 长时间使用期间没有调用 get，另一个会话重跑时触发闲置清理
+        _age(registry, 3600)
+        assert registry.evict_idle(60) == []
+        assert not registry.evict("model_back", KEY)
+        assert not backend.closed and not model.closed
+        assert {row["kind"]: row["leases"] for row in registry.stats()} == {"ipex_model": 0, "model_back": 1}
+    # 释放租约时刷新使用时间
+    assert registry.evict_idle(60) == []
+    _age(registry, 3600)
+    assert len(registry.evict_idle(60)) == 2
+    assert backend.closed and model.closed
+
+
+def test_nested_leases_and_unknown_values():
+    registry = ModelRegistry()
+    backend = registry.get("model_back", KEY, lambda: Closable("model_back"))
+    with registry.lease(backend):
+        with registry.lease(backend):
+            pass
+        _age(registry, 3600)
+        assert registry.evict_idle(60) == []
+    with registry.lease(object()):
+        pass
+    assert registry.evict("model_back", KEY)
+    assert backend.closed
@@ -0,0 +1,290 @@
+import queue
+import random
+import threading
+import time
+
+from utils.jobs import ExtractionJob
+from utils.pipeline import ExtractionPipeline, _DONE, _Stage
+
+
+def _jitter():
+    # 随机延迟，打乱各工作线程的完成顺序
+    time.sleep(random.uniform(0, 0.005))
+
+
+class FakeLLM:
+    """
+    按文本块内容确定性地产出事件：每块 events_per_chunk 个，地址即事件标题
+    """
+    model_type = "deepseek"
+
+    def __init__(self, events_per_chunk=3, fail_single=()):
+        self.events_per_chunk = events_per_chunk
+        # 单次抽取产出一个事件后中途出错的文本块
+        self.fail_single = set(fail_single)
+        self.calls = {"single": [], "split": [], "process": []}
+        self._lock = threading.Lock()
+
+    def _log(self, kind, value):
+        with self._lock:
+            self.calls[kind].append(value)
+
+    def iter_extract_events(self, text, language="英文", fallback=True):
+        self._log("single", text)
+        for j in range(self.events_per_chunk):
+            _jitter()
+            if text in self.fail_single and j == 1:
+                raise RuntimeError("connection reset")
+            yield {"event_title": f"{text}/single{j}", "address": f"{text}/single{j}"}
+
+    def get_event_list(self, text):
+        self._log("split", text)
+        _jitter()
+        return [f"{text}/split{j}" for j in range(self.events_per_chunk)]
+
+    def process_event(self, event_text, language="英文"):
+        self._log("process", event_text)
+        _jitter()
+        return {"event_title": event_text, "address": event_text}
+
+
+class FakeGeo:
+    """
+    地理编码：fail 中的地址抛出异常，transient 中的地址返回可重试的错误
+    """
+    api_type = "offline"
+
+    def __init__(self, fail=(), transient=()):
+        self.fail = set(fail)
+        self.transient = set(transient)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def geocode(self, address):
+        with self._lock:
+            self.calls.append(address)
+        _jitter()
+        if address in self.fail:
+            raise RuntimeError("geocoder down")
+        if address in self.transient:
+            return {"error": "timeout", "retry": True}
+        return {"latitude": 30.0, "longitude": 120.0}
+
+
+def _chunks(n):
+    return [f"第{i}块文本，记述主人公在长安城中的行迹与见闻。" for i in range(n)]
+
+
+def _titles(events):
+    return [event["event_title"] for event in events]
+
+
+def _run(llm, geo, chunks, mode, job=None, timeout=10):
+    """
+    在后台线程中运行流水线，超时未结束视为挂起
+    """
+    pipeline = ExtractionPipeline(llm, geo, mode=mode, split_workers=3, extract_workers=4, geocode_workers=4,
+                                  queue_size=2)
+    result = {}
+
+    def target():
+        try:
+            result["events"] = list(pipeline.run(iter(chunks), job=job))
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        pipeline.close()
+        raise AssertionError("pipeline did not finish")
+    if "error" in result:
+        raise result["error"]
+    return result["events"]
+
+
+def test_split_mode_yields_events_in_narrative_order():
+    chunks = _chunks(6)
+    events = _run(FakeLLM(), FakeGeo(), chunks, "split")
+    assert _titles(events) == [f"{c}/split{j}" for c in chunks for j in range(3)]
+    assert all(event["geocode"]["latitude"] == 30.0 for event in events)
+
+
+def test_single_mode_records_source_chunk_and_anchors():
+    chunks = _chunks(5)
+    events = _run(FakeLLM(), FakeGeo(), chunks, "single")
+    assert _titles(events) == [f"{c}/single{j}" for c in chunks for j in range(3)]
+    for event in events:
+        source = event["source"]
+        assert event["event_title"].startswith(chunks[source["chunk"]])
+        assert source["anchors"] and all(a in chunks[source["chunk"]] for a in source["anchors"])
+
+
+def test_single_mode_failure_midway_falls_back_without_duplicates():
+    chunks = _chunks(4)
+    llm = FakeLLM(fail_single=[chunks[2]])
+    events = _run(llm, FakeGeo(), chunks, "single")
+    expected = [f"{c}/single{j}" for c in chunks[:2] for j in range(3)]
+    expected += [f"{chunks[2]}/split{j}" for j in range(3)]
+    expected += [f"{chunks[3]}/single{j}" for j in range(3)]
+    assert _titles(events) == expected
+    assert llm.calls["split"] == [chunks[2]]
+
+
+def test_failed_events_are_skipped_but_order_is_kept():
+    chunks = _chunks(3)
+    events = _run(FakeLLM(), FakeGeo(fail=[f"{chunks[1]}/split0"]), chunks, "split")
+    assert _titles(events) == [f"{c}/split{j}" for c in chunks for j in range(3) if (c, j) != (chunks[1], 0)]
+
+
+def test_empty_chunks_and_input():
+    llm = FakeLLM(events_per_chunk=0)
+    assert _run(llm, FakeGeo(), _chunks(3), "split") == []
+    assert _run(FakeLLM(), FakeGeo(), [], "split") == []
+
+
+class ListLLM(FakeLLM):
+    """
+    属性抽取返回 JSON 数组而不是对象(parse_event 对 json.loads 的结果不做检查)
+    """
+
+    def process_event(self, event_text, language="英文"):
+        if event_text.endswith("split1"):
+            return [{"event_title": event_text, "address": event_text}]
+        return super().process_event(event_text, language)
+
+
+def test_malformed_event_is_skipped_without_hanging():
+    chunks = _chunks(3)
+    events = _run(ListLLM(), FakeGeo(), chunks, "split")
+    assert _titles(events) == [f"{c}/split{j}" for c in chunks for j in (0, 2)]
+
+
+class BrokenJob(ExtractionJob):
+    """
+    写入检查点时出错：指定文本块的划分记录和指定事件的事件记录写入失败
+    """
+
+    def __init__(self, *args, bad_chunk=None, bad_event=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bad_chunk = bad_chunk
+        self.bad_event = bad_event
+
+    def record_chunk(self, chunk_idx, mode, units):
+        if chunk_idx == self.bad_chunk:
+            raise OSError("disk full")
+        super().record_chunk(chunk_idx, mode, units)
+
+    def record_event(self, chunk_idx, event_idx, info):
+        if (chunk_idx, event_idx) == self.bad_event:
+            raise OSError("disk full")
+        super().record_event(chunk_idx, event_idx, info)
+
+
+def test_checkpoint_write_errors_do_not_hang(tmp_path):
+    chunks = _chunks(4)
+    job = BrokenJob("job", root=str(tmp_path), bad_chunk=1, bad_event=(2, 0))
+    events = _run(FakeLLM(), FakeGeo(), chunks, "split", job=job)
+    # 文本块 1 的结果丢失，其余照常输出；写入失败的部分续跑时重试
+    assert _titles(events) == [f"{c}/split{j}" for c in chunks if c != chunks[1] for j in range(3)]
+    assert not job.done
+
+
+def test_stage_errors_emit_placeholders():
+    out_q = queue.Queue()
+    in_q = queue.Queue()
+    failed = []
+    stop = threading.Event()
+
+    def fn(item):
+        if item == 1:
+            raise RuntimeError("boom")
+        out_q.put(item)
+
+    stage = _Stage("test", fn, in_q, 2, 1, out_q, stop, on_error=failed.append)
+    stage.start()
+    for item in [0, 1, 2, _DONE, _DONE]:
+        in_q.put(item)
+    results = [out_q.get(timeout=5) for _ in range(3)]
+    assert sorted(results[:2]) == [0, 2] and results[2] is _DONE
+    assert failed == [1]
+
+
+def test_resume_replays_checkpoint_and_retries_only_failures(tmp_path):
+    chunks = _chunks(4)
+    failed = f"{chunks[2]}/split1"
+    job = ExtractionJob("job", root=str(tmp_path))
+    first = _run(FakeLLM(), FakeGeo(fail=[failed]), chunks, "split", job=job)
+    assert len(first) == 11
+    assert not job.done
+
+    llm, geo = FakeLLM(), FakeGeo()
+    job = ExtractionJob("job", root=str(tmp_path))
+    second = _run(llm, geo, chunks, "split", job=job)
+    assert _titles(second) == [f"{c}/split{j}" for c in chunks for j in range(3)]
+    # 划分结果和已完成的事件来自检查点，只有失败的事件重新抽取和地理编码
+    assert llm.calls["split"] == []
+    assert llm.calls["process"] == [failed]
+    assert geo.calls == [failed]
+    assert job.done
+
+
+def _broken_reader(chunks, fail_at):
+    # 读到第 fail_at 块时出错，如 PDF 解析失败
+    for i, chunk in enumerate(chunks):
+        if i == fail_at:
+            raise RuntimeError("PDF parse error")
+        yield chunk
+
+
+def test_read_error_leaves_job_incomplete(tmp_path):
+    chunks = _chunks(3)
+    job = ExtractionJob("job", root=str(tmp_path))
+    first = _run(FakeLLM(), FakeGeo(), _broken_reader(chunks, 1), "split", job=job)
+    assert _titles(first) == [f"{chunks[0]}/split{j}" for j in range(3)]
+    assert job.manifest["total_chunks"] is None
+    assert not job.done
+
+    llm = FakeLLM()
+    job = ExtractionJob("job", root=str(tmp_path))
+    second = _run(llm, FakeGeo(), chunks, "split", job=job)
+    assert _titles(second) == [f"{c}/split{j}" for c in chunks for j in range(3)]
+    assert llm.calls["split"] == chunks[1:]
+    assert job.done
+
+
+def test_transient_geocode_errors_are_not_checkpointed(tmp_path):
+    chunks = _chunks(2)
+    flaky = f"{chunks[0]}/single2"
+    job = ExtractionJob("job", root=str(tmp_path))
+    first = _run(FakeLLM(), FakeGeo(transient=[flaky]), chunks, "single", job=job)
+    assert first[2]["geocode"]["retry"]
+    assert not job.done
+
+    llm, geo = FakeLLM(), FakeGeo()
+    job = ExtractionJob("job", root=str(tmp_path))
+    second = _run(llm, geo, chunks, "single", job=job)
+    assert second[2]["geocode"] == {"latitude": 30.0, "longitude": 120.0}
+    assert llm.calls["single"] == []
+    assert geo.calls == [flaky]
+    assert job.done
+
+
+def test_ordered_reorders_and_drops_failed_events():
+    out_q = queue.Queue()
+    items = [("count", 0, 2), ("count", 1, 0), ("count", 2, 3), ("chunks", 3, None)]
+    for key in [(0, 0), (0, 1), (2, 0), (2, 1), (2, 2)]:
+        # (2, 1) 处理失败
+        items.append(("event", key, None if key == (2, 1) else f"{key[0]}-{key[1]}"))
+    random.Random(0).shuffle(items)
+    for item in items:
+        out_q.put(item)
+    assert list(ExtractionPipeline._ordered(out_q)) == ["0-0", "0-1", "2-0", "2-2"]
+
+
+def test_ordered_stops_on_done_marker():
+    out_q = queue.Queue()
+    for item in [("count", 0, 2), ("event", (0, 0), "a"), _DONE]:
+        out_q.put(item)
+    assert list(ExtractionPipeline._ordered(out_q)) == ["a"]
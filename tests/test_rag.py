@@ -0,0 +1,175 @@
+import zlib
+
+import numpy as np
+import pytest
+
+for module in ("dotenv", "modelscope", "llama_index.embeddings.huggingface", "llama_index.llms.openai_like"):
+    pytest.importorskip(module)
+
+from llama_index.core.base.embeddings.base import BaseEmbedding  # noqa: E402
+from llama_index.core.llms import MockLLM  # noqa: E402
+
+import utils.rag  # noqa: E402
+from utils.rag import RAG  # noqa: E402
+
+DIM = 512
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    按字符二元组散列到 512 维的确定性向量，记录送入模型的文本
+    """
+
+    def __init__(self, model_name="", **kwargs):
+        super().__init__(model_name=model_name, **kwargs)
+
+    @staticmethod
+    def vector(text):
+        v = np.full(DIM, 1e-3, dtype="float32")
+        for a, b in zip(text, text[1:]):
+            v[zlib.crc32((a + b).encode("utf-8")) % DIM] += 1
+        return v.tolist()
+
+    def _get_query_embedding(self, query):
+        EMBEDDED.append(query)
+        return self.vector(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text):
+        EMBEDDED.append(text)
+        return self.vector(text)
+
+
+EMBEDDED = []
+
+BOOKS = {
+    "libai.txt": "李白离开长安，沿黄河东下，在洛阳与杜甫相遇。两人同游梁宋，饮酒赋诗。",
+    "dufu.txt": "杜甫客居成都，在浣花溪畔修建草堂，写下许多关于蜀中风物的诗篇。",
+}
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    for name, text in BOOKS.items():
+        (data / name).write_text(text, encoding="utf-8")
+    return data
+
+
+@pytest.fixture
+def make_rag(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils.rag, "HuggingFaceEmbedding", FakeEmbedding)
+    model_dir = tmp_path / "bge"
+    model_dir.mkdir()
+
+    def make(**kwargs):
+        rag = RAG(api_key="test", persist_dir=str(tmp_path / "storage"), embed_model_name=str(model_dir), **kwargs)
+        rag.llm = MockLLM()
+        return rag
+
+    EMBEDDED.clear()
+    return make
+
+
+def _embedded():
+    # 文本节点送入模型时带有元数据(file_path)前缀
+    return sorted(text.rsplit("\n\n", 1)[-1] for text in EMBEDDED)
+
+
+def _indexed_texts(rag):
+    docstore = rag.get_query_engine() and rag.index_db.docstore
+    return sorted(node.get_content() for node in docstore.docs.values())
+
+
+def test_sync_embeds_only_new_and_changed_files(make_rag, data_dir):
+    rag = make_rag()
+    assert rag.sync_index(str(data_dir)) == {"added": 2, "updated": 0, "removed": 0, "unchanged": 0}
+    assert _embedded() == sorted(BOOKS.values())
+
+    EMBEDDED.clear()
+    (data_dir / "sushi.txt").write_text("苏轼被贬黄州，在东坡开荒种地。", encoding="utf-8")
+    assert rag.sync_index(str(data_dir)) == {"added": 1, "updated": 0, "removed": 0, "unchanged": 2}
+    assert _embedded() == ["苏轼被贬黄州，在东坡开荒种地。"]
+
+    EMBEDDED.clear()
+    assert make_rag().sync_index(str(data_dir)) == {"added": 0, "updated": 0, "removed": 0, "unchanged": 3}
+    assert EMBEDDED == []
+
+
+def test_changed_and_removed_files_replace_their_vectors(make_rag, data_dir):
+    rag = make_rag()
+    rag.sync_index(str(data_dir))
+    (data_dir / "libai.txt").write_text("李白晚年流放夜郎，途中遇赦。", encoding="utf-8")
+    (data_dir / "dufu.txt").unlink()
+    # 未写完的临时文件和隐藏文件不进入索引
+    (data_dir / "upload.txt.tmp").write_text("写了一半", encoding="utf-8")
+    (data_dir / ".DS_Store").write_text("x", encoding="utf-8")
+    assert rag.sync_index(str(data_dir)) == {"added": 0, "updated": 1, "removed": 1, "unchanged": 0}
+    assert _indexed_texts(rag) == ["李白晚年流放夜郎，途中遇赦。"]
+    assert rag.vector_store.client.ntotal == 1
+
+
+def _count_loads(rag):
+    loads = []
+    load_index = rag.load_index
+
+    def counting():
+        loads.append(1)
+        return load_index()
+
+    rag.load_index = counting
+    return loads
+
+
+def test_query_engine_is_reused_until_the_index_version_changes(make_rag, data_dir):
+    rag = make_rag()
+    rag.sync_index(str(data_dir))
+    loads = _count_loads(rag)
+    engine = rag.get_query_engine()
+    assert rag.get_query_engine() is engine
+    assert str(rag.query_index("李白在哪里遇到杜甫？"))
+    assert len(loads) == 1
+
+    # 没有变化的同步不更新版本号
+    rag.sync_index(str(data_dir))
+    assert rag.get_query_engine() is engine
+    # 另一个会话或进程更新了索引
+    (data_dir / "sushi.txt").write_text("苏轼被贬黄州，在东坡开荒种地。", encoding="utf-8")
+    make_rag().sync_index(str(data_dir))
+    assert rag.get_query_engine() is not engine
+    assert len(loads) == 2
+    assert "苏轼被贬黄州，在东坡开荒种地。" in _indexed_texts(rag)
+
+
+def test_repeated_questions_are_answered_from_the_cache(make_rag, data_dir):
+    rag = make_rag()
+    rag.sync_index(str(data_dir))
+    first = rag.query_index("李白在哪里遇到杜甫？")
+    assert rag.query_index("李白在哪里遇到杜甫？") is first
+    assert rag.answer_cache.report()["hits"] == 1
+    # 索引更新后不再返回旧的回答
+    (data_dir / "sushi.txt").write_text("苏轼被贬黄州，在东坡开荒种地。", encoding="utf-8")
+    rag.sync_index(str(data_dir))
+    assert rag.query_index("李白在哪里遇到杜甫？") is not first
+    assert make_rag(answer_cache={"max_entries": 0}).answer_cache is None
+
+
+def test_query_geo_searches_only_the_books_nodes(make_rag, data_dir):
+    from utils.spatial_index import EventSpatialIndex
+
+    rag = make_rag()
+    rag.sync_index(str(data_dir))
+    # 两本书的原文都提到了长安
+    (data_dir / "dufu.txt").write_text("杜甫困居长安十年，后客居成都。", encoding="utf-8")
+    rag.sync_index(str(data_dir))
+    events = [{"event_title": "离开长安", "address": "Xi'an", "source": {"chunk": 0, "anchors": ["长安"]},
+               "geocode": {"latitude": 34.26, "longitude": 108.94}}]
+    spatial_index = EventSpatialIndex(events)
+    response = rag.query_geo("李白去了哪里？", spatial_index, file_path=str(data_dir / "libai.txt"))
+    assert [n.node.metadata["file_path"] for n in response.source_nodes] == [str(data_dir / "libai.txt")]
+    assert response.metadata["events"] == events
+    response = rag.query_geo("李白去了哪里？", spatial_index)
+    assert len(response.source_nodes) == 2
@@ -0,0 +1,78 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from geopy.exc import GeocoderRateLimited
+
+from utils.geocode_cache import GeocodeCache
+from utils.geocode_utils import GeocodeUtils
+from utils.rate_limiter import TokenBucket, get_bucket
+
+
+def test_bucket_limits_rate_across_threads():
+    bucket = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(3)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 12 个令牌，初始 1 个，其余按 50 个/秒补充
+    assert time.monotonic() - start >= 11 / 50 * 0.9
+
+
+def test_penalize_pauses_the_bucket():
+    bucket = TokenBucket(rate=100, capacity=10)
+    bucket.penalize(0.1)
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_buckets_are_shared_per_provider():
+    assert get_bucket("baidu") is get_bucket("baidu")
+    assert get_bucket("baidu") is not get_bucket("free")
+
+
+class FakeGeolocator:
+    """
+    线程安全地记录请求；前 rate_limited 次请求返回限流
+    """
+
+    def __init__(self, rate_limited=0):
+        self.rate_limited = rate_limited
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def geocode(self, address, **kwargs):
+        with self._lock:
+            self.calls.append(address)
+            if self.rate_limited:
+                self.rate_limited -= 1
+                raise GeocoderRateLimited("too many requests", retry_after=0.05)
+        time.sleep(0.01)
+        return SimpleNamespace(latitude=len(address), longitude=0.0, address=address)
+
+
+def _geocoder(tmp_path, **kwargs):
+    geo = GeocodeUtils(api_type="baidu", baidu_key="test", cache=GeocodeCache(str(tmp_path / "geocode.sqlite")),
+                       **kwargs)
+    geo.bucket = TokenBucket(rate=1000, capacity=1000)
+    return geo
+
+
+def test_geocode_many_deduplicates_and_keeps_order(tmp_path):
+    geo = _geocoder(tmp_path)
+    geo.geolocator = FakeGeolocator()
+    addresses = ["Chang'an", "Luoyang", "chang'an", "Chengdu", "LUOYANG", "Chang'an"]
+    results = geo.geocode_many(addresses, max_workers=3)
+    assert [r["latitude"] for r in results] == [len(a) for a in addresses]
+    assert sorted(geo.geolocator.calls) == ["Chang'an", "Chengdu", "Luoyang"]
+    assert geo.geocode_many([]) == []
+
+
+def test_rate_limited_requests_are_retried(tmp_path):
+    geo = _geocoder(tmp_path, max_retries=2)
+    geo.geolocator = FakeGeolocator(rate_limited=2)
+    assert geo.geocode("Luoyang")["latitude"] == 7
+    assert geo.geolocator.calls == ["Luoyang"] * 3
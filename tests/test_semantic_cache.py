@@ -0,0 +1,55 @@
+import math
+import time
+
+from utils.semantic_cache import SemanticCache
+
+
+def _vector(angle):
+    # 单位圆上的向量，夹角越小越相似
+    return [math.cos(angle), math.sin(angle)]
+
+
+def test_similar_questions_hit_above_the_threshold():
+    cache = SemanticCache(threshold=0.99)
+    assert cache.lookup(_vector(0), "v1") is None
+    cache.store("李白在哪里遇到杜甫？", [10, 0], "洛阳", "v1")
+    response, info = cache.lookup(_vector(0.1), "v1")
+    assert response == "洛阳" and info["query"] == "李白在哪里遇到杜甫？" and info["similarity"] > 0.99
+    assert cache.lookup(_vector(0.5), "v1") is None
+    assert cache.report() == {"hits": 1, "misses": 2, "evictions": 0, "invalidations": 0, "entries": 1,
+                              "version": "v1"}
+
+
+def test_index_version_change_and_invalidate_clear_the_cache():
+    cache = SemanticCache()
+    cache.lookup(_vector(0), "v1")
+    cache.store("q", _vector(0), "a", "v1")
+    assert cache.lookup(_vector(0), "v2") is None
+    # 查询期间索引已更新，旧版本的回答不缓存
+    cache.store("q", _vector(0), "a", "v1")
+    assert cache.report()["entries"] == 0
+    cache.store("q", _vector(0), "b", "v2")
+    cache.invalidate()
+    assert cache.lookup(_vector(0), "v2") is None
+    assert cache.report()["invalidations"] == 2
+
+
+def test_least_recently_hit_entries_are_evicted():
+    cache = SemanticCache(threshold=0.999, max_entries=2)
+    cache.lookup(_vector(0), "v1")
+    cache.store("a", _vector(0), "A", "v1")
+    cache.store("b", _vector(1), "B", "v1")
+    assert cache.lookup(_vector(0), "v1")[0] == "A"
+    cache.store("c", _vector(2), "C", "v1")
+    assert cache.lookup(_vector(1), "v1") is None
+    assert cache.lookup(_vector(0), "v1")[0] == "A" and cache.lookup(_vector(2), "v1")[0] == "C"
+    assert cache.report()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = SemanticCache(ttl=0.05)
+    cache.lookup(_vector(0), "v1")
+    cache.store("q", _vector(0), "a", "v1")
+    time.sleep(0.1)
+    assert cache.lookup(_vector(0), "v1") is None
+    assert cache.report()["entries"] == 0
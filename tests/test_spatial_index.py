@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from utils.spatial_index import EventSpatialIndex, event_location, haversine_km
+
+
+def _events(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    latitudes = rng.uniform(-80, 80, n)
+    longitudes = rng.uniform(-180, 180, n)
+    events = [{"event_title": f"事件{i}", "geocode": {"latitude": float(lat), "longitude": float(lon)}}
+              for i, (lat, lon) in enumerate(zip(latitudes, longitudes))]
+    # 地理编码失败的事件不进入索引
+    events[5]["geocode"] = {"error": "not found"}
+    events[7]["geocode"] = {"latitude": None, "longitude": 1}
+    events[9]["geocode"] = {"latitude": float("nan"), "longitude": 1}
+    return events
+
+
+def _coords(events):
+    located = {i: event_location(e) for i, e in enumerate(events)}
+    return {i: loc for i, loc in located.items() if loc is not None}
+
+
+def _in_bbox(lat, lon, min_lon, min_lat, max_lon, max_lat):
+    if not min_lat <= lat <= max_lat:
+        return False
+    if min_lon > max_lon:
+        return lon >= min_lon or lon <= max_lon
+    return min_lon <= lon <= max_lon
+
+
+@pytest.fixture(scope="module")
+def events():
+    return _events()
+
+
+@pytest.fixture(scope="module")
+def index(events):
+    return EventSpatialIndex(events)
+
+
+def test_only_located_events_are_indexed(events, index):
+    assert len(index) == len(events) - 3
+    assert not {5, 7, 9} & set(index.all())
+    assert index.route() == [list(_coords(events)[i]) for i in index.all()]
+
+
+@pytest.mark.parametrize("bbox", [(100, 20, 130, 50), (-10, -60, 40, 10), (170, -30, -170, 30), (179, -90, -179, 90)])
+def test_query_bbox_matches_brute_force(events, index, bbox):
+    expected = [i for i, (lat, lon) in _coords(events).items() if _in_bbox(lat, lon, *bbox)]
+    assert index.query_bbox(*bbox) == expected
+
+
+@pytest.mark.parametrize("center,radius", [((30, 120), 800), ((0, 179.5), 1500), ((-75, -170), 2000), ((10, 10), 1)])
+def test_query_radius_matches_brute_force(events, index, center, radius):
+    coords = _coords(events)
+    expected = [i for i, (lat, lon) in coords.items() if haversine_km(*center, lat, lon) <= radius]
+    assert index.query_radius(*center, radius) == expected
+
+
+@pytest.mark.parametrize("center", [(30, 120), (0, -180), (85, 0)])
+def test_nearest_matches_brute_force(events, index, center):
+    coords = _coords(events)
+    ids = list(coords)
+    distances = haversine_km(center[0], center[1], np.array([coords[i][0] for i in ids]),
+                             np.array([coords[i][1] for i in ids]))
+    expected = [ids[j] for j in np.argsort(distances, kind="stable")[:10]]
+    result = index.nearest(*center, k=10)
+    assert [i for i, _ in result] == expected
+    assert [d for _, d in result] == sorted(d for _, d in result)
+
+
+def test_query_viewport_without_thinning_returns_padded_viewport(events, index):
+    bbox = (100, 20, 130, 50)
+    padded = (94, 14, 136, 56)
+    expected = [i for i, (lat, lon) in _coords(events).items() if _in_bbox(lat, lon, *padded)]
+    assert index.query_viewport(bbox, zoom=5, thin=False, max_events=10 ** 6) == expected
+
+
+def test_query_viewport_across_antimeridian(events, index):
+    bbox = (170, -20, -170, 20)
+    result = index.query_viewport(bbox, zoom=4, thin=False, padding=0, max_events=10 ** 6)
+    expected = [i for i, (lat, lon) in _coords(events).items() if _in_bbox(lat, lon, *bbox)]
+    assert result == expected
+    assert any(events[i]["geocode"]["longitude"] > 0 for i in result)
+    assert any(events[i]["geocode"]["longitude"] < 0 for i in result)
+
+
+def test_query_viewport_thinning_keeps_earliest_event_per_cell():
+    # 同一位置附近的事件在低缩放级别只保留原文中最早的一个
+    events = [{"geocode": {"latitude": 30 + i * 1e-4, "longitude": 120}} for i in range(50)]
+    events += [{"geocode": {"latitude": -30, "longitude": -60}}]
+    index = EventSpatialIndex(events)
+    world = (-180, -85, 180, 85)
+    assert index.query_viewport(world, zoom=2) == [0, 50]
+    assert len(index.query_viewport(world, zoom=22)) == 51
+
+
+def test_query_viewport_caps_and_keeps_order(events, index):
+    result = index.query_viewport((-180, -85, 180, 85), zoom=10, max_events=100)
+    assert len(result) == 100
+    assert result == sorted(result)
+
+
+def test_empty_index():
+    index = EventSpatialIndex([{"geocode": {}}])
+    assert len(index) == 0
+    assert index.query_bbox(-180, -90, 180, 90) == []
+    assert index.query_radius(0, 0, 1000) == []
+    assert index.nearest(0, 0) == []
+    assert index.query_viewport((-180, -90, 180, 90), 3) == []
@@ -0,0 +1,51 @@
+import os
+
+from utils.sqlite_store import content_hash
+from utils.uploads import UploadStore, get_upload_store
+
+
+def _store(tmp_path):
+    return UploadStore(data_dir=str(tmp_path / "data"), path=str(tmp_path / "uploads.sqlite"))
+
+
+def test_same_content_is_saved_once(tmp_path):
+    store = _store(tmp_path)
+    record, created = store.put("李白离开长安。".encode("utf-8"), "李白.TXT")
+    assert created
+    assert record["sha"] == content_hash("李白离开长安。".encode("utf-8"))
+    assert os.path.basename(record["file_path"]) == f"{record['sha']}.txt"
+    again, created = store.put("李白离开长安。".encode("utf-8"), "libai.txt")
+    assert not created
+    assert again["file_path"] == record["file_path"] and again["names"] == ["李白.TXT", "libai.txt"]
+    assert store.put("李白离开长安。".encode("utf-8"), "libai.txt")[0]["names"] == ["李白.TXT", "libai.txt"]
+    assert os.listdir(tmp_path / "data") == [os.path.basename(record["file_path"])]
+    assert store.get("unknown") is None
+
+
+def test_missing_file_is_written_again(tmp_path):
+    store = _store(tmp_path)
+    record, _ = store.put(b"content", "a.pdf")
+    os.remove(record["file_path"])
+    record, created = store.put(b"content", "a.pdf")
+    assert created
+    with open(record["file_path"], "rb") as f:
+        assert f.read() == b"content"
+
+
+def test_records_are_shared_across_instances(tmp_path):
+    first, _ = _store(tmp_path).put(b"a", "a.txt")
+    second, _ = _store(tmp_path).put(b"b", "b.txt")
+    store = _store(tmp_path)
+    store.mark_indexed([first["sha"]])
+    assert store.get(first["sha"])["indexed"] and not store.get(second["sha"])["indexed"]
+    store.mark_indexed()
+    assert store.get(second["sha"])["indexed"]
+    # 文件丢失后重新保存，需要重新进入索引
+    os.remove(first["file_path"])
+    assert not store.put(b"a", "a.txt")[0]["indexed"]
+
+
+def test_shared_store_per_location(tmp_path):
+    data_dir, path = str(tmp_path / "data"), str(tmp_path / "uploads.sqlite")
+    assert get_upload_store(data_dir, path) is get_upload_store(data_dir, path)
+    assert get_upload_store(data_dir, path) is not get_upload_store(str(tmp_path / "other"), path)
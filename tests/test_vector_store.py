@@ -0,0 +1,158 @@
+import json
+import os
+
+import faiss
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from utils.vector_store import INDEX_TYPES, IncrementalFaissVectorStore, build_faiss_index
+
+DIM = 32
+
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype("float32")
+
+
+def _nodes(vectors, doc_size=10, offset=0):
+    nodes = []
+    for i, vector in enumerate(vectors, start=offset):
+        node = TextNode(text=f"节点{i}", id_=f"node-{i}", embedding=vector.tolist())
+        node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=f"doc-{i // doc_size}")
+        nodes.append(node)
+    return nodes
+
+
+def _store(index_type, **config):
+    config = dict({"index_type": index_type, "min_train": 200, "nprobe": 64, "ef_search": 128}, **config)
+    return IncrementalFaissVectorStore(build_faiss_index("flat" if index_type.startswith("ivf") else index_type, DIM),
+                                       config=config)
+
+
+def _query(store, vector, k=5, node_ids=None):
+    return store.query(VectorStoreQuery(query_embedding=list(vector), similarity_top_k=k, node_ids=node_ids))
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_each_index_type_finds_the_same_vector_by_cosine(index_type):
+    vectors = _vectors(600)
+    store = _store(index_type, pq_m=8)
+    store.add(_nodes(vectors))
+    for i in (0, 123, 599):
+        # 向量做了归一化，按比例缩放的查询命中同一节点，内积即余弦相似度
+        result = _query(store, vectors[i] * 3)
+        assert result.ids[0] == f"node-{i}"
+        if index_type != "ivf_pq":
+            assert result.similarities[0] == pytest.approx(1.0, abs=1e-4)
+
+
+def test_ivf_pq_waits_for_enough_vectors_to_train_its_codebooks():
+    store = _store("ivf_pq", pq_m=8)
+    store.add(_nodes(_vectors(1000)))
+    # 已超过 min_train，但每个 PQ 码本的 256 个中心还没有足够的训练样本
+    assert not isinstance(store.client, faiss.IndexIVF)
+    assert not store._needs_training()
+    store._node_ids.update({10 ** 6 + i: f"extra-{i}" for i in range(256 * 39 - 1000)})
+    assert store._needs_training()
+
+
+def test_ivf_trains_once_enough_vectors_exist_and_retrains_as_the_corpus_grows():
+    store = _store("ivf_flat", retrain_factor=2)
+    store.add(_nodes(_vectors(150)))
+    assert not isinstance(store.client, faiss.IndexIVF)
+    store.add(_nodes(_vectors(100, seed=1), offset=150))
+    assert isinstance(store.client, faiss.IndexIVF) and store._trained_size == 250
+    nlist = store.client.nlist
+    store.add(_nodes(_vectors(300, seed=2), offset=250))
+    assert store._trained_size == 550 and store.client.nlist > nlist
+    assert store.client.ntotal == 550
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+def test_deleted_documents_never_come_back(index_type):
+    vectors = _vectors(300)
+    store = _store(index_type)
+    store.add(_nodes(vectors))
+    store.delete("doc-0")
+    store.delete("node-15")
+    for i in (0, 5, 15):
+        assert f"node-{i}" not in _query(store, vectors[i], k=10).ids
+    assert _query(store, vectors[16]).ids[0] == "node-16"
+
+
+def test_query_restricted_to_given_nodes():
+    vectors = _vectors(100)
+    store = _store("flat")
+    store.add(_nodes(vectors))
+    wanted = [f"node-{i}" for i in range(50, 60)]
+    result = _query(store, vectors[0], k=3, node_ids=wanted)
+    assert len(result.ids) == 3 and set(result.ids) <= set(wanted)
+    assert _query(store, vectors[0], node_ids=["missing"]).ids == []
+
+
+def test_unknown_index_type_and_l2_indexes_are_rejected():
+    with pytest.raises(ValueError):
+        build_faiss_index("lsh", DIM)
+    with pytest.raises(ValueError):
+        IncrementalFaissVectorStore(faiss.IndexFlatL2(DIM))
+
+
+def _persisted(tmp_path, index_type="flat"):
+    vectors = _vectors(300)
+    store = _store(index_type)
+    store.add(_nodes(vectors))
+    store.delete("doc-1")
+    path = str(tmp_path / "default__vector_store.json")
+    store.persist(path)
+    return store, vectors, path
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf_flat"])
+def test_mmap_load_answers_like_the_writable_store(tmp_path, index_type):
+    store, vectors, path = _persisted(tmp_path, index_type)
+    loaded = IncrementalFaissVectorStore.from_persist_path(path, mmap=True)
+    assert loaded.config["index_type"] == index_type
+    for i in (0, 15, 299):
+        assert _query(loaded, vectors[i], k=10).ids == _query(store, vectors[i], k=10).ids
+    with pytest.raises(RuntimeError):
+        loaded.add(_nodes(vectors[:1]))
+    with pytest.raises(RuntimeError):
+        loaded.delete("doc-0")
+    with pytest.raises(RuntimeError):
+        loaded.persist(path)
+
+
+def test_persist_replaces_files_under_open_readers(tmp_path):
+    store, vectors, path = _persisted(tmp_path)
+    reader = IncrementalFaissVectorStore.from_persist_path(path, mmap=True)
+    writable = IncrementalFaissVectorStore.from_persist_path(path)
+    writable.delete("doc-0")
+    writable.persist(path)
+    # 已打开的只读索引仍是旧版本，重新加载后才看到删除
+    assert _query(reader, vectors[0]).ids[0] == "node-0"
+    assert "node-0" not in _query(IncrementalFaissVectorStore.from_persist_path(path, mmap=True), vectors[0]).ids
+
+
+def test_changed_index_type_is_rejected_on_load(tmp_path):
+    _, _, path = _persisted(tmp_path)
+    with pytest.raises(ValueError):
+        IncrementalFaissVectorStore.from_persist_path(path, config={"index_type": "hnsw"})
+    loaded = IncrementalFaissVectorStore.from_persist_path(path, config={"nprobe": 4})
+    assert loaded.config["index_type"] == "flat" and loaded.config["nprobe"] == 4
+
+
+def test_legacy_json_mapping_is_converted(tmp_path):
+    store, vectors, path = _persisted(tmp_path)
+    with open(f"{path}.ids.json", "w", encoding="utf-8") as f:
+        json.dump({"vector_ids": store._vector_ids, "ref_doc_nodes": store._ref_doc_nodes, "config": store.config,
+                   "tombstones": []}, f)
+    os.remove(f"{path}.ids.npz")
+    assert _query(IncrementalFaissVectorStore.from_persist_path(path, mmap=True), vectors[20]).ids[0] == "node-20"
+    loaded = IncrementalFaissVectorStore.from_persist_path(path)
+    loaded.persist(path)
+    assert os.path.exists(f"{path}.ids.npz") and not os.path.exists(f"{path}.ids.json")
+    # 文档到节点的映射保留下来，按文档删除仍然有效
+    loaded.delete("doc-2")
+    assert "node-20" not in _query(loaded, vectors[20], k=10).ids
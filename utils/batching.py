@@ -0,0 +1,53 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class DynamicBatcher:
+    """
+    动态批处理：把短时间窗口内排队的生成请求合并成一批执行。
+
+    后台线程取到第一个请求后最多再等待 window 秒收集后续请求，
+    凑满 max_batch_size 或超时即调用 batch_fn(prompts, max_new_tokens_list, prefixes)。
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 4, window: float = 0.05):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="ipex-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, max_new_tokens: int, prefix: str = None):
+        """
+        提交一个请求并阻塞等待结果；prefix 为提示词的静态前缀，单独成批时可复用其 KV 缓存
+        """
+        future = Future()
+        self._queue.put((prompt, max_new_tokens, prefix, future))
+        return future.result()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            prompts = [p for p, _, _, _ in batch]
+            budgets = [n for _, n, _, _ in batch]
+            prefixes = [prefix for _, _, prefix, _ in batch]
+            try:
+                results = self.batch_fn(prompts, budgets, prefixes)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, _, _, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,158 @@
+import re
+import json
+import hashlib
+
+# 句末标点(含其后的引号/括号)或连续换行之后切分，换行归入前一句；英文句号要求后面跟空白，避免切开小数和缩写
+_SENTENCE_SPLIT = re.compile(r'(?<=[。！？!?；;…][”’"』」）)])(?!\n)|(?<=[。！？!?；;…])(?![。！？!?；;…”’"』」）)\n])'
+                             r'|(?<=[.])(?=[ \t])|(?<=\n)(?!\n)')
+
+# 原文锚点：不含空白、引号和反斜杠的连续字符，换行位置不同或 JSON 转义后仍能按子串匹配
+_ANCHOR = re.compile(r'[^\s"\\]{16}')
+
+
+def text_anchors(text: str, step: int = 200, max_anchors: int = 32) -> list:
+    """
+    从文本中大约每隔 step 个字符取一段 16 个字符的原文片段。切分方式不同的其他索引
+    (如 RAG 文档库)中，与该文本有一段以上重合的节点至少包含其中一个片段
+
+    Returns:
+        list: 原文片段，按出现顺序
+    """
+    step = max(step, len(text) // max_anchors + 1)
+    anchors = []
+    pos = 0
+    while True:
+        match = _ANCHOR.search(text, pos)
+        if match is None:
+            break
+        anchors.append(match.group())
+        pos = max(pos + step, match.end())
+    return anchors
+
+
+class TokenChunker:
+    """
+    按 token 预算切分文本块。
+
+    用当前模型的 tokenizer 计算长度，以句子/段落为最小单位装箱，每块不超过
+    max_tokens，可选地在相邻块之间保留 overlap_tokens 的重叠句子。支持增量输入：
+    逐页或逐段 feed，跨页的半句话会等到下一段输入后再参与切分。
+    单个句子超过预算时按字符硬切。
+    """
+
+    def __init__(self, count_tokens, max_tokens: int = 2000, overlap_tokens: int = 0, tokenizer_id: str = ''):
+        """
+        Args:
+            count_tokens (Callable[[str], int]): 计算 token 数的函数，一般为 ModelBack.count_tokens
+            max_tokens (int): 每块的 token 上限
+            overlap_tokens (int): 相邻块之间重叠的 token 数上限
+            tokenizer_id (str): tokenizer 标识，参与 signature 计算
+        """
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.tokenizer_id = tokenizer_id
+        self._reset()
+
+    def _reset(self):
+        self._tail = ''
+        self._sentences = []
+        self._tokens = 0
+        # 上次输出之后新加入的句子数，只剩重叠句子时不再输出
+        self._fresh = 0
+        self.stats = {"inputs": 0, "chars": 0, "chunks": 0, "tokens": 0}
+
+    @property
+    def signature(self) -> str:
+        """
+        切分配置的标识，配置相同的切分结果相同，可用于区分断点续跑的任务
+        """
+        payload = json.dumps([self.tokenizer_id, self.max_tokens, self.overlap_tokens])
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+    def feed(self, text: str) -> list:
+        """
+        输入一段文本，返回因此装满的文本块
+        """
+        self.stats["inputs"] += 1
+        self.stats["chars"] += len(text)
+        pieces = _SENTENCE_SPLIT.split(self._tail + text)
+        # 最后一段可能是被截断的半句话，留到下一次输入
+        self._tail = pieces.pop() if pieces else ''
+        return self._pack(pieces)
+
+    def flush(self) -> list:
+        """
+        输入结束，返回剩余的文本块
+        """
+        chunks = self._pack([self._tail] if self._tail else [])
+        self._tail = ''
+        if self._fresh and any(s.strip() for s, _ in self._sentences):
+            chunks.append(self._emit(keep_overlap=False))
+        self._sentences, self._tokens, self._fresh = [], 0, 0
+        return chunks
+
+    def chunk(self, texts):
+        """
+        对文本流(如逐页产出的 PDF 文本)增量切分
+
+        Yields:
+            str: 文本块
+        """
+        self._reset()
+        for text in texts:
+            yield from self.feed(text)
+        yield from self.flush()
+
+    def _pack(self, sentences) -> list:
+        chunks = []
+        for sentence in sentences:
+            if not sentence:
+                continue
+            tokens = self.count_tokens(sentence)
+            if tokens > self.max_tokens:
+                for piece in self._hard_split(sentence, tokens):
+                    chunks.extend(self._add(piece, self.count_tokens(piece)))
+            else:
+                chunks.extend(self._add(sentence, tokens))
+        return chunks
+
+    def _add(self, sentence: str, tokens: int) -> list:
+        chunks = []
+        if self._sentences and self._tokens + tokens > self.max_tokens:
+            chunks.append(self._emit(keep_overlap=True))
+            # 重叠部分加上新句子仍然超出预算时放弃重叠
+            if self._tokens + tokens > self.max_tokens:
+                self._sentences, self._tokens = [], 0
+        self._sentences.append((sentence, tokens))
+        self._tokens += tokens
+        self._fresh += 1
+        return chunks
+
+    def _emit(self, keep_overlap: bool) -> str:
+        text = "".join(s for s, _ in self._sentences)
+        self.stats["chunks"] += 1
+        self.stats["tokens"] += self._tokens
+        overlap, overlap_tokens = [], 0
+        if keep_overlap and self.overlap_tokens:
+            for sentence, tokens in reversed(self._sentences):
+                if overlap_tokens + tokens > self.overlap_tokens:
+                    break
+                overlap.insert(0, (sentence, tokens))
+                overlap_tokens += tokens
+        self._sentences, self._tokens, self._fresh = overlap, overlap_tokens, 0
+        return text
+
+    def _hard_split(self, sentence: str, tokens: int) -> list:
+        # 按平均每 token 字符数估算切分长度，留一成余量
+        size = max(1, int(len(sentence) * self.max_tokens / tokens * 0.9))
+        return [sentence[i:i + size] for i in range(0, len(sentence), size)]
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: 输入段数、输出块数，以及相对原先"一段输入一块"的切分节省的 LLM 调用次数
+        """
+        return dict(self.stats, saved_calls=self.stats["inputs"] - self.stats["chunks"])
@@ -0,0 +1,229 @@
+import os
+import hashlib
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, List
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from utils.sqlite_store import SqliteStore, content_hash
+
+EMBED_POOLS = ("thread", "process")
+
+# 每个子进程各自加载一次向量模型
+_worker_model = None
+
+
+def _init_embed_worker(model_name: str, batch_size: int):
+    global _worker_model
+    import torch
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    # 每个进程单线程计算，由进程数占满 CPU，避免线程超额订阅
+    torch.set_num_threads(1)
+    _worker_model = HuggingFaceEmbedding(model_name=model_name, embed_batch_size=batch_size)
+
+
+def _embed_in_worker(texts: List[str]) -> List[Embedding]:
+    return _worker_model.get_text_embedding_batch(texts)
+
+
+def model_revision(model_name: str) -> str:
+    """
+    向量模型的版本标识：本地目录按配置和权重文件的大小、修改时间计算，模型文件更新后缓存自动失效；
+    非本地路径直接使用模型名
+    """
+    if not os.path.isdir(model_name):
+        return model_name
+    h = hashlib.sha1(os.path.abspath(model_name).encode("utf-8"))
+    for name in sorted(os.listdir(model_name)):
+        if name.endswith((".json", ".bin", ".safetensors", ".txt", ".model")):
+            stat = os.stat(os.path.join(model_name, name))
+            h.update(f"{name}:{stat.st_size}:{int(stat.st_mtime)}".encode("utf-8"))
+    return f"{os.path.basename(os.path.normpath(model_name))}@{h.hexdigest()[:12]}"
+
+
+class EmbeddingCache(SqliteStore):
+    """
+    按 (模型版本, 类型, 文本哈希) 缓存向量的 SQLite 存储，向量以 float32 二进制保存。
+    重建索引或重复上传同一本书时，已计算过的段落不再经过模型。
+    """
+
+    def __init__(self, path: str = './storage/embeddings.sqlite'):
+        super().__init__(path)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, kind TEXT NOT NULL, sha TEXT NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, kind, sha)) WITHOUT ROWID"
+            )
+
+    def get_many(self, model: str, kind: str, shas: List[str]) -> dict:
+        """
+        Returns:
+            dict: sha -> 向量(list)，缺失的不在结果中
+        """
+        found = {}
+        conn = self._conn()
+        # SQLite 单条语句的参数个数有上限，分批查询
+        for i in range(0, len(shas), 500):
+            batch = shas[i:i + 500]
+            rows = conn.execute(
+                f"SELECT sha, vector FROM embeddings WHERE model=? AND kind=? AND sha IN ({','.join('?' * len(batch))})",
+                [model, kind, *batch])
+            for sha, vector in rows:
+                found[sha] = np.frombuffer(vector, dtype="float32").tolist()
+        return found
+
+    def put_many(self, model: str, kind: str, items: dict) -> None:
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO embeddings (model, kind, sha, vector) VALUES (?, ?, ?, ?)",
+                             [(model, kind, sha, np.asarray(vector, dtype="float32").tobytes())
+                              for sha, vector in items.items()])
+
+    def count(self, model: str = None) -> int:
+        if model is None:
+            return self._conn().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._conn().execute("SELECT COUNT(*) FROM embeddings WHERE model=?", (model,)).fetchone()[0]
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    带持久化缓存和批处理的向量模型包装。
+
+    文本先按内容哈希查缓存，只有未命中且去重后的文本送入模型；送入模型前按长度排序
+    再切成 batch_size 大小的批，同一批内长度接近，减少补齐(padding)的计算浪费。
+    workers > 1 时多个批并行计算：thread 模式共用同一个模型，process 模式每个进程
+    各自加载一份模型、单线程计算，适合在 CPU 上为大语料计算向量。
+    """
+
+    _inner: Any = PrivateAttr()
+    _cache: Any = PrivateAttr(default=None)
+    _model_name: str = PrivateAttr(default='')
+    _revision: str = PrivateAttr(default='')
+    _batch_size: int = PrivateAttr(default=32)
+    _workers: int = PrivateAttr(default=1)
+    _pool: str = PrivateAttr(default="thread")
+    _executor: Any = PrivateAttr(default=None)
+    _executor_lock: Any = PrivateAttr(default=None)
+    _stats: dict = PrivateAttr(default_factory=dict)
+
+    def __init__(self, inner: BaseEmbedding, model_name: str, cache: EmbeddingCache = None, batch_size: int = 32,
+                 workers: int = 1, pool: str = "thread", **kwargs: Any) -> None:
+        """
+        Args:
+            inner (BaseEmbedding): 实际计算向量的模型，一般为 HuggingFaceEmbedding
+            model_name (str): 模型名或本地路径，用于计算缓存的模型版本，process 模式下子进程据此加载模型
+            cache (EmbeddingCache): 向量缓存，None 时不缓存
+            batch_size (int): 每次送入模型的文本数
+            workers (int): 并行计算的批数
+            pool (str): thread 或 process
+        """
+        if pool not in EMBED_POOLS:
+            raise ValueError(f"Unsupported pool: {pool}, expected one of {EMBED_POOLS}")
+        # 外层一次接收足够多的文本，排序分批在这里完成
+        kwargs.setdefault("embed_batch_size", 2048)
+        super().__init__(model_name=model_name, **kwargs)
+        self._inner = inner
+        self._cache = cache
+        self._model_name = model_name
+        self._revision = model_revision(model_name)
+        self._batch_size = max(1, batch_size)
+        # 传给内层模型的每一批都不超过 batch_size，不会被再次拆分
+        self._inner.embed_batch_size = self._batch_size
+        self._workers = max(1, workers)
+        self._pool = pool
+        self._executor_lock = threading.Lock()
+        self._stats = {"texts": 0, "cache_hits": 0, "embedded": 0, "batches": 0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def revision(self) -> str:
+        return self._revision
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                if self._pool == "process":
+                    # torch 已在主进程中初始化线程池，fork 可能死锁，使用 spawn
+                    self._executor = ProcessPoolExecutor(
+                        self._workers, mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_embed_worker, initargs=(self._model_name, self._batch_size))
+                else:
+                    self._executor = ThreadPoolExecutor(self._workers, thread_name_prefix="embed")
+            return self._executor
+
+    def _embed_batch(self, texts: List[str]) -> List[Embedding]:
+        return self._inner.get_text_embedding_batch(texts)
+
+    def _embed_uncached(self, texts: List[str]) -> List[Embedding]:
+        # 按长度排序后分批，结果再按原顺序放回
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [[texts[i] for i in order[start:start + self._batch_size]]
+                   for start in range(0, len(order), self._batch_size)]
+        self._stats["batches"] += len(batches)
+        if self._workers > 1 and len(batches) > 1:
+            embed = _embed_in_worker if self._pool == "process" else self._embed_batch
+            results = list(self._get_executor().map(embed, batches))
+        else:
+            results = [self._embed_batch(batch) for batch in batches]
+        embeddings = [None] * len(texts)
+        for i, embedding in zip(order, (e for batch in results for e in batch)):
+            embeddings[i] = embedding
+        return embeddings
+
+    def _embed_texts(self, texts: List[str], kind: str) -> List[Embedding]:
+        shas = [content_hash(text) for text in texts]
+        found = self._cache.get_many(self._revision, kind, list(set(shas))) if self._cache else {}
+        missing = {}
+        for sha, text in zip(shas, texts):
+            if sha not in found:
+                missing.setdefault(sha, text)
+        if missing:
+            if kind == "query":
+                computed = dict(zip(missing, [self._inner.get_query_embedding(text) for text in missing.values()]))
+            else:
+                computed = dict(zip(missing, self._embed_uncached(list(missing.values()))))
+            if self._cache:
+                self._cache.put_many(self._revision, kind, computed)
+            found.update(computed)
+        self._stats["texts"] += len(texts)
+        self._stats["cache_hits"] += len(texts) - len(missing)
+        self._stats["embedded"] += len(missing)
+        return [found[sha] for sha in shas]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed_texts([query], "query")[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed_texts([text], "text")[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed_texts(texts, "text")
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embedding(text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._get_text_embeddings(texts)
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: 请求的文本数、缓存命中数、实际计算数和批数
+        """
+        return dict(self._stats)
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,148 @@
+import os
+import json
+from utils.sqlite_store import SqliteStore
+
+
+class EventStore(SqliteStore):
+    """
+    只追加的事件存储(SQLite + WAL)。
+
+    每次保存只插入一行，写入在事务中原子完成，多个会话/进程可以同时追加；
+    document、create_time、event_type 上建有索引，支持分页读取，
+    并可导出为原先 event_list.json 的列表格式。
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " document TEXT NOT NULL DEFAULT '',"
+                " event_type TEXT,"
+                " create_time TEXT,"
+                " data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_document ON events (document)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_create_time ON events (create_time)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_type ON events (event_type)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @staticmethod
+    def _row(event: dict, document: str):
+        return (document or '', event.get("event_type"), event.get("create_time"),
+                json.dumps(event, ensure_ascii=False))
+
+    def append(self, event: dict, document: str = '') -> int:
+        """
+        追加一个事件，返回事件 id
+        """
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO events (document, event_type, create_time, data) VALUES (?, ?, ?, ?)",
+                self._row(event, document))
+        return cursor.lastrowid
+
+    def append_many(self, events: list, document: str = '') -> int:
+        """
+        在一个事务中追加多个事件，返回追加数量
+        """
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO events (document, event_type, create_time, data) VALUES (?, ?, ?, ?)",
+                [self._row(event, document) for event in events])
+        return len(events)
+
+    @staticmethod
+    def _where(document=None, event_type=None):
+        clauses, params = [], []
+        if document is not None:
+            clauses.append("document = ?")
+            params.append(document)
+        if event_type is not None:
+            clauses.append("event_type = ?")
+            params.append(event_type)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def count(self, document: str = None, event_type: str = None) -> int:
+        where, params = self._where(document, event_type)
+        return self._conn().execute(f"SELECT COUNT(*) FROM events{where}", params).fetchone()[0]
+
+    def page(self, page: int = 0, page_size: int = 100, document: str = None, event_type: str = None,
+             order_by: str = "id") -> list:
+        """
+        分页读取事件
+
+        Args:
+            page (int): 页码，从 0 开始
+            page_size (int): 每页数量
+            document (str): 按文档过滤
+            event_type (str): 按事件类型过滤
+            order_by (str): 排序字段，"id" 或 "create_time"
+
+        Returns:
+            list: 事件字典列表
+        """
+        if order_by not in ("id", "create_time"):
+            raise ValueError(f"Unsupported order_by: {order_by}")
+        where, params = self._where(document, event_type)
+        rows = self._conn().execute(
+            f"SELECT data FROM events{where} ORDER BY {order_by}, id LIMIT ? OFFSET ?",
+            params + [page_size, page * page_size])
+        return [json.loads(data, strict=False) for (data,) in rows]
+
+    def iter_events(self, document: str = None, event_type: str = None, batch_size: int = 1000):
+        """
+        按 id 顺序逐批遍历事件，避免一次性读入内存
+        """
+        where, params = self._where(document, event_type)
+        where = where + (" AND" if where else " WHERE") + " id > ?"
+        last_id = 0
+        while True:
+            rows = self._conn().execute(
+                f"SELECT id, data FROM events{where} ORDER BY id LIMIT ?",
+                params + [last_id, batch_size]).fetchall()
+            if not rows:
+                return
+            for row_id, data in rows:
+                yield json.loads(data, strict=False)
+            last_id = rows[-1][0]
+
+    def export_json(self, path: str, document: str = None):
+        """
+        导出为 event_list.json 的列表格式，先写临时文件再原子替换
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for i, event in enumerate(self.iter_events(document=document)):
+                if i:
+                    f.write(", ")
+                json.dump(event, f, ensure_ascii=False)
+            f.write("]")
+        os.replace(tmp_path, path)
+
+    def migrate_json(self, json_path: str, document: str = '') -> int:
+        """
+        把旧的 event_list.json 一次性导入，已导入过的文件不会重复导入；原文件保留不动
+
+        Returns:
+            int: 本次导入的事件数
+        """
+        if not os.path.exists(json_path):
+            return 0
+        marker = f"migrated:{os.path.abspath(json_path)}"
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+            return 0
+        with open(json_path, "r", encoding="utf-8") as file:
+            events = json.load(file, strict=False)
+        with conn:
+            conn.executemany(
+                "INSERT INTO events (document, event_type, create_time, data) VALUES (?, ?, ?, ?)",
+                [self._row(event, document) for event in events])
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(len(events))))
+        return len(events)
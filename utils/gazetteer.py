@@ -0,0 +1,269 @@
+import os
+import json
+import math
+import threading
+import numpy as np
+from utils.geocode_cache import GeocodeCache
+
+# GeoNames 主表(allCountries.txt / cities15000.txt 等)的列序号
+_COL_ID, _COL_NAME, _COL_ASCII, _COL_ALT, _COL_LAT, _COL_LON = 0, 1, 2, 3, 4, 5
+_COL_COUNTRY, _COL_POP = 8, 14
+_EARTH_RADIUS_KM = 6371.0088
+
+
+class Gazetteer:
+    """
+    离线地名索引。
+
+    从 GeoNames 格式的 TSV 构建紧凑的二进制索引并以内存映射方式打开：
+    - 名称键(正式名、ASCII 名、别名、中文名)排序后存放，支持精确匹配和前缀匹配；
+    - 地点坐标、人口等属性按行存放在 .npy 中；
+    - 反向地理编码使用单位球坐标上的 KD 树做最近邻查询。
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self._keys = np.memmap(os.path.join(index_dir, "keys.bin"), dtype=np.uint8, mode="r")
+        self._key_offsets = np.load(os.path.join(index_dir, "key_offsets.npy"), mmap_mode="r")
+        self._key_rows = np.load(os.path.join(index_dir, "key_rows.npy"), mmap_mode="r")
+        self._names = np.memmap(os.path.join(index_dir, "names.bin"), dtype=np.uint8, mode="r")
+        self._name_offsets = np.load(os.path.join(index_dir, "name_offsets.npy"), mmap_mode="r")
+        self._coords = np.load(os.path.join(index_dir, "coords.npy"), mmap_mode="r")
+        self._population = np.load(os.path.join(index_dir, "population.npy"), mmap_mode="r")
+        self._tree = None
+        self._tree_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._coords)
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+    @classmethod
+    def build(cls, tsv_paths, index_dir: str, alias_path: str = None, alias_languages=("zh", "zh-cn", "zh-tw", "en", "")):
+        """
+        从 GeoNames TSV 构建索引
+
+        Args:
+            tsv_paths (str | list): 一个或多个 GeoNames 主表文件
+            index_dir (str): 索引输出目录
+            alias_path (str): 可选的 alternateNamesV2.txt，用于补充别名和中文名
+            alias_languages (tuple): 从 alias_path 中导入的语言
+
+        Returns:
+            Gazetteer: 打开的索引
+        """
+        if isinstance(tsv_paths, str):
+            tsv_paths = [tsv_paths]
+        rows = {}
+        names, coords, population = [], [], []
+        keys = []
+
+        def add_key(name, row):
+            key = GeocodeCache.normalize(name)
+            if key:
+                keys.append((key, row))
+
+        for path in tsv_paths:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    cols = line.rstrip("\n").split("\t")
+                    if len(cols) <= _COL_POP or cols[_COL_ID] in rows:
+                        continue
+                    row = len(names)
+                    rows[cols[_COL_ID]] = row
+                    country = cols[_COL_COUNTRY]
+                    names.append(f"{cols[_COL_NAME]}, {country}" if country else cols[_COL_NAME])
+                    coords.append((float(cols[_COL_LAT]), float(cols[_COL_LON])))
+                    population.append(int(cols[_COL_POP] or 0))
+                    add_key(cols[_COL_NAME], row)
+                    if cols[_COL_ASCII] != cols[_COL_NAME]:
+                        add_key(cols[_COL_ASCII], row)
+                    for alt in cols[_COL_ALT].split(","):
+                        add_key(alt, row)
+
+        if alias_path:
+            languages = set(alias_languages)
+            with open(alias_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    cols = line.rstrip("\n").split("\t")
+                    if len(cols) > 3 and cols[1] in rows and cols[2] in languages:
+                        add_key(cols[3], rows[cols[1]])
+
+        population = np.asarray(population, dtype=np.int64)
+        # 同名地点按人口降序排列，精确匹配时优先返回人口最多的地点
+        keys = sorted(set(keys), key=lambda kr: (kr[0], -population[kr[1]]))
+
+        os.makedirs(index_dir, exist_ok=True)
+        cls._write_strings(index_dir, "keys", [k for k, _ in keys], "key_offsets")
+        np.save(os.path.join(index_dir, "key_rows.npy"), np.asarray([r for _, r in keys], dtype=np.int32))
+        cls._write_strings(index_dir, "names", names, "name_offsets")
+        np.save(os.path.join(index_dir, "coords.npy"), np.asarray(coords, dtype=np.float32).reshape(-1, 2))
+        np.save(os.path.join(index_dir, "population.npy"), population)
+        with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"sources": cls._source_signature(tsv_paths, alias_path),
+                       "places": len(names), "keys": len(keys)}, f, ensure_ascii=False)
+        return cls(index_dir)
+
+    @staticmethod
+    def _write_strings(index_dir, name, strings, offsets_name):
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        with open(os.path.join(index_dir, f"{name}.bin"), "wb") as f:
+            for b in encoded:
+                f.write(b)
+            # np.memmap 不能映射空文件
+            if not encoded:
+                f.write(b"\0")
+        np.save(os.path.join(index_dir, f"{offsets_name}.npy"), offsets)
+
+    @staticmethod
+    def _source_signature(tsv_paths, alias_path=None):
+        paths = list(tsv_paths) + ([alias_path] if alias_path else [])
+        return [[os.path.abspath(p), os.path.getsize(p), int(os.path.getmtime(p))] for p in paths]
+
+    @classmethod
+    def open_or_build(cls, tsv_paths, index_dir: str, alias_path: str = None):
+        """
+        打开已有索引，源文件变化或索引不存在时重新构建；源文件不存在时直接使用已有索引，
+        两者都不存在时抛出 FileNotFoundError
+        """
+        if isinstance(tsv_paths, str):
+            tsv_paths = [tsv_paths]
+        meta_path = os.path.join(index_dir, "meta.json")
+        paths = list(tsv_paths) + ([alias_path] if alias_path else [])
+        missing = [p for p in paths if not os.path.exists(p)]
+        if os.path.exists(meta_path):
+            if missing:
+                return cls(index_dir)
+            with open(meta_path, "r", encoding="utf-8") as f:
+                sources = json.load(f).get("sources")
+            if sources == cls._source_signature(tsv_paths, alias_path):
+                return cls(index_dir)
+        if missing:
+            raise FileNotFoundError(f"GeoNames source not found: {', '.join(missing)}")
+        return cls.build(tsv_paths, index_dir, alias_path=alias_path)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+    def _key(self, i: int) -> str:
+        return bytes(self._keys[self._key_offsets[i]:self._key_offsets[i + 1]]).decode("utf-8")
+
+    def _lower_bound(self, key: str) -> int:
+        lo, hi = 0, len(self._key_rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _place(self, row: int) -> dict:
+        lat, lon = self._coords[row]
+        name = bytes(self._names[self._name_offsets[row]:self._name_offsets[row + 1]]).decode("utf-8")
+        return {
+            'latitude': float(lat),
+            'longitude': float(lon),
+            'address': name,
+            'population': int(self._population[row]),
+        }
+
+    def lookup(self, name: str):
+        """
+        精确匹配地名(含别名、中文名)，同名时返回人口最多的地点
+
+        Returns:
+            dict | None: 地点信息，未找到返回 None
+        """
+        key = GeocodeCache.normalize(name)
+        i = self._lower_bound(key)
+        if i < len(self._key_rows) and self._key(i) == key:
+            return self._place(int(self._key_rows[i]))
+        return None
+
+    def prefix(self, prefix: str, limit: int = 10) -> list:
+        """
+        前缀匹配地名，按人口降序返回至多 limit 个地点
+        """
+        key = GeocodeCache.normalize(prefix)
+        rows = {}
+        i = self._lower_bound(key)
+        # 扫描范围设上限，避免过短的前缀遍历整个索引
+        while i < len(self._key_rows) and len(rows) < limit * 20:
+            if not self._key(i).startswith(key):
+                break
+            row = int(self._key_rows[i])
+            rows.setdefault(row, self._population[row])
+            i += 1
+        best = sorted(rows, key=lambda r: -rows[r])[:limit]
+        return [self._place(r) for r in best]
+
+    def geocode(self, address: str):
+        """
+        解析地址：先整体精确匹配，再依次尝试逗号分隔的各部分(从最具体的开始)
+        """
+        place = self.lookup(address)
+        if place is None:
+            for part in str(address).split(","):
+                if part.strip() and part.strip() != address:
+                    place = self.lookup(part)
+                    if place is not None:
+                        break
+        return place
+
+    @staticmethod
+    def _to_xyz(lat, lon):
+        lat, lon = np.radians(lat), np.radians(lon)
+        return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+    def _get_tree(self):
+        with self._tree_lock:
+            if self._tree is None:
+                from scipy.spatial import cKDTree
+                coords = np.asarray(self._coords, dtype=np.float64)
+                self._tree = cKDTree(self._to_xyz(coords[:, 0], coords[:, 1]))
+            return self._tree
+
+    def nearest(self, latitude: float, longitude: float, max_distance_km: float = None):
+        """
+        查询距离给定坐标最近的地点
+
+        Returns:
+            dict | None: 地点信息(附带 distance_km)，超出 max_distance_km 时返回 None
+        """
+        if len(self) == 0:
+            return None
+        chord, row = self._get_tree().query(self._to_xyz(latitude, longitude))
+        distance_km = 2 * _EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+        if max_distance_km is not None and distance_km > max_distance_km:
+            return None
+        place = self._place(int(row))
+        place['distance_km'] = round(distance_km, 3)
+        return place
+
+
+# 默认的 GeoNames 数据与索引位置，可通过环境变量修改
+GAZETTEER_SOURCE = os.getenv("GAZETTEER_SOURCE", "./geodata/cities15000.txt")
+GAZETTEER_ALIASES = os.getenv("GAZETTEER_ALIASES", "")
+GAZETTEER_DIR = os.getenv("GAZETTEER_DIR", "./geodata/gazetteer_index")
+
+_gazetteers = {}
+_gazetteers_lock = threading.Lock()
+
+
+def get_gazetteer(source: str = GAZETTEER_SOURCE, index_dir: str = GAZETTEER_DIR, alias_path: str = GAZETTEER_ALIASES):
+    """
+    获取进程内共享的离线地名索引
+    """
+    with _gazetteers_lock:
+        gazetteer = _gazetteers.get(index_dir)
+        if gazetteer is None:
+            sources = [p for p in source.split(os.pathsep) if p]
+            gazetteer = Gazetteer.open_or_build(sources, index_dir, alias_path=alias_path or None)
+            _gazetteers[index_dir] = gazetteer
+        return gazetteer
@@ -0,0 +1,104 @@
+import json
+import time
+import threading
+import unicodedata
+from utils.sqlite_store import SqliteStore
+
+
+class GeocodeCache(SqliteStore):
+    """
+    基于 SQLite 的地理编码持久化缓存。
+
+    键为 (规范化地址, 服务商, 语言)，命中结果保存 ttl 秒，
+    "未找到" 之类的否定结果只保存 negative_ttl 秒。
+    """
+
+    def __init__(self, path: str = './storage/geocode_cache.sqlite', ttl: float = 30 * 24 * 3600,
+                 negative_ttl: float = 24 * 3600):
+        super().__init__(path)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " address TEXT NOT NULL, provider TEXT NOT NULL, language TEXT NOT NULL,"
+                " result TEXT NOT NULL, found INTEGER NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (address, provider, language))"
+            )
+
+    @staticmethod
+    def normalize(address: str) -> str:
+        """
+        规范化地址：统一全角半角、大小写并压缩空白
+        """
+        address = unicodedata.normalize("NFKC", str(address))
+        return " ".join(address.lower().split())
+
+    def get(self, address: str, provider: str, language: str = ''):
+        """
+        查询缓存
+
+        Returns:
+            dict | None: 命中时返回缓存的地理编码结果，未命中或已过期返回 None
+        """
+        row = self._conn().execute(
+            "SELECT result, expires_at FROM geocode WHERE address=? AND provider=? AND language=?",
+            (self.normalize(address), provider, language or ''),
+        ).fetchone()
+        hit = row is not None and row[1] > time.time()
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(row[0]) if hit else None
+
+    def set(self, address: str, provider: str, result: dict, language: str = '', found: bool = True):
+        """
+        写入缓存，found=False 时按否定结果使用较短的过期时间
+        """
+        ttl = self.ttl if found else self.negative_ttl
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO geocode (address, provider, language, result, found, expires_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.normalize(address), provider, language or '',
+                 json.dumps(result, ensure_ascii=False), int(found), time.time() + ttl),
+            )
+
+    def purge_expired(self) -> int:
+        """
+        删除所有过期条目，返回删除数量
+        """
+        conn = self._conn()
+        with conn:
+            return conn.execute("DELETE FROM geocode WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def get_geocode_cache(path: str = './storage/geocode_cache.sqlite') -> GeocodeCache:
+    """
+    获取进程内共享的缓存实例，多个会话共用同一组命中计数
+    """
+    with _shared_lock:
+        cache = _shared_caches.get(path)
+        if cache is None:
+            cache = _shared_caches[path] = GeocodeCache(path)
+        return cache
@@ -1,23 +1,56 @@
 # # utils.py
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
 from geopy.geocoders import Nominatim, BaiduV3
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+from geopy.exc import GeocoderTimedOut, GeocoderServiceError, GeocoderRateLimited, GeocoderUnavailable
+from utils.geocode_cache import get_geocode_cache, GeocodeCache
+from utils.rate_limiter import get_bucket
+from utils.gazetteer import get_gazetteer
 
 class GeocodeUtils:
-    def __init__(self, user_agent="GISerLiu", api_type="free", baidu_key=None):
+    def __init__(self, user_agent="GISerLiu", api_type="free", baidu_key=None, language=None, cache=None, use_cache=True, max_retries=3,
+                 gazetteer=None, fallback_type="free", offline_radius_km=50):
         """
         初始化GeocodeUtils类，设置用户代理和API类型。
         
         Parameters:
         user_agent (str): 用户代理字符串，默认为"GISerLiu"。
-        api_type (str): API类型，"free"使用Nominatim，"baidu"使用百度API。
+        api_type (str): API类型，"free"使用Nominatim，"baidu"使用百度API，"offline"使用本地GeoNames地名索引。
         baidu_key (str): 百度API的密钥，当api_type为"baidu"时需要提供。
+        language (str): 返回结果的语言，仅Nominatim支持，默认为None。
+        cache (GeocodeCache): 地理编码缓存，默认使用进程内共享的SQLite缓存。
+        use_cache (bool): 是否启用缓存，默认为True。
+        max_retries (int): 超时或被限流时的最大重试次数，默认为3。
+        gazetteer (Gazetteer): 离线地名索引，api_type为"offline"时默认加载共享索引。
+        fallback_type (str): 离线索引未命中时使用的在线API类型，"free"、"baidu"或None(不回退)。
+        offline_radius_km (float): 离线反向地理编码的最大匹配距离(公里)，默认为50。
         """
         self.api_type = api_type
+        self.max_retries = max_retries
+        self.language = language
+        self.cache = (cache or get_geocode_cache()) if use_cache else None
+        self.gazetteer = None
+        self.offline_radius_km = offline_radius_km
+        # provider为实际请求的在线服务商，离线模式下为回退服务商
+        self.provider = api_type
+        if api_type == "offline":
+            self.provider = fallback_type
+            try:
+                self.gazetteer = gazetteer or get_gazetteer()
+            except (OSError, ValueError) as e:
+                # 地名数据或索引缺失、损坏时退回在线服务商，不中断文件处理
+                if fallback_type is None:
+                    raise
+                print(f"离线地名索引不可用，改用在线地理编码({fallback_type}): {e}")
+        self.bucket = get_bucket(self.provider)
         
-        if api_type == "free" and len(user_agent)>0:
+        if self.provider == "free" and len(user_agent)>0:
             self.geolocator = Nominatim(user_agent=user_agent)
-        elif api_type == "baidu" and baidu_key is not None:
+        elif self.provider == "baidu" and baidu_key is not None:
             self.geolocator = BaiduV3(api_key=baidu_key)
+        elif self.provider is None and self.gazetteer is not None:
+            self.geolocator = None
         else:
             raise ValueError("Invalid API type or missing Baidu API key")
 
@@ -31,18 +64,39 @@ class GeocodeUtils:
         Returns:
         dict: 包含纬度、经度和完整地址的字典。
         """
+        if self.gazetteer is not None:
+            place = self.gazetteer.geocode(address)
+            if place is not None:
+                return {
+                    'latitude': place['latitude'],
+                    'longitude': place['longitude'],
+                    'address': place['address']
+                }
+        if self.geolocator is None:
+            return {'error': 'Address not found'}
+        if self.cache is not None:
+            cached = self.cache.get(address, self.provider, self.language)
+            if cached is not None:
+                return cached
         try:
-            location = self.geolocator.geocode(address)
+            if self.provider == "free" and self.language:
+                location = self._request(self.geolocator.geocode, address, language=self.language)
+            else:
+                location = self._request(self.geolocator.geocode, address)
             if location:
-                return {
+                result = {
                     'latitude': location.latitude,
                     'longitude': location.longitude,
                     'address': location.address
                 }
             else:
-                return {'error': 'Address not found'}
+                result = {'error': 'Address not found'}
         except (GeocoderTimedOut, GeocoderServiceError) as e:
-            return {'error': str(e)}
+            # 超时和服务错误是暂时性的，不写入缓存，标记 retry 供调用方稍后重试
+            return {'error': str(e), 'retry': True}
+        if self.cache is not None:
+            self.cache.set(address, self.provider, result, self.language, found='error' not in result)
+        return result
 
     def reverse_geocode(self, latitude, longitude):
         """
@@ -55,18 +109,82 @@ class GeocodeUtils:
         Returns:
         dict: 包含完整地址、纬度和经度的字典。
         """
+        if self.gazetteer is not None:
+            place = self.gazetteer.nearest(latitude, longitude, max_distance_km=self.offline_radius_km)
+            if place is not None:
+                return {
+                    'address': place['address'],
+                    'latitude': place['latitude'],
+                    'longitude': place['longitude']
+                }
+        if self.geolocator is None:
+            return {'error': 'Location not found'}
+        # 坐标保留5位小数(约1米)作为缓存键
+        cache_key = f"reverse:{float(latitude):.5f},{float(longitude):.5f}"
+        if self.cache is not None:
+            cached = self.cache.get(cache_key, self.provider, self.language)
+            if cached is not None:
+                return cached
         try:
-            location = self.geolocator.reverse((latitude, longitude), exactly_one=True)
+            location = self._request(self.geolocator.reverse, (latitude, longitude), exactly_one=True)
             if location:
-                return {
+                result = {
                     'address': location.address,
                     'latitude': location.latitude,
                     'longitude': location.longitude
                 }
             else:
-                return {'error': 'Location not found'}
+                result = {'error': 'Location not found'}
         except (GeocoderTimedOut, GeocoderServiceError) as e:
             return {'error': str(e)}
+        if self.cache is not None:
+            self.cache.set(cache_key, self.provider, result, self.language, found='error' not in result)
+        return result
+
+    def geocode_many(self, addresses, max_workers=4):
+        """
+        批量地理编码，输入去重后在服务商令牌桶限速下并发请求。
+        
+        Parameters:
+        addresses (list): 地址列表。
+        max_workers (int): 并发请求线程数，默认为4。
+        
+        Returns:
+        list: 与输入顺序一致的地理编码结果列表。
+        """
+        unique = {}
+        for address in addresses:
+            unique.setdefault(GeocodeCache.normalize(address), address)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as executor:
+            results = dict(zip(unique.keys(), executor.map(self.geocode, unique.values())))
+        return [results[GeocodeCache.normalize(address)] for address in addresses]
+
+    def _request(self, func, *args, **kwargs):
+        """
+        在令牌桶限速下调用服务商接口，超时、限流和服务暂不可用时指数退避重试。
+        """
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                return func(*args, **kwargs)
+            except GeocoderRateLimited as e:
+                if attempt == self.max_retries:
+                    raise
+                # 由令牌桶暂停发放令牌，下一次 acquire 即会等待，同时约束共用该桶的其他线程，不再额外休眠
+                delay = e.retry_after or 2 ** attempt
+                self.bucket.penalize(delay * (1 + random.random() * 0.25))
+                continue
+            except (GeocoderTimedOut, GeocoderUnavailable):
+                if attempt == self.max_retries:
+                    raise
+                delay = 2 ** attempt
+            time.sleep(delay * (1 + random.random() * 0.25))
+
+    def cache_stats(self):
+        """
+        返回缓存命中统计，未启用缓存时返回None。
+        """
+        return self.cache.stats() if self.cache is not None else None
 
 # 使用示例
 # 百度API需要提供密钥
@@ -74,3 +192,6 @@ class GeocodeUtils:
 
 # 免费Nominatim API
 # geocode_utils = GeocodeUtils(api_type="free")
+
+# 离线GeoNames地名索引，未命中时回退到Nominatim
+# geocode_utils = GeocodeUtils(api_type="offline", fallback_type="free")
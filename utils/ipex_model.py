@@ -0,0 +1,58 @@
+import threading
+from utils.model_registry import get_registry, RegistryKey
+
+
+class LockedModel:
+    """
+    模型代理：generate 和前向调用在同一把锁内执行，其余属性直接透传给原模型。
+
+    ModelBack 的生成/流式对话与 llama_index 的 IpexLLM 共用同一份权重，
+    CPU 上的 int4 模型不支持多个 generate 同时运行，因此在这里统一串行化。
+    """
+
+    def __init__(self, model, lock):
+        object.__setattr__(self, "_model", model)
+        object.__setattr__(self, "_lock", lock)
+
+    def generate(self, *args, **kwargs):
+        with self._lock:
+            return self._model.generate(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            return self._model(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._model, name, value)
+
+
+class SharedIpexModel:
+    """
+    进程内唯一的 int4 Qwen2 模型和分词器
+    """
+
+    def __init__(self, model_path: str):
+        from ipex_llm.transformers import AutoModelForCausalLM
+        from transformers import AutoTokenizer
+
+        self.model_path = model_path
+        # 可重入锁：同一线程内 generate 调用前向时不会自锁
+        self.lock = threading.RLock()
+        raw_model = AutoModelForCausalLM.load_low_bit(model_path, trust_remote_code=True)
+        self.model = LockedModel(raw_model, self.lock)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
+
+    def close(self):
+        object.__setattr__(self.model, "_model", None)
+        self.tokenizer = None
+
+
+def get_shared_ipex_model(model_path: str = 'models/qwen2chat_int4') -> SharedIpexModel:
+    """
+    获取共享的 int4 模型，ModelBack 和 RAG 中的 IpexLLM 都从这里取
+    """
+    return get_registry().get("ipex_model", RegistryKey("ipex_llm", model_path, ''),
+                              lambda: SharedIpexModel(model_path))
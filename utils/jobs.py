@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import threading
+
+
+class ExtractionJob:
+    """
+    可断点续跑的抽取任务，任务 ID 为上传文件内容的 SHA-256 加上切分配置的签名。
+
+    任务目录下保存三个文件：
+        manifest.json  任务信息(文件名、文本块总数、状态)
+        chunks.jsonl   每个文本块划分出的处理单元(split 模式为事件文本，single 模式为已抽取的事件属性)
+        events.jsonl   每个处理完成(已地理编码)的事件
+
+    检查点只追加写入，进程中途退出时最多丢失最后一行；重新打开任务后，
+    已完成的文本块和事件直接回放，只有未完成的部分需要重新调用 LLM 和地理编码。
+    失败的事件不写检查点，续跑时会重试。
+    """
+
+    def __init__(self, job_id: str, root: str = './storage/jobs', name: str = ''):
+        self.job_id = job_id
+        self.dir = os.path.join(root, job_id)
+        os.makedirs(self.dir, exist_ok=True)
+        self.manifest_path = os.path.join(self.dir, "manifest.json")
+        self.chunks_path = os.path.join(self.dir, "chunks.jsonl")
+        self.events_path = os.path.join(self.dir, "events.jsonl")
+        self._lock = threading.Lock()
+        self.manifest = self._read_manifest() or {
+            "job_id": job_id, "name": name, "created_at": time.time(), "total_chunks": None, "status": "running",
+        }
+        if name and not self.manifest.get("name"):
+            self.manifest["name"] = name
+        # 块序号 -> {"mode": ..., "units": [...]}
+        self.chunks = {}
+        # 块序号 -> {事件序号: 事件信息}
+        self.events = {}
+        for record in self._read_jsonl(self.chunks_path):
+            self.chunks[record["chunk"]] = {"mode": record["mode"], "units": record["units"]}
+        for record in self._read_jsonl(self.events_path):
+            if record.get("reset"):
+                self.events.pop(record["chunk"], None)
+            else:
+                self.events.setdefault(record["chunk"], {})[record["event"]] = record["info"]
+        for path in (self.chunks_path, self.events_path):
+            self._terminate(path)
+        self._write_manifest()
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except ValueError:
+            return None
+
+    def _write_manifest(self):
+        self.manifest["updated_at"] = time.time()
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _read_jsonl(path: str):
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line, strict=False)
+                except ValueError:
+                    # 中途退出时写了一半的行
+                    continue
+
+    @staticmethod
+    def _terminate(path: str):
+        """
+        补齐中途退出时写了一半的最后一行，之后追加的记录不会接在它后面而一起失效
+        """
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+    def _append(self, path: str, record: dict):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def chunk_record(self, chunk_idx: int):
+        """
+        返回文本块已记录的处理单元，未记录时返回 None
+        """
+        with self._lock:
+            return self.chunks.get(chunk_idx)
+
+    def done_events(self, chunk_idx: int) -> dict:
+        with self._lock:
+            return dict(self.events.get(chunk_idx, {}))
+
+    def _chunk_done(self, chunk_idx: int) -> bool:
+        record = self.chunks.get(chunk_idx)
+        if record is None:
+            return False
+        events = self.events.get(chunk_idx, {})
+        return all(i in events for i in range(len(record["units"])))
+
+    def is_chunk_done(self, chunk_idx: int) -> bool:
+        with self._lock:
+            return self._chunk_done(chunk_idx)
+
+    def reset_chunk(self, chunk_idx: int):
+        """
+        重新处理一个没有划分记录的文本块前，丢弃上次中断时留下的事件记录，
+        避免两次抽取的事件序号混在一起
+        """
+        with self._lock:
+            if self.events.pop(chunk_idx, None):
+                self._append(self.events_path, {"chunk": chunk_idx, "reset": True})
+
+    def record_chunk(self, chunk_idx: int, mode: str, units: list):
+        with self._lock:
+            self.chunks[chunk_idx] = {"mode": mode, "units": units}
+            self._append(self.chunks_path, {"chunk": chunk_idx, "mode": mode, "units": units})
+
+    def record_event(self, chunk_idx: int, event_idx: int, info: dict):
+        with self._lock:
+            self.events.setdefault(chunk_idx, {})[event_idx] = info
+            self._append(self.events_path, {"chunk": chunk_idx, "event": event_idx, "info": info})
+
+    def set_total(self, total_chunks: int):
+        with self._lock:
+            self.manifest["total_chunks"] = total_chunks
+            self._write_manifest()
+
+    def finish(self):
+        """
+        所有文本块都完成时把任务标记为 done
+        """
+        with self._lock:
+            total = self.manifest["total_chunks"]
+            if total is not None and all(self._chunk_done(idx) for idx in range(total)):
+                self.manifest["status"] = "done"
+            self._write_manifest()
+        return self.manifest["status"] == "done"
+
+    @property
+    def done(self) -> bool:
+        return self.manifest.get("status") == "done"
+
+    def progress(self) -> dict:
+        """
+        Returns:
+            dict: total_chunks、chunks_done、events_total(已知的事件数)、events_done
+        """
+        with self._lock:
+            chunks_done = sum(1 for idx in self.chunks if self._chunk_done(idx))
+            return {
+                "total_chunks": self.manifest["total_chunks"],
+                "chunks_done": chunks_done,
+                "events_total": sum(len(record["units"]) for record in self.chunks.values()),
+                "events_done": sum(
+                    sum(1 for i in range(len(record["units"])) if i in self.events.get(idx, {}))
+                    for idx, record in self.chunks.items()),
+            }
+
+    def iter_events(self):
+        """
+        按叙事顺序遍历检查点中已完成的事件
+        """
+        with self._lock:
+            chunk_ids = sorted(self.chunks)
+            events = [
+                self.events[idx][i]
+                for idx in chunk_ids
+                for i in range(len(self.chunks[idx]["units"]))
+                if i in self.events.get(idx, {})
+            ]
+        return iter(events)
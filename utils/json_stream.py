@@ -0,0 +1,75 @@
+import re
+import json
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+class JsonObjectStreamParser:
+    """
+    容错的流式 JSON 解析器。
+
+    逐段喂入模型输出，每当一个顶层 {...} 对象闭合时立即解析并返回，
+    不要求外层数组完整，因此可以边生成边消费。对代码块标记、对象间的
+    说明文字、尾随逗号以及被截断的最后一个对象都能容忍。
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.errors = 0
+
+    def feed(self, text: str) -> list:
+        """
+        喂入一段文本
+
+        Returns:
+            list: 本次新闭合并成功解析的对象
+        """
+        objects = []
+        for ch in text or "":
+            if self._depth == 0:
+                if ch == "{":
+                    self._depth = 1
+                    self._buffer = [ch]
+                continue
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = self._loads("".join(self._buffer))
+                    self._buffer = []
+                    if obj is not None:
+                        objects.append(obj)
+        return objects
+
+    def _loads(self, text: str):
+        for candidate in (text, _TRAILING_COMMA.sub(r"\1", text)):
+            try:
+                obj = json.loads(candidate, strict=False)
+                return obj if isinstance(obj, dict) else None
+            except json.JSONDecodeError:
+                continue
+        self.errors += 1
+        return None
+
+
+def iter_json_objects(chunks):
+    """
+    从文本片段流中逐个产出顶层 JSON 对象
+    """
+    parser = JsonObjectStreamParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
@@ -0,0 +1,254 @@
+import os
+import json
+import sqlite3
+import threading
+import contextlib
+from typing import Dict, List, Optional, Tuple
+from llama_index.core.storage.kvstore.types import BaseKVStore, DEFAULT_BATCH_SIZE, DEFAULT_COLLECTION
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.index_store.keyval_index_store import KVIndexStore
+from llama_index.core.storage.index_store.utils import index_struct_to_json, json_to_index_struct
+from llama_index.core.constants import DATA_KEY, TYPE_KEY
+from llama_index.core.data_structs.data_structs import IndexDict, IndexStruct
+from llama_index.core.data_structs.struct_type import IndexStructType
+from utils.sqlite_store import SqliteStore
+
+
+class SqliteKVStore(BaseKVStore, SqliteStore):
+    """
+    SQLite 键值存储，供 llama_index 的文档库和索引库使用。
+
+    与默认的 SimpleKVStore 不同，加载时不解析整个 JSON 文件，节点文本在查询
+    命中时按主键逐条读取。写入在当前线程的连接上累积为一个事务，commit 后
+    才对其他连接可见：索引同步途中正在进行的查询仍读到上一次提交的内容。
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        """
+        Args:
+            path (str): 数据库文件路径
+            read_only (bool): 只读模式忽略写入，构造时即打开一个读快照，所有线程共用这一个连接
+                (加锁串行读取)。在加载 FAISS 索引的同时构造，两者保持一致，之后的同步提交、
+                删除的节点都不可见；Streamlit 在新线程中执行的重跑读到的也是同一个快照。
+                加载索引时 llama_index 会把读到的索引结构原样写回，只读模式下不会因此开启写事务
+        """
+        SqliteStore.__init__(self, path)
+        self.read_only = read_only
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS kv ("
+                    " collection TEXT NOT NULL,"
+                    " key TEXT NOT NULL,"
+                    " value TEXT NOT NULL,"
+                    " PRIMARY KEY (collection, key)) WITHOUT ROWID"
+                )
+        finally:
+            conn.close()
+        if read_only:
+            self._open_snapshot()
+
+    def _open_snapshot(self) -> sqlite3.Connection:
+        # WAL 模式下读事务不阻塞写入，事务内的读取都基于开始时的快照
+        conn = self._connect(check_same_thread=False)
+        conn.execute("BEGIN")
+        conn.execute("SELECT 1 FROM kv LIMIT 1").fetchone()
+        self._snapshot = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _reading(self):
+        """
+        读取用的连接：只读模式为共用的快照连接(持锁期间独占)，否则为当前线程的连接
+        """
+        if not self.read_only:
+            yield self._conn()
+            return
+        with self._snapshot_lock:
+            yield self._snapshot or self._open_snapshot()
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        if self.read_only:
+            return
+        self._conn().execute("INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)",
+                             (collection, key, json.dumps(val, ensure_ascii=False)))
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection=collection)
+
+    def put_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        if self.read_only:
+            return
+        self._conn().executemany("INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)",
+                                 [(collection, key, json.dumps(val, ensure_ascii=False)) for key, val in kv_pairs])
+
+    async def aput_all(self, kv_pairs: List[Tuple[str, dict]], collection: str = DEFAULT_COLLECTION,
+                       batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.put_all(kv_pairs, collection=collection, batch_size=batch_size)
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        with self._reading() as conn:
+            row = conn.execute("SELECT value FROM kv WHERE collection = ? AND key = ?", (collection, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection=collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        with self._reading() as conn:
+            rows = conn.execute("SELECT key, value FROM kv WHERE collection = ?", (collection,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection=collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        if self.read_only:
+            return False
+        cursor = self._conn().execute("DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key))
+        return cursor.rowcount > 0
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection=collection)
+
+    def keys_containing(self, terms: List[str], collection: str = DEFAULT_COLLECTION,
+                        keys: Optional[List[str]] = None) -> List[str]:
+        """
+        值中包含任一关键词的键(逐行子串匹配)；传入 keys 时只匹配这些键，按主键逐条读取，
+        不扫描整个集合
+        """
+        terms = [term for term in terms if term]
+        if not terms or keys is not None and not keys:
+            return []
+        where = f"collection = ? AND ({' OR '.join('instr(value, ?) > 0' for _ in terms)})"
+        params = [collection, *terms]
+        if keys is not None:
+            # 键列表作为一个 JSON 参数传入，不受 SQL 参数个数限制
+            where += " AND key IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(keys)))
+        with self._reading() as conn:
+            rows = conn.execute(f"SELECT key FROM kv WHERE {where}", params).fetchall()
+        return [key for key, in rows]
+
+    def clear(self) -> None:
+        """
+        删除全部数据(在当前事务中，commit 后生效)
+        """
+        if self.read_only:
+            return
+        self._conn().execute("DELETE FROM kv")
+
+    def empty(self) -> bool:
+        with self._reading() as conn:
+            return conn.execute("SELECT 1 FROM kv LIMIT 1").fetchone() is None
+
+    def commit(self) -> None:
+        if self.read_only:
+            return
+        self._conn().commit()
+
+    def close(self) -> None:
+        """
+        关闭当前线程的连接，未提交的写入被丢弃；只读模式关闭共用的快照连接。
+        之后的访问会重新打开连接(只读模式为新的快照)
+        """
+        SqliteStore.close(self)
+        with self._snapshot_lock:
+            if self._snapshot is not None:
+                self._snapshot.close()
+                self._snapshot = None
+
+    def import_json(self, path: str) -> int:
+        """
+        导入 SimpleKVStore 持久化的 JSON 文件(旧版 docstore.json、index_store.json)并提交
+
+        Returns:
+            int: 导入的键数
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        count = 0
+        for collection, values in data.items():
+            self.put_all(list(values.items()), collection=collection)
+            count += len(values)
+        self.commit()
+        return count
+
+
+class SqliteDocumentStore(KVDocumentStore):
+    """
+    基于 SqliteKVStore 的文档库；persist 时提交事务，不写 JSON 文件
+    """
+
+    def persist(self, persist_path: str = None, fs=None) -> None:
+        self._kvstore.commit()
+
+    def node_ids_containing(self, terms: List[str], node_ids: Optional[List[str]] = None) -> List[str]:
+        """
+        文本中提到任一关键词(如地名)的节点 ID，传入 node_ids 时只在这些节点中查找
+        """
+        return self._kvstore.keys_containing(terms, collection=self._node_collection, keys=node_ids)
+
+    def file_node_ids(self) -> Dict[str, List[str]]:
+        """
+        每个源文件(绝对路径)的节点 ID，来自文档的 ref_doc_info
+        """
+        nodes = {}
+        for info in (self.get_all_ref_doc_info() or {}).values():
+            path = (info.metadata or {}).get("file_path")
+            if path:
+                nodes.setdefault(os.path.abspath(path), []).extend(info.node_ids)
+        return nodes
+
+
+def _index_struct_to_json(index_struct: IndexStruct) -> dict:
+    # IndexDict 的字段都是普通 dict，直接用 json 序列化，比 dataclasses_json 逐项转换快两个数量级；格式与其一致
+    if type(index_struct) is not IndexDict:
+        return index_struct_to_json(index_struct)
+    return {TYPE_KEY: index_struct.get_type(),
+            DATA_KEY: json.dumps({"index_id": index_struct.index_id, "summary": index_struct.summary,
+                                  "nodes_dict": index_struct.nodes_dict, "doc_id_dict": index_struct.doc_id_dict,
+                                  "embeddings_dict": index_struct.embeddings_dict}, ensure_ascii=False)}
+
+
+def _json_to_index_struct(struct_dict: dict) -> IndexStruct:
+    if struct_dict[TYPE_KEY] != IndexStructType.VECTOR_STORE:
+        return json_to_index_struct(struct_dict)
+    data = json.loads(struct_dict[DATA_KEY])
+    index_struct = IndexDict(index_id=data["index_id"], summary=data.get("summary"))
+    index_struct.nodes_dict = data.get("nodes_dict") or {}
+    index_struct.doc_id_dict = data.get("doc_id_dict") or {}
+    index_struct.embeddings_dict = data.get("embeddings_dict") or {}
+    return index_struct
+
+
+class SqliteIndexStore(KVIndexStore):
+    """
+    基于 SqliteKVStore 的索引结构库；persist 时提交事务，不写 JSON 文件。
+
+    每次插入文档 VectorStoreIndex 都会整体写回索引结构，这里对 IndexDict 走快速的序列化路径，
+    只读存储则直接跳过写回。
+    """
+
+    def add_index_struct(self, index_struct: IndexStruct) -> None:
+        if self._kvstore.read_only:
+            return
+        self._kvstore.put(index_struct.index_id, _index_struct_to_json(index_struct), collection=self._collection)
+
+    def get_index_struct(self, struct_id: Optional[str] = None) -> Optional[IndexStruct]:
+        if struct_id is None:
+            structs = self.index_structs()
+            assert len(structs) == 1
+            return structs[0]
+        data = self._kvstore.get(struct_id, collection=self._collection)
+        return _json_to_index_struct(data) if data is not None else None
+
+    def index_structs(self) -> List[IndexStruct]:
+        return [_json_to_index_struct(data) for data in self._kvstore.get_all(collection=self._collection).values()]
+
+    def persist(self, persist_path: str = None, fs=None) -> None:
+        self._kvstore.commit()
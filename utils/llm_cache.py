@@ -0,0 +1,108 @@
+import json
+import time
+import threading
+from utils.sqlite_store import SqliteStore, content_hash
+
+
+class LLMCache(SqliteStore):
+    """
+    基于内容寻址的 LLM 响应缓存。
+
+    键为 (后端类型, 模型, 提示词模板版本, 输入文本, 生成参数) 的 SHA-256，
+    值为模型的完整输出。数据库总大小超过 max_bytes 时按最近访问时间淘汰(LRU)。
+    """
+
+    def __init__(self, path: str = './storage/llm_cache.sqlite', max_bytes: int = 512 * 1024 * 1024):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)")
+
+    @staticmethod
+    def make_key(model_type: str, model_id: str, template: str, text: str, params: dict = None) -> str:
+        """
+        计算缓存键
+        """
+        payload = json.dumps([model_type, model_id, template, text, params or {}],
+                             ensure_ascii=False, sort_keys=True)
+        return content_hash(payload)
+
+    def get(self, key: str):
+        """
+        查询缓存，命中时刷新访问时间
+
+        Returns:
+            str | None: 缓存的模型输出
+        """
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM responses WHERE key=?", (key,)).fetchone()
+        with self._stats_lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET last_access=? WHERE key=?", (time.time(), key))
+        return row[0]
+
+    def set(self, key: str, value: str):
+        """
+        写入缓存，超出容量时淘汰最久未访问的条目
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - self.max_bytes)
+
+    def delete(self, key: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM responses WHERE key=?", (key,))
+
+    @staticmethod
+    def _evict(conn, excess: int):
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM responses WHERE key=?", victims)
+
+    def stats(self) -> dict:
+        row = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": row[0], "bytes": row[1]}
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def get_llm_cache(path: str = './storage/llm_cache.sqlite') -> LLMCache:
+    """
+    获取进程内共享的 LLM 响应缓存
+    """
+    with _shared_lock:
+        cache = _shared_caches.get(path)
+        if cache is None:
+            cache = _shared_caches[path] = LLMCache(path)
+        return cache
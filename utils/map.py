@@ -1,4 +1,7 @@
 import folium
+from folium.plugins import MarkerCluster, PolyLineTextPath
+from branca.element import MacroElement
+from jinja2 import Template
 import streamlit as st
 from streamlit_folium import st_folium
 from shapely.geometry import Point, LineString
@@ -6,15 +9,72 @@ import geopandas as gpd
 import json
 from io import BytesIO
 import math
+from utils.spatial_index import event_location
+
+# markers: 每个事件一个 Marker 和内联弹窗，每段路线一个箭头(原有方式)
+# cluster: 全部事件作为一个 GeoJSON 图层在浏览器端聚合，弹窗点击时才生成，路线箭头沿线绘制
+RENDER_MODES = ("markers", "cluster")
+# markers 方式下路线上最多绘制的方向箭头数
+MAX_ARROWS = 500
+
+
+class EventGeoJson(MacroElement):
+    """
+    以一份 GeoJSON 数据添加全部事件标记，放在 MarkerCluster 下由浏览器端聚合；
+    弹窗内容在点击时由要素属性生成，页面中不为每个事件预先生成 HTML
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            L.geoJSON({{ this.data }}, {
+                onEachFeature: function (feature, layer) {
+                    layer.bindPopup(function () {
+                        var d = feature.properties.description;
+                        var div = document.createElement("div");
+                        div.style.cssText = "max-height: 200px; overflow-y: auto; font-size: 16px; line-height: 1.5;";
+                        var title = document.createElement("b");
+                        title.textContent = d.title;
+                        div.appendChild(title);
+                        [["事件类型", d.type], ["内容", d.content], ["关键词", d.keys]].forEach(function (row) {
+                            var label = document.createElement("strong");
+                            label.textContent = row[0];
+                            div.appendChild(document.createElement("br"));
+                            div.appendChild(label);
+                            div.appendChild(document.createTextNode(": " + row[1]));
+                        });
+                        return div;
+                    }, {maxWidth: 400});
+                }
+            }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, features: list):
+        super().__init__()
+        self._name = "EventGeoJson"
+        # 渲染时才序列化，添加到地图后追加的事件同样会输出
+        self.features = features
+
+    @property
+    def data(self) -> str:
+        # 保留中文原文(tojson 会转义为 \\uXXXX，UTF-8 下体积约为原来的 2 倍)，只转义可能提前结束 <script> 的字符
+        data = json.dumps({"type": "FeatureCollection", "features": self.features}, ensure_ascii=False)
+        return data.replace("<", "\\u003c").replace(">", "\\u003e").replace("&", "\\u0026")
+
 
 class Map:
-    def __init__(self):
+    def __init__(self, render_mode="cluster"):
+        if render_mode not in RENDER_MODES:
+            raise ValueError(f"Unsupported render mode: {render_mode}, expected one of {RENDER_MODES}")
+        self.render_mode = render_mode
         self.tiles_options = {
             "CartoDB dark_matter": "CartoDB dark_matter",
             "OpenStreetMap": "OpenStreetMap",
             "CartoDB positron": "CartoDB positron",
         }
         self.map = None
+        # 事件标记和路线所在的图层，随视野变化整体替换，不重新加载底图
+        self.events_layer = None
         self.features = []
         self.locations = []
         
@@ -29,60 +89,86 @@ class Map:
                 self.map = folium.Map(location=map_center, zoom_start=2, tiles=self.tiles_options[selected_tile],attr = 'default',width=1200,
                 height=400)
                 # folium.LayerControl().add_to(self.map)
+                self.events_layer = folium.FeatureGroup(name="events")
+                if self.render_mode == "cluster":
+                    self.cluster = MarkerCluster(name="events_cluster").add_to(self.events_layer)
+                    EventGeoJson(self.features).add_to(self.cluster)
+                    # 事件图层在 st_folium 中单独渲染，插件脚本随底图加载
+                    for plugin in (MarkerCluster, PolyLineTextPath):
+                        for name, url in plugin.default_js:
+                            self.map.get_root().header.add_child(folium.JavascriptLink(url), name=name)
+                        for name, url in getattr(plugin, "default_css", []):
+                            self.map.get_root().header.add_child(folium.CssLink(url), name=name)
         else:
             print(f"Tile option {selected_tile} not found.")
         return self.map
 
-    def add_marker(self, info, coordinates):
-        try:
-            feature = {
-                "type": "Feature",
-                "properties": {
-                    "description": {
-                        "title": info["event_title"],
-                        "type": info["event_type"],
-                        "content": info["event_content"],
-                        "keys": info["keys"],
-                    }
-                },
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [coordinates["longitude"], coordinates["latitude"]]
+    @staticmethod
+    def event_feature(info, coordinates):
+        # 模型输出的事件可能缺少字段，缺失时留空，不影响其他事件的显示和导出
+        return {
+            "type": "Feature",
+            "properties": {
+                "description": {
+                    "title": info.get("event_title", ""),
+                    "type": info.get("event_type", ""),
+                    "content": info.get("event_content", ""),
+                    "keys": info.get("keys", []),
                 }
+            },
+            "geometry": {
+                "type": "Point",
+                "coordinates": [coordinates["longitude"], coordinates["latitude"]]
             }
-            self.locations.append([coordinates["latitude"], coordinates["longitude"]])
-            popup_content = f"""
-            <div style="max-height: 200px; overflow-y: auto; font-size: 16px; line-height: 1.5;">
-            <b>{feature["properties"]["description"]["title"]}</b><br>
-            <strong>事件类型</strong>: {feature["properties"]["description"]["type"]}<br>
-            <strong>内容</strong>: {feature["properties"]["description"]["content"]}<br>
-            <strong>关键词</strong>:: {feature["properties"]["description"]["keys"]}
-            </div>
-            """
-            folium.Marker(
-                location=[coordinates["latitude"], coordinates["longitude"]],
-                popup=folium.Popup(popup_content, max_width=400),
-                icon=folium.Icon(color='red')
-            ).add_to(self.map)
+        }
+
+    def add_marker(self, info, coordinates):
+        try:
+            feature = self.event_feature(info, coordinates)
+            # cluster 模式下标记由 EventGeoJson 在渲染时统一输出
+            if self.render_mode == "markers":
+                popup_content = f"""
+                <div style="max-height: 200px; overflow-y: auto; font-size: 16px; line-height: 1.5;">
+                <b>{feature["properties"]["description"]["title"]}</b><br>
+                <strong>事件类型</strong>: {feature["properties"]["description"]["type"]}<br>
+                <strong>内容</strong>: {feature["properties"]["description"]["content"]}<br>
+                <strong>关键词</strong>:: {feature["properties"]["description"]["keys"]}
+                </div>
+                """
+                folium.Marker(
+                    location=[coordinates["latitude"], coordinates["longitude"]],
+                    popup=folium.Popup(popup_content, max_width=400),
+                    icon=folium.Icon(color='red')
+                ).add_to(self.events_layer)
             self.locations.append([coordinates["latitude"], coordinates["longitude"]])
             self.features.append(feature)
         except Exception as exc:
             print(f"Error adding marker: {exc}")
 
-    def add_polyline(self, color="blue", weight=2.5, opacity=1, arrow=True):
+    def add_polyline(self, locations=None, color="blue", weight=2.5, opacity=1, arrow=True):
+        """
+        按事件顺序绘制路线；locations 默认为已添加的标记，标记经过视野筛选或抽稀时应传入完整路线
+        """
         # folium.PolyLine(self.locations, color=color, weight=weight, opacity=opacity).add_to(self.map)
-        if len(self.locations) > 1:
-            folium.PolyLine(self.locations, color=color, weight=weight, opacity=opacity).add_to(self.map)
+        locations = self.locations if locations is None else locations
+        if len(locations) > 1:
+            line = folium.PolyLine(locations, color=color, weight=weight, opacity=opacity).add_to(self.events_layer)
 
-            if arrow:
-                for i in range(len(self.locations) - 1):
-                    dx = self.locations[i + 1][0] - self.locations[i][0]
-                    dy = self.locations[i + 1][1] - self.locations[i][1]
+            if arrow and self.render_mode == "cluster":
+                # 箭头作为文字沿整条路线重复绘制，数量与事件数无关
+                PolyLineTextPath(line, "      ►      ", repeat=True, offset=5,
+                                 attributes={"fill": color, "font-size": "14"}).add_to(self.events_layer)
+            elif arrow:
+                # 每个箭头都是一个独立标记，路线很长时按间隔绘制
+                step = max(1, math.ceil((len(locations) - 1) / MAX_ARROWS))
+                for i in range(0, len(locations) - 1, step):
+                    dx = locations[i + 1][0] - locations[i][0]
+                    dy = locations[i + 1][1] - locations[i][1]
                     angle = -int(math.atan2(dx, dy) * 180 / math.pi)
 
                     mid_location = [
-                        (self.locations[i][0] + self.locations[i + 1][0]) / 2,
-                        (self.locations[i][1] + self.locations[i + 1][1]) / 2
+                        (locations[i][0] + locations[i + 1][0]) / 2,
+                        (locations[i][1] + locations[i + 1][1]) / 2
                     ]
 
                     folium.RegularPolygonMarker(
@@ -91,12 +177,18 @@ class Map:
                         number_of_sides=3,
                         radius=5,
                         rotation=angle
-                    ).add_to(self.map)
+                    ).add_to(self.events_layer)
 
 
-    def display(self, width=1200, height=400):
+    def display(self, width=1200, height=400, key="event_map"):
+        """
+        渲染地图，返回 st_folium 的视图状态(bounds、zoom、center)，未初始化时返回 None。
+        事件图层以 feature_group_to_add 传入，视野变化后只替换该图层，地图不会重新加载和复位
+        """
         if self.map is not None:
-            st_folium(self.map, width=width, height=height)
+            return st_folium(self.map, width=width, height=height, key=key,
+                             feature_group_to_add=self.events_layer,
+                             returned_objects=["bounds", "zoom", "center"])
         else:
             st.warning("Map is not initialized.")
 
@@ -107,10 +199,15 @@ class Map:
         else:
             st.warning("Map is not initialized.")
 
-    def export_geojson(self):
+    def export_geojson(self, events=None):
+        """
+        导出 GeoJSON；传入 events 时导出这些事件，否则导出已添加到地图上的标记
+        """
+        features = self.features if events is None else [
+            self.event_feature(info, info["geocode"]) for info in events if event_location(info) is not None]
         geojson_data = {
             "type": "FeatureCollection",
-            "features": self.features
+            "features": features
         }
         geojson_str = json.dumps(geojson_data, indent=2, ensure_ascii=False)  # 确保非 ASCII 字符不被转义
         b = BytesIO()
@@ -4,36 +4,24 @@ import re
 import json
 from datetime import datetime
 import torch
-from ipex_llm.transformers import AutoModelForCausalLM
-from transformers import AutoTokenizer,TextIteratorStreamer
+from transformers import AutoTokenizer,TextIteratorStreamer,LogitsProcessor,LogitsProcessorList
 from threading import Thread
+import threading
 import subprocess
+import time
+import copy
+from collections import OrderedDict
+from utils.ipex_model import get_shared_ipex_model
+from utils.json_stream import JsonObjectStreamParser
+from utils.llm_cache import LLMCache, get_llm_cache
+from utils.batching import DynamicBatcher
+from utils.speculative import prompt_lookup_generate
+from utils.event_store import EventStore
 
 # # 设置环境变量 OMP_NUM_THREADS 为 8，用于控制 OpenMP 线程数
 os.environ["OMP_NUM_THREADS"] = "8"
 
-
-class ModelBack:
-    def __init__(self, api_key: str = '', file_path: str = '../event_list.json', model_type: str = "deepseek", model_path: str = 'models/qwen2chat_int4'):
-        self.file_path = file_path
-        self.model_type = model_type
-        self.res = ''
-        self.model_path = model_path  # 指定模型路径
-
-        if self.model_type == 'deepseek':
-            base_url = "https://api.deepseek.com"
-            self.client = OpenAI(api_key=api_key, base_url=base_url)
-        elif self.model_type == 'ipex_llm':
-            if not self.check_model_exists(self.model_path):
-                
-                self.install_model()
-            self.model = AutoModelForCausalLM.load_low_bit(
-                model_path, trust_remote_code=True)
-            self.tokenizer = AutoTokenizer.from_pretrained(
-                model_path, trust_remote_code=True)
-
-    def get_event_list(self, text: str):
-        prompt = f'''
+EVENT_LIST_PROMPT = '''
             您是一名地理分析师，您的任务是分析给定的历史或新闻情报等文本，定位关注事件的内容，发生的位置，时间，相关的人物和历史事件，以文本中地点变化为决定性指标划分文本为单独的事件(包含地理位置(必须包含)，事件内容等信息(可选)，并且按照事件前后顺序排列；
             格式如下：
             ```
@@ -45,26 +33,13 @@ class ModelBack:
             好的，请根据以下用户输入的问题进行分析划分事件,严格完整输出，上面的案例只是格式举例，实际输出请根据以下的内容：
                 {text}
             '''
-        if self.model_type == 'deepseek':
 
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "您是一名地理事件划分师，您的任务是从文本中提取事件并进行划分。"},
-                    {"role": "user", "content": prompt},
-                ],
-                stream=False
-            )
-            eventList = ModelBack.split_event(response.choices[0].message.content)
-            return eventList
-        elif self.model_type == 'ipex_llm':
-            response = self.ipex_llm_generate(prompt)
-            print(response)
-            eventList = ModelBack.split_event(response)
-            return eventList
+# 本地模型的生成 token 上限：划分和单次抽取的输出是对输入文本的改写，按输入 token 数加格式开销估计；
+# 单个事件的属性(内容简介不超过 200 字)用固定上限，批量生成时短请求可以提前结束
+MAX_NEW_TOKENS = 8192
+PROCESS_EVENT_MAX_TOKENS = 1024
 
-    def process_event(self, event_text: str, language: str = '英语'):
-        prompt = f'''
+PROCESS_EVENT_PROMPT = '''
             您是一名地理分析师，您的任务是分析给定的历史或新闻情报，定位事件的内容，发生的位置，时间，相关的人物和历史事件，然后给出事件的地理描述，作为事件的属性信息。
             你要生成的内容要包裹在```event```中，案例格式如下，要包含以下字段：
             ```event
@@ -90,33 +65,376 @@ class ModelBack:
                 一定要符合上面要求，一个事件仅用一个地址来表达，不能同时用多个地址描述
             '''
 
+EXTRACT_EVENTS_PROMPT = '''
+            您是一名地理分析师，您的任务是分析给定的历史或新闻情报等文本，以文本中地点变化为决定性指标划分文本为单独的事件，并按照事件前后顺序排列，同时给出每个事件的属性信息。
+            输出一个json数组，数组中每个元素是一个事件对象，包含以下字段：
+            ```json
+            [
+                {{"event_title": "事件标题", "event_type": "事件类型", "address": "beijing", "event_content": "事件内容简介", "keys": ["关键词1", "关键词2"]}}
+            ]
+            ```
+            生成的address要求：
+            - 严格符合地理编码和OSM的命名规范，过去的地址使用现在的地址来表示；
+            - address要求真实地址，地图可查，不能是模糊的地名，例如 北京，而不是 北京周边；
+            - 严格要求一个事件的address仅用一个地址来表达，不能同时用多个地址描述,例如北京和上海；
+            - event_content部分是一个主要内容简介，限制200字内；
+            - 只输出json数组，不要输出其他内容。
+            好的，请根据以下用户输入的内容进行分析，address字段内容严格使用{language}输出，其他字段内容中文输出：
+                {text}
+            '''
+
+# 本地模型抽取时的解码参数：显式贪心解码，覆盖 Qwen2 generation_config 中的采样和重复惩罚，
+# 与投机解码(逐位取 argmax)的输出一致，也使缓存的响应可复现
+GREEDY_PARAMS = {"do_sample": False, "repetition_penalty": 1.0}
+
+# 提示词模板版本，修改模板内容后需要递增，使旧的缓存响应失效
+PROMPT_VERSIONS = {"event_list": 1, "process_event": 1, "extract_events": 1}
+
+EVENT_LIST_SYSTEM = "您是一名地理事件划分师，您的任务是从文本中提取事件并进行划分。"
+PROCESS_EVENT_SYSTEM = "您是一名地理事件分析技术专家，您的任务是从分析文本，定位地理信息并获取相关事件。"
+
+
+class _RowBudgetProcessor(LogitsProcessor):
+    """
+    批量生成时按行限制新生成的 token 数：超出各自预算的行强制输出 eos，
+    该行随即结束，不再影响其他行的生成。
+    """
+
+    def __init__(self, prompt_length: int, budgets: list, eos_token_id: int):
+        self.prompt_length = prompt_length
+        self.budgets = torch.tensor(budgets)
+        self.eos_token_id = eos_token_id
+
+    def __call__(self, input_ids, scores):
+        generated = input_ids.shape[1] - self.prompt_length
+        done = self.budgets.to(scores.device) <= generated
+        if done.any():
+            scores[done] = float("-inf")
+            scores[done, self.eos_token_id] = 0
+        return scores
+
+
+class ModelBack:
+    def __init__(self, api_key: str = '', file_path: str = '../event_list.json', model_type: str = "deepseek", model_path: str = 'models/qwen2chat_int4',
+                 cache_responses: bool = True, cache_path: str = './storage/llm_cache.sqlite',
+                 batch_size: int = 1, batch_window: float = 0.05, speculative: bool = False):
+        self.file_path = file_path
+        # 事件保存在与 file_path 同名的 SQLite 文件中，首次保存时创建并导入旧的 JSON
+        self.event_store_path = os.path.splitext(file_path)[0] + '.sqlite'
+        self._event_store = None
+        self._event_store_lock = threading.Lock()
+        self.model_type = model_type
+        self.res = ''
+        self.model_path = model_path  # 指定模型路径
+        self._stats_lock = threading.Lock()
+        self.extraction_stats = {
+            mode: {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_s": 0.0}
+            for mode in ("split", "single")
+        }
+        self.extraction_stats["single"].update({"events": 0, "legacy_calls": 0, "legacy_prompt_tokens": 0})
+        for stats in self.extraction_stats.values():
+            stats["cache_hits"] = 0
+        # 抽取类调用默认缓存，重复上传或中断后重跑时直接回放
+        self.llm_cache = get_llm_cache(cache_path) if cache_responses else None
+        # 参与缓存键计算的生成参数
+        if model_type == 'ipex_llm':
+            self.model_id = model_path
+            # 生成上限由提示词长度决定，不单独参与缓存键
+            self.generation_params = dict(GREEDY_PARAMS)
+        else:
+            self.model_id = "deepseek-chat"
+            self.generation_params = {}
+        self.batch_size = batch_size
+        self._batcher = None
+        # 固定提示词前缀的 KV 缓存：前缀文本 -> (前缀 token, past_key_values)
+        self._prefix_cache = OrderedDict()
+        self.prefix_cache_size = 8
+        # 提示词查找投机解码：抽取结果大量复制原文片段，草稿命中率高
+        self.speculative = speculative
+        self.speculative_stats = {}
+
+        if self.model_type == 'deepseek':
+            base_url = "https://api.deepseek.com"
+            self.client = OpenAI(api_key=api_key, base_url=base_url)
+        elif self.model_type == 'ipex_llm':
+            if not self.check_model_exists(self.model_path):
+                
+                self.install_model()
+            # 与 RAG 中的 IpexLLM 共用同一份模型权重
+            shared_model = get_shared_ipex_model(model_path)
+            self.model = shared_model.model
+            self.tokenizer = shared_model.tokenizer
+            self.model_lock = shared_model.lock
+            # batch_size > 1 时，并发到达的生成请求在 batch_window 秒内合并为一批
+            if batch_size > 1:
+                self._batcher = DynamicBatcher(self.generate_batch, batch_size, batch_window)
+                if speculative:
+                    print(f"投机解码只用于单独成批的请求，同批多条请求(批大小 {batch_size})按普通贪心解码批量生成")
+
+    @property
+    def max_concurrency(self) -> int:
+        """
+        后端可同时处理的请求数：本地模型为批大小，云端接口为 8
+        """
+        if self.model_type == 'ipex_llm':
+            return self.batch_size
+        return 8
+
+    @staticmethod
+    def template_prefix(template: str, placeholder: str, **kwargs) -> str:
+        """
+        取模板中 placeholder 之前的静态部分(截止到最后一个换行符，保证分词边界一致)
+        """
+        prefix = template.split("{" + placeholder + "}")[0].format(**kwargs)
+        return prefix[:prefix.rfind("\n") + 1]
+
+    def get_event_list(self, text: str):
+        prompt = EVENT_LIST_PROMPT.format(text=text)
+
+        def parse(response):
+            if self.model_type == 'ipex_llm':
+                print(response)
+            return ModelBack.split_event(response)
+
+        eventList = self._complete(prompt, EVENT_LIST_SYSTEM, mode="split", template="event_list",
+                                   prefix=self.template_prefix(EVENT_LIST_PROMPT, "text"),
+                                   max_new_tokens=self.output_budget(text, 256), parse=parse)
+        return eventList
+
+    def process_event(self, event_text: str, language: str = '英语'):
+        prompt = PROCESS_EVENT_PROMPT.format(event_text=event_text, language=language)
+
+        def parse(response):
+            if self.model_type == 'ipex_llm':
+                print("返回的事件", response)
+            return ModelBack.parse_event(response)
+
+        event = self._complete(prompt, PROCESS_EVENT_SYSTEM, mode="split", template="process_event",
+                               prefix=self.template_prefix(PROCESS_EVENT_PROMPT, "event_text", language=language),
+                               max_new_tokens=PROCESS_EVENT_MAX_TOKENS, parse=parse)
+        return event
+
+    def iter_extract_events(self, text: str, language: str = '英文', fallback: bool = True):
+        """
+        单次调用抽取一个文本块中的全部事件及其属性
+
+        Args:
+            text (str): 文本块
+            language (str): address 字段使用的语言
+            fallback (bool): 单次抽取没有得到任何事件时，是否回退到 get_event_list + process_event；
+                为 False 时生成中途出错会在产出已解析的事件后抛出异常，由调用方决定如何回退
+
+        Yields:
+            dict: 事件属性信息，字段与 process_event 的返回一致
+        """
+        prompt = EXTRACT_EVENTS_PROMPT.format(text=text, language=language)
+        parser = JsonObjectStreamParser()
+        completion = []
+        events = []
+        start = time.perf_counter()
+        info = {}
+        error = None
+        try:
+            for piece in self._stream_complete(prompt, EVENT_LIST_SYSTEM, template="extract_events", info=info,
+                                               max_new_tokens=self.output_budget(text, 512)):
+                completion.append(piece)
+                for event in parser.feed(piece):
+                    if "address" in event:
+                        events.append(event)
+                        yield event
+        except Exception as e:
+            print(f"单次抽取事件时出错: {e}")
+            error = e
+        # 完整生成且解析出事件的输出才写入缓存；出错或没有事件时续跑会重新生成。
+        # 回放的缓存没有事件(旧版本写入的无效输出)时删除，下次重新生成
+        if error is None and events:
+            self._cache_commit(info)
+        elif info.get("cached"):
+            self.llm_cache.delete(info["key"])
+        # 命中缓存时两种流程都不调用模型，只计入 cache_hits，不参与节省量的对比
+        if not info.get("cached"):
+            self._track("single", prompt, "".join(completion), time.perf_counter() - start)
+            # 按旧流程(1 次划分 + N 次属性抽取)估算本次节省的调用量
+            legacy_prompt = self.count_tokens(EVENT_LIST_PROMPT.format(text=text)) + sum(
+                self.count_tokens(PROCESS_EVENT_PROMPT.format(event_text=e.get("event_content", ""), language=language))
+                for e in events)
+            with self._stats_lock:
+                self.extraction_stats["single"]["legacy_calls"] += 1 + len(events)
+                self.extraction_stats["single"]["legacy_prompt_tokens"] += legacy_prompt
+                self.extraction_stats["single"]["events"] += len(events)
+
+        if error is not None and not fallback:
+            raise error
+        if not events and fallback:
+            for event_text in self.get_event_list(text) or []:
+                try:
+                    yield self.process_event(event_text, language=language)
+                except Exception as e:
+                    print(f"处理事件时出错: {e}")
+
+    def extract_events(self, text: str, language: str = '英文', fallback: bool = True) -> list:
+        return list(self.iter_extract_events(text, language=language, fallback=fallback))
+
+    def output_budget(self, text: str, overhead: int) -> int:
+        """
+        按输入文本估计输出的最大 token 数，只对本地模型生效
+        """
+        if self.model_type != 'ipex_llm':
+            return MAX_NEW_TOKENS
+        return min(MAX_NEW_TOKENS, self.count_tokens(text) + overhead)
+
+    def _cache_key(self, template: str, system_prompt: str, prompt: str) -> str:
+        return LLMCache.make_key(self.model_type, self.model_id, f"{template}@v{PROMPT_VERSIONS[template]}",
+                                 f"{system_prompt}\n{prompt}", self.generation_params)
+
+    def _cache_lookup(self, template: str, system_prompt: str, prompt: str, mode: str):
+        if self.llm_cache is None or template is None:
+            return None, None
+        key = self._cache_key(template, system_prompt, prompt)
+        cached = self.llm_cache.get(key)
+        if cached is not None:
+            with self._stats_lock:
+                self.extraction_stats[mode]["cache_hits"] += 1
+        return key, cached
+
+    def _complete(self, prompt: str, system_prompt: str, mode: str = "split", template: str = None,
+                  prefix: str = None, max_new_tokens: int = MAX_NEW_TOKENS, parse=None):
+        """
+        非流式调用当前后端并记录调用统计，返回 parse(响应)(未指定 parse 时为响应文本)；
+        指定 template 时读写响应缓存，只有 parse 成功且结果非空的响应才写入缓存，
+        解析失败的输出不会在续跑时被原样回放。指定 prefix 时本地模型复用该固定前缀的 KV 缓存，
+        max_new_tokens 为本地模型的生成上限
+        """
+        parse = parse or (lambda content: content)
+        key, cached = self._cache_lookup(template, system_prompt, prompt, mode)
+        if cached is not None:
+            try:
+                result = parse(cached)
+                if result:
+                    return result
+            except Exception as e:
+                print(f"缓存的响应无法解析，重新生成: {e}")
+        start = time.perf_counter()
         if self.model_type == 'deepseek':
             response = self.client.chat.completions.create(
                 model="deepseek-chat",
                 messages=[
-                    {"role": "system",
-                        "content": "您是一名地理事件分析技术专家，您的任务是从分析文本，定位地理信息并获取相关事件。"},
+                    {"role": "system", "content": system_prompt},
                     {"role": "user", "content": prompt},
                 ],
                 stream=False
             )
-            event = ModelBack.parse_event(response.choices[0].message.content)
-            return event
+            content = response.choices[0].message.content
         elif self.model_type == 'ipex_llm':
-            response = self.ipex_llm_generate(prompt)
-            print("返回的事件", response)
-            event = ModelBack.parse_event(response)
-            return event
+            content = self.ipex_llm_generate(prompt, max_new_tokens, prefix=prefix)
+        self._track(mode, prompt, content, time.perf_counter() - start)
+        result = parse(content)
+        if key is not None and result:
+            self.llm_cache.set(key, content)
+        return result
+
+    def _stream_complete(self, prompt: str, system_prompt: str, template: str = None, info: dict = None,
+                         max_new_tokens: int = MAX_NEW_TOKENS):
+        """
+        流式调用当前后端，逐段产出生成的文本；指定 template 时命中缓存直接回放。
+        生成的输出不直接写入缓存：完整生成后记录在 info 中，调用方解析成功后调用 _cache_commit。
+        info["cached"] 标记本次是否命中缓存
+        """
+        info = {} if info is None else info
+        key, cached = self._cache_lookup(template, system_prompt, prompt, "single")
+        info["key"] = key
+        info["cached"] = cached is not None
+        if cached is not None:
+            yield cached
+            return
+        completion = []
+        for piece in self._stream_backend(prompt, system_prompt, max_new_tokens):
+            completion.append(piece)
+            yield piece
+        info["completion"] = "".join(completion)
 
-    def ipex_llm_generate(self, prompt: str):
+    def _cache_commit(self, info: dict):
+        """
+        把 _stream_complete 完整生成的输出写入缓存
+        """
+        if info.get("key") is not None and info.get("completion") is not None:
+            self.llm_cache.set(info["key"], info["completion"])
+
+    def _stream_backend(self, prompt: str, system_prompt: str, max_new_tokens: int = MAX_NEW_TOKENS):
+        if self.model_type == 'deepseek':
+            stream = self.client.chat.completions.create(
+                model="deepseek-chat",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt},
+                ],
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        elif self.model_type == 'ipex_llm':
+            yield self.ipex_llm_generate(prompt, max_new_tokens)
+
+    def count_tokens(self, text: str) -> int:
+        """
+        统计文本 token 数：本地模型使用分词器，deepseek 按官方换算比例估算
+        (1 个中文字符约 0.6 token，1 个英文字符约 0.3 token)
+        """
+        if self.model_type == 'ipex_llm':
+            return len(self.tokenizer.encode(text))
+        cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff')
+        return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+    def _track(self, mode: str, prompt: str, completion: str, latency: float):
+        prompt_tokens = self.count_tokens(prompt)
+        completion_tokens = self.count_tokens(completion or "")
+        with self._stats_lock:
+            stats = self.extraction_stats[mode]
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+            stats["latency_s"] += latency
+
+    def extraction_report(self) -> dict:
+        """
+        对比单次抽取与旧流程的调用次数和 token(不含命中缓存的调用，单独计入 cache_hits)；
+        各模式实测的耗时见 single/split 中的 latency_s
+        """
+        with self._stats_lock:
+            single = dict(self.extraction_stats["single"])
+            split = dict(self.extraction_stats["split"])
+        report = {
+            "single": single,
+            "split": split,
+            "saved_calls": single["legacy_calls"] - single["calls"],
+            "saved_prompt_tokens": single["legacy_prompt_tokens"] - single["prompt_tokens"],
+            "cache_hits": single["cache_hits"] + split["cache_hits"],
+        }
+        return report
+
+    def ipex_llm_generate(self, prompt: str, max_new_tokens: int = MAX_NEW_TOKENS, prefix: str = None):
+        if self._batcher is not None:
+            return self._batcher.submit(prompt, max_new_tokens, prefix)
+        return self._generate_single(prompt, max_new_tokens, prefix)
+
+    def _generate_single(self, prompt: str, max_new_tokens: int = MAX_NEW_TOKENS, prefix: str = None):
+        """
+        单条生成：有可复用的静态前缀时在前缀 KV 缓存上继续生成
+        """
+        if prefix and prompt.startswith(prefix) and self.prefix_cache_size > 0:
+            return self._generate_with_prefix(prompt, prefix, max_new_tokens)
         messages = [{"role": "user", "content": prompt}]
-        with torch.inference_mode():
+        with self.model_lock, torch.inference_mode():
             text = self.tokenizer.apply_chat_template(
                 messages, tokenize=False, add_generation_prompt=True)
             model_inputs = self.tokenizer(
                 [text], return_tensors="pt").to('cpu')
+            if self.speculative:
+                return self.tokenizer.batch_decode(
+                    self._lookup_generate(model_inputs.input_ids, max_new_tokens), skip_special_tokens=True)[0]
             generated_ids = self.model.generate(
-                model_inputs.input_ids, max_new_tokens=8192)
+                model_inputs.input_ids, max_new_tokens=max_new_tokens, **GREEDY_PARAMS)
             processed_generated_ids = []
             for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids):
                 input_length = len(input_ids)
@@ -127,10 +445,131 @@ class ModelBack:
                 generated_ids, skip_special_tokens=True)[0]
         return response
 
+    def _lookup_generate(self, input_ids, max_new_tokens: int, past_key_values=None):
+        """
+        提示词查找投机解码，输出与贪心解码一致，调用方需持有 model_lock
+        """
+        eos_token_id = self.model.generation_config.eos_token_id or self.tokenizer.eos_token_id
+        return prompt_lookup_generate(
+            self.model, input_ids, max_new_tokens, eos_token_id,
+            past_key_values=past_key_values, stats=self.speculative_stats)
+
+    def _prefix_kv(self, prefix_text: str):
+        """
+        获取(必要时计算)固定前缀的 token 和 KV 缓存，调用方需持有 model_lock
+        """
+        entry = self._prefix_cache.get(prefix_text)
+        if entry is not None:
+            self._prefix_cache.move_to_end(prefix_text)
+            return entry
+        prefix_ids = self.tokenizer([prefix_text], return_tensors="pt").input_ids
+        outputs = self.model(prefix_ids, use_cache=True)
+        entry = (prefix_ids, outputs.past_key_values)
+        self._prefix_cache[prefix_text] = entry
+        if len(self._prefix_cache) > self.prefix_cache_size:
+            self._prefix_cache.popitem(last=False)
+        return entry
+
+    def _generate_with_prefix(self, prompt: str, prefix: str, max_new_tokens: int = MAX_NEW_TOKENS):
+        """
+        在预先计算好的前缀 KV 缓存上继续生成，只需预填充前缀之后的 token
+        """
+        messages = [{"role": "user", "content": prompt}]
+        with self.model_lock, torch.inference_mode():
+            text = self.tokenizer.apply_chat_template(
+                messages, tokenize=False, add_generation_prompt=True)
+            # 聊天模板会在提示词前添加系统消息等内容，它们也属于静态前缀
+            position = text.find(prompt)
+            if position < 0:
+                return self._generate_single(prompt, max_new_tokens)
+            split_at = position + len(prefix)
+            prefix_ids, past_key_values = self._prefix_kv(text[:split_at])
+            suffix_ids = self.tokenizer(
+                [text[split_at:]], return_tensors="pt", add_special_tokens=False).input_ids
+            input_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+            # 新版 Cache 对象在生成时会被原地追加，需要复制；旧版元组不会被修改
+            if not isinstance(past_key_values, tuple):
+                past_key_values = copy.deepcopy(past_key_values)
+            if self.speculative:
+                return self.tokenizer.batch_decode(
+                    self._lookup_generate(input_ids, max_new_tokens, past_key_values), skip_special_tokens=True)[0]
+            generated_ids = self.model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=past_key_values,
+                max_new_tokens=max_new_tokens,
+                **GREEDY_PARAMS)
+            response = self.tokenizer.batch_decode(
+                generated_ids[:, input_ids.shape[1]:], skip_special_tokens=True)[0]
+        return response
+
+    def generate_batch(self, prompts: list, max_new_tokens=MAX_NEW_TOKENS, prefixes: list = None) -> list:
+        """
+        批量生成，左侧填充后一次 generate 解码多个提示词。
+        左侧填充会把填充 token 插在共享前缀之前，前缀 KV 缓存无法复用，
+        因此只有一条请求的批直接走单条生成，复用前缀缓存
+
+        Args:
+            prompts (list): 提示词列表
+            max_new_tokens (int | list): 统一的或逐条的最大生成 token 数
+            prefixes (list): 逐条的静态前缀，可以为 None
+
+        Returns:
+            list: 与输入顺序一致的生成结果
+        """
+        if isinstance(max_new_tokens, int):
+            max_new_tokens = [max_new_tokens] * len(prompts)
+        prefixes = prefixes or [None] * len(prompts)
+        # 预算相近的请求放在同一批，避免一条长输出拖住整批
+        order = sorted(range(len(prompts)), key=lambda i: max_new_tokens[i])
+        batch_size = max(1, self.batch_size)
+        groups = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+        results = [None] * len(prompts)
+        with self.model_lock, torch.inference_mode():
+            for group in groups:
+                if len(group) == 1:
+                    i = group[0]
+                    results[i] = self._generate_single(prompts[i], max_new_tokens[i], prefixes[i])
+                    continue
+                for i, response in zip(group, self._generate_padded([prompts[i] for i in group],
+                                                                    [max_new_tokens[i] for i in group])):
+                    results[i] = response
+        return results
+
+    def _generate_padded(self, prompts: list, budgets: list) -> list:
+        """
+        左侧填充后一次 generate 解码一批提示词，调用方需持有 model_lock
+        """
+        padding_side = self.tokenizer.padding_side
+        self.tokenizer.padding_side = 'left'
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        try:
+            texts = [
+                self.tokenizer.apply_chat_template(
+                    [{"role": "user", "content": prompt}], tokenize=False, add_generation_prompt=True)
+                for prompt in prompts
+            ]
+            model_inputs = self.tokenizer(texts, return_tensors="pt", padding=True).to('cpu')
+            prompt_length = model_inputs.input_ids.shape[1]
+            generated_ids = self.model.generate(
+                model_inputs.input_ids,
+                attention_mask=model_inputs.attention_mask,
+                max_new_tokens=max(budgets),
+                pad_token_id=self.tokenizer.pad_token_id,
+                logits_processor=LogitsProcessorList([
+                    _RowBudgetProcessor(prompt_length, budgets, self.tokenizer.eos_token_id)]),
+                **GREEDY_PARAMS,
+            )
+            return self.tokenizer.batch_decode(generated_ids[:, prompt_length:], skip_special_tokens=True)
+        finally:
+            self.tokenizer.padding_side = padding_side
+
     def ipex_llm_generate_stream(self, messages, placeholder):
-        text = self.tokenizer.apply_chat_template(
-            messages, tokenize=False, add_generation_prompt=True)
-        model_inputs = self.tokenizer([text], return_tensors="pt")
+        with self.model_lock:
+            text = self.tokenizer.apply_chat_template(
+                messages, tokenize=False, add_generation_prompt=True)
+            model_inputs = self.tokenizer([text], return_tensors="pt")
         streamer = TextIteratorStreamer(
             self.tokenizer, skip_prompt=True, skip_special_tokens=True)
         generation_kwargs = dict(
@@ -164,6 +603,8 @@ class ModelBack:
         match = re.search(pattern, content, re.DOTALL)
         event = match.group(1) if match else content
         event = json.loads(event, strict=False)
+        if not isinstance(event, dict):
+            raise ValueError(f"事件属性不是 JSON 对象: {type(event).__name__}")
         return event
 
     @staticmethod
@@ -172,16 +613,34 @@ class ModelBack:
         events = [event.strip() for event in events if event.strip()]
         return events
 
-    def save_event(self, event):
+    @property
+    def event_store(self) -> EventStore:
+        with self._event_store_lock:
+            if self._event_store is None:
+                store = EventStore(self.event_store_path)
+                store.migrate_json(self.file_path)
+                self._event_store = store
+        return self._event_store
+
+    def save_event(self, event, document: str = ''):
+        """
+        追加保存一个事件，不再整体读写 event_list.json；需要 JSON 时调用 export_events
+        """
         event['create_time'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if os.path.exists(self.file_path):
-            with open(self.file_path, 'r', encoding='utf-8') as file:
-                events = json.load(file, strict=False)
-            events.append(event)
-        else:
-            events = [event]
-        with open(self.file_path, 'w', encoding='utf-8') as file:
-            json.dump(events, file, ensure_ascii=False)
+        return self.event_store.append(event, document=document)
+
+    def load_events(self, page: int = 0, page_size: int = 100, document: str = None, event_type: str = None) -> list:
+        return self.event_store.page(page, page_size, document=document, event_type=event_type)
+
+    def export_events(self, path: str = None, document: str = None):
+        """
+        按原来的列表格式导出事件，默认写回 file_path
+        """
+        path = path or self.file_path
+        # 导出会覆盖 file_path，先确保旧文件已经导入
+        store = self.event_store
+        store.export_json(path, document=document)
+        return path
 
     def check_model_exists(self, model_path: str) -> bool:
         """
@@ -0,0 +1,267 @@
+import os
+import time
+import threading
+import contextlib
+from collections import namedtuple
+
+
+# 注册表键：同一进程内 (model_type, model_path, api_key) 相同的后端只加载一次
+RegistryKey = namedtuple("RegistryKey", ["model_type", "model_path", "api_key"])
+
+
+def current_rss() -> int:
+    """
+    获取当前进程的常驻内存(RSS)，单位字节
+
+    Returns:
+        int: 常驻内存大小，无法获取时返回 0
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # macOS 上 ru_maxrss 单位为字节，Linux 上为 KB；这里只是峰值的近似
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+class _Entry:
+    def __init__(self, key: RegistryKey, value, load_time: float, rss_delta: int, deps=()):
+        self.key = key
+        self.value = value
+        self.load_time = load_time
+        self.rss_delta = rss_delta
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.hits = 0
+        # 加载时依赖的其他条目，以及依赖本条目且尚未释放的条目数
+        self.deps = list(deps)
+        self.refs = 0
+        # 正在使用本条目的租约数
+        self.leases = 0
+
+
+class ModelRegistry:
+    """
+    进程级模型/客户端注册表。
+
+    Streamlit 每次交互都会重新执行脚本，但已导入的模块会保留在进程中，
+    因此把加载好的模型挂在模块级注册表上即可在不同会话和重跑之间共享。
+
+    factory 内部再次调用 get 取得的条目(如 ModelBack 加载时取得的共享 int4 模型、
+    RAG 加载时取得的向量模型)记为该条目的依赖：依赖只在引用它的条目都被移除后
+    才会释放，不会因为自身的闲置时间而被提前关闭。
+
+    闲置时间只在 get 时刷新，长时间的抽取或对话期间不会再调用 get；使用期间
+    通过 lease 持有租约，持有租约的条目(连同它的依赖)不会被移除。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        # 每个线程正在执行的 factory 收集到的依赖(嵌套加载时为栈)
+        self._loading = threading.local()
+
+    def get(self, kind: str, key: RegistryKey, factory):
+        """
+        获取已加载的后端，不存在时调用 factory 加载一次
+
+        Args:
+            kind (str): 后端类别，例如 "model_back"、"rag"、"embedding"
+            key (RegistryKey): (model_type, model_path, api_key)
+            factory (callable): 无参加载函数
+
+        Returns:
+            object: 加载好的后端实例
+        """
+        full_key = (kind, key)
+        stack = getattr(self._loading, "stack", None)
+        if stack:
+            stack[-1].append(full_key)
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry is not None:
+                entry.last_used = time.time()
+                entry.hits += 1
+                return entry.value
+            key_lock = self._key_locks.setdefault(full_key, threading.Lock())
+
+        # 按键加锁，避免并发会话同时加载同一个模型，同时不阻塞其他后端
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(full_key)
+            if entry is not None:
+                entry.last_used = time.time()
+                entry.hits += 1
+                return entry.value
+            rss_before = current_rss()
+            start = time.perf_counter()
+            if stack is None:
+                stack = self._loading.stack = []
+            stack.append([])
+            try:
+                value = factory()
+            finally:
+                deps = stack.pop()
+            load_time = time.perf_counter() - start
+            entry = _Entry(key, value, load_time, max(current_rss() - rss_before, 0), deps=dict.fromkeys(deps))
+            with self._lock:
+                self._entries[full_key] = entry
+                for dep in entry.deps:
+                    if dep in self._entries:
+                        self._entries[dep].refs += 1
+            print(f"已加载 {kind} {key.model_type}:{key.model_path}，耗时 {load_time:.2f}s")
+            return value
+
+    @contextlib.contextmanager
+    def lease(self, value):
+        """
+        在 with 块内持有 value 对应条目的租约，退出时刷新其使用时间；value 不在注册表中时不做任何事
+        """
+        with self._lock:
+            entries = [entry for entry in self._entries.values() if entry.value is value]
+            for entry in entries:
+                entry.leases += 1
+        try:
+            yield value
+        finally:
+            with self._lock:
+                for entry in entries:
+                    entry.leases -= 1
+                    entry.last_used = time.time()
+
+    def _pop(self, full_key):
+        # 调用方持有 self._lock；移除条目并释放它对依赖的引用
+        entry = self._entries.pop(full_key)
+        self._key_locks.pop(full_key, None)
+        for dep in entry.deps:
+            if dep in self._entries:
+                self._entries[dep].refs -= 1
+        return entry
+
+    def evict(self, kind: str, key: RegistryKey) -> bool:
+        """
+        移除指定后端，返回是否移除成功；仍被其他条目依赖或持有租约时不移除
+        """
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None or entry.refs > 0 or entry.leases > 0:
+                return False
+            self._pop((kind, key))
+        self._release(entry.value)
+        return True
+
+    def evict_idle(self, max_idle_seconds: float) -> list:
+        """
+        移除超过 max_idle_seconds 未被使用、不被其他条目依赖且没有租约的后端；
+        依赖方被移除后，闲置的依赖在同一次调用中一并移除
+
+        Returns:
+            list: 被移除的 (kind, key) 列表
+        """
+        now = time.time()
+        evicted = []
+        with self._lock:
+            while True:
+                idle = [k for k, e in self._entries.items()
+                        if e.refs <= 0 and e.leases <= 0 and now - e.last_used > max_idle_seconds]
+                if not idle:
+                    break
+                evicted.extend((k, self._pop(k)) for k in idle)
+        for _, entry in evicted:
+            self._release(entry.value)
+        return [k for k, _ in evicted]
+
+    def stats(self) -> list:
+        """
+        返回每个条目的加载耗时、内存增量和使用情况
+        """
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "kind": kind,
+                    "model_type": entry.key.model_type,
+                    "model_path": entry.key.model_path,
+                    "load_time_s": round(entry.load_time, 3),
+                    "rss_delta_mb": round(entry.rss_delta / 1024 / 1024, 1),
+                    "idle_s": round(now - entry.last_used, 1),
+                    "hits": entry.hits,
+                    "refs": entry.refs,
+                    "leases": entry.leases,
+                }
+                for (kind, _), entry in self._entries.items()
+            ]
+
+    @staticmethod
+    def _release(value):
+        close = getattr(value, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as exc:
+                print(f"释放模型时出错: {exc}")
+        try:
+            import gc
+            gc.collect()
+        except Exception:
+            pass
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    return _registry
+
+
+def get_model_back(api_key: str = '', model_type: str = "deepseek", model_path: str = 'models/qwen2chat_int4'):
+    """
+    获取进程内共享的 ModelBack 实例
+    """
+    from utils.model_back import ModelBack
+    # deepseek 不依赖本地模型路径，避免因路径不同重复创建客户端
+    path = model_path if model_type == 'ipex_llm' else ''
+    key = RegistryKey(model_type, path, api_key if model_type == 'deepseek' else '')
+    # 本地模型的动态批大小，IPEX_BATCH_SIZE=1 时关闭批处理
+    batch_size = int(os.getenv("IPEX_BATCH_SIZE", "4"))
+    # IPEX_SPECULATIVE=1 时对单独成批的请求启用提示词查找投机解码
+    speculative = os.getenv("IPEX_SPECULATIVE", "0") == "1"
+    return _registry.get("model_back", key,
+                         lambda: ModelBack(api_key=api_key, model_type=model_type, model_path=model_path,
+                                           batch_size=batch_size, speculative=speculative))
+
+
+def get_rag(api_key: str = '', model_type: str = "deepseek", persist_dir: str = './storage'):
+    """
+    获取进程内共享的 RAG 实例
+    """
+    from utils.rag import RAG
+    key = RegistryKey(model_type, persist_dir, api_key if model_type == 'deepseek' else '')
+    # 向量索引类型(flat/ivf_flat/ivf_pq/hnsw)及查询参数，修改索引类型后下次同步时重建索引
+    index_config = {
+        "index_type": os.getenv("RAG_INDEX_TYPE", "flat"),
+        "nprobe": int(os.getenv("RAG_NPROBE", "16")),
+        "ef_search": int(os.getenv("RAG_EF_SEARCH", "64")),
+    }
+    # 向量计算：每批文本数、并行批数及并行方式(thread/process)
+    embed_config = {
+        "batch_size": int(os.getenv("EMBED_BATCH_SIZE", "32")),
+        "workers": int(os.getenv("EMBED_WORKERS", "1")),
+        "pool": os.getenv("EMBED_POOL", "thread"),
+    }
+    # 相似问题的答案缓存：命中阈值(余弦相似度)、条目数上限(0 关闭)、有效期(秒)
+    answer_cache = {
+        "threshold": float(os.getenv("RAG_CACHE_THRESHOLD", "0.95")),
+        "max_entries": int(os.getenv("RAG_CACHE_SIZE", "512")),
+        "ttl": float(os.getenv("RAG_CACHE_TTL", "3600")),
+    }
+    return _registry.get("rag", key,
+                         lambda: RAG(api_key=api_key, persist_dir=persist_dir, model_type=model_type,
+                                     index_config=index_config, embed_config=embed_config,
+                                     answer_cache=answer_cache))
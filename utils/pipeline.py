@@ -0,0 +1,303 @@
+import queue
+import threading
+from utils.chunker import text_anchors
+
+
+# 各类后端允许的最大并发请求数；本地 ipex 模型只能单路执行，
+# 地理编码的实际请求速率另由 utils.rate_limiter 的令牌桶控制
+BACKEND_CONCURRENCY = {
+    "deepseek": 8,
+    "ipex_llm": 1,
+    "free": 2,
+    "baidu": 4,
+    "offline": 4,
+}
+
+_DONE = object()
+
+
+class _Stage:
+    """
+    流水线中的一个阶段：若干工作线程从 in_q 取任务处理后写入下游。
+    最后一个退出的工作线程负责向下游发送结束标记。fn 抛出异常时调用 on_error，
+    由它向结果队列补上占位结果，保证重排序缓冲不会一直等待这个任务
+    """
+
+    def __init__(self, name, fn, in_q, workers, downstream_workers, out_q, stop_event, on_error=None):
+        self.name = name
+        self.fn = fn
+        self.in_q = in_q
+        self.out_q = out_q
+        self.workers = workers
+        self.downstream_workers = downstream_workers
+        self.stop_event = stop_event
+        self.on_error = on_error
+        self._alive = workers
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True).start()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                item = self.in_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                break
+            try:
+                self.fn(item)
+            except Exception as e:
+                print(f"{self.name} 阶段处理出错: {e}")
+                if self.on_error is not None:
+                    self.on_error(item)
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last:
+            for _ in range(self.downstream_workers):
+                _put(self.out_q, _DONE, self.stop_event)
+
+
+def _put(q, item, stop_event):
+    """
+    向有界队列写入，队列满时阻塞，流水线被关闭时放弃写入
+    """
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class ExtractionPipeline:
+    """
+    事件抽取流水线：文本块 -> 事件划分 -> 属性抽取 -> 地理编码。
+
+    每个阶段之间使用有界队列衔接，各阶段的工作线程数可以单独配置；
+    LLM 和地理编码的调用分别受后端并发上限约束。run() 按原文叙事顺序
+    逐个产出处理完成的事件，调用方可以边处理边展示。
+
+    mode="single" 时每个文本块只调用一次 LLM 直接得到带属性的事件数组，
+    整块抽取完成后事件进入地理编码阶段；没有解析出事件或抽取中途出错的文本块
+    回退到 mode="split"，即先划分事件再逐个抽取属性。
+    """
+
+    def __init__(self, llm, geocode_utils, language: str = "英文", mode: str = "single", split_workers: int = None,
+                 extract_workers: int = None, geocode_workers: int = None, queue_size: int = 16):
+        self.llm = llm
+        self.geocode_utils = geocode_utils
+        self.language = language
+        self.mode = mode
+        llm_slots = getattr(llm, "max_concurrency", None) or BACKEND_CONCURRENCY.get(llm.model_type, 1)
+        geo_slots = BACKEND_CONCURRENCY.get(geocode_utils.api_type, 1)
+        self._llm_sem = threading.BoundedSemaphore(llm_slots)
+        self._geo_sem = threading.BoundedSemaphore(geo_slots)
+        self.split_workers = split_workers or llm_slots
+        self.extract_workers = extract_workers or llm_slots
+        self.geocode_workers = geocode_workers or geo_slots
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+
+    def run(self, text_chunks, job=None):
+        """
+        处理文本块序列，按叙事顺序产出事件结果
+
+        Args:
+            text_chunks (Iterable[str]): 文本块，可以是生成器
+            job (ExtractionJob): 可选，检查点任务。已完成的文本块和事件直接从检查点回放，
+                只处理未完成的部分，处理结果随时写入检查点
+
+        Yields:
+            dict: 事件属性信息，包含 geocode 字段和 source 字段(所在文本块序号及原文锚点)
+        """
+        self._stop.clear()
+        chunk_q = queue.Queue(self.queue_size)
+        event_q = queue.Queue(self.queue_size)
+        geo_q = queue.Queue(self.queue_size)
+        # 结果队列不设上限，保证工作线程不会因为主线程渲染而互相等待
+        out_q = queue.Queue()
+        # 每个文本块的原文锚点，随事件保存，用于在 RAG 文档库中找到事件所在的原文
+        anchors = {}
+        # 已发出事件数的文本块；出错时只为还没有发出的文本块补发 0
+        counted = set()
+
+        def count(chunk_idx, n):
+            counted.add(chunk_idx)
+            out_q.put(("count", chunk_idx, n))
+
+        def split(item):
+            chunk_idx, text = item
+            if job is not None:
+                job.reset_chunk(chunk_idx)
+            if self.mode == "single":
+                # 完整抽取后才发往地理编码：中途出错时已发出的事件无法撤回，
+                # 回退到划分模式会与之重复，因此出错时丢弃整块的结果
+                units = []
+                try:
+                    with self._llm_sem:
+                        for event_info in self.llm.iter_extract_events(text, language=self.language, fallback=False):
+                            units.append(event_info)
+                except Exception as e:
+                    print(f"单次抽取事件时出错，回退到划分模式: {e}")
+                    units = []
+                if units:
+                    if job is not None:
+                        job.record_chunk(chunk_idx, "single", [dict(unit) for unit in units])
+                    count(chunk_idx, len(units))
+                    for i, event_info in enumerate(units):
+                        _put(geo_q, (chunk_idx, i, event_info), self._stop)
+                    return
+            try:
+                with self._llm_sem:
+                    event_list = self.llm.get_event_list(text) or []
+            except Exception as e:
+                print(f"划分事件时出错: {e}")
+                event_list = []
+            else:
+                # 划分失败时不写检查点，续跑时重试
+                if job is not None:
+                    job.record_chunk(chunk_idx, "split", event_list)
+            count(chunk_idx, len(event_list))
+            for i, event in enumerate(event_list):
+                _put(event_q, (chunk_idx, i, event), self._stop)
+
+        def extract(item):
+            chunk_idx, i, event = item
+            try:
+                with self._llm_sem:
+                    event_info = self.llm.process_event(event, language=self.language)
+                if not isinstance(event_info, dict):
+                    raise ValueError(f"事件属性不是 JSON 对象: {event_info!r}")
+            except Exception as e:
+                print(f"处理事件时出错: {e}")
+                out_q.put(("event", (chunk_idx, i), None))
+                return
+            _put(geo_q, (chunk_idx, i, event_info), self._stop)
+
+        def geocode(item):
+            chunk_idx, i, event_info = item
+            try:
+                event_info["source"] = {"chunk": chunk_idx, "anchors": anchors.get(chunk_idx, [])}
+                with self._geo_sem:
+                    event_info["geocode"] = self.geocode_utils.geocode(event_info["address"])
+            except Exception as e:
+                print(f"地理编码时出错: {e}")
+                event_info = None
+            # 暂时性的地理编码失败不写检查点，任务保持未完成，续跑时重试
+            try:
+                if event_info is not None and job is not None and not event_info["geocode"].get("retry"):
+                    job.record_event(chunk_idx, i, event_info)
+            except Exception as e:
+                # 检查点写入失败只影响续跑，本次结果照常输出
+                print(f"写入事件检查点时出错: {e}")
+            out_q.put(("event", (chunk_idx, i), event_info))
+
+        def event_failed(item):
+            chunk_idx, i = item[0], item[1]
+            out_q.put(("event", (chunk_idx, i), None))
+
+        def chunk_failed(item):
+            chunk_idx = item[0]
+            if chunk_idx not in counted:
+                count(chunk_idx, 0)
+
+        def resume(chunk_idx, record):
+            """
+            回放已有划分记录的文本块：已完成的事件直接输出，其余的从中断的阶段继续
+            """
+            done = job.done_events(chunk_idx)
+            count(chunk_idx, len(record["units"]))
+            for i, unit in enumerate(record["units"]):
+                if i in done:
+                    out_q.put(("event", (chunk_idx, i), done[i]))
+                elif record["mode"] == "split":
+                    if not _put(event_q, (chunk_idx, i, unit), self._stop):
+                        return False
+                elif not _put(geo_q, (chunk_idx, i, dict(unit)), self._stop):
+                    return False
+            return True
+
+        stages = [
+            _Stage("split", split, chunk_q, self.split_workers, self.extract_workers, event_q, self._stop,
+                   chunk_failed),
+            _Stage("extract", extract, event_q, self.extract_workers, self.geocode_workers, geo_q, self._stop,
+                   event_failed),
+            _Stage("geocode", geocode, geo_q, self.geocode_workers, 1, out_q, self._stop, event_failed),
+        ]
+        for stage in stages:
+            stage.start()
+
+        def feed():
+            total = 0
+            complete = False
+            try:
+                for text in text_chunks:
+                    anchors[total] = text_anchors(text)
+                    record = job.chunk_record(total) if job is not None else None
+                    if record is not None:
+                        if not resume(total, record):
+                            return
+                    elif not _put(chunk_q, (total, text), self._stop):
+                        return
+                    total += 1
+                complete = True
+            except Exception as e:
+                print(f"读取文本时出错: {e}")
+            finally:
+                # 文本没有读完时不记录总块数，任务保持未完成，重新上传后继续处理后面的文本块
+                if job is not None and complete and not self._stop.is_set():
+                    job.set_total(total)
+                out_q.put(("chunks", total, None))
+                for _ in range(self.split_workers):
+                    _put(chunk_q, _DONE, self._stop)
+
+        threading.Thread(target=feed, name="feed", daemon=True).start()
+
+        try:
+            yield from self._ordered(out_q)
+        finally:
+            self._stop.set()
+            if job is not None:
+                job.finish()
+
+    def close(self):
+        self._stop.set()
+
+    @staticmethod
+    def _ordered(out_q):
+        """
+        重排序缓冲：按 (块序号, 事件序号) 顺序输出结果
+        """
+        counts = {}
+        pending = {}
+        total_chunks = None
+        chunk_idx, event_idx = 0, 0
+        while True:
+            item = out_q.get()
+            if item is _DONE:
+                break
+            kind, key, value = item
+            if kind == "count":
+                counts[key] = value
+            elif kind == "chunks":
+                total_chunks = key
+            else:
+                pending[key] = value
+            # 尽可能多地输出已就绪的连续结果
+            while chunk_idx in counts:
+                if event_idx >= counts[chunk_idx]:
+                    chunk_idx, event_idx = chunk_idx + 1, 0
+                    continue
+                if (chunk_idx, event_idx) not in pending:
+                    break
+                event_info = pending.pop((chunk_idx, event_idx))
+                event_idx += 1
+                if event_info is not None:
+                    yield event_info
+            if total_chunks is not None and chunk_idx >= total_chunks:
+                break
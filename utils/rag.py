@@ -1,18 +1,34 @@
 import os
-import faiss
+import json
+import hashlib
+import threading
+import uuid
 from io import BytesIO
 from dotenv import load_dotenv, find_dotenv
-from llama_index.vector_stores.faiss import FaissVectorStore
 from llama_index.core import StorageContext, SimpleDirectoryReader, Document,VectorStoreIndex, load_index_from_storage, Settings
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.base.response.schema import Response
+from llama_index.core.schema import QueryBundle
+from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+import numpy as np
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.llms.openai_like import OpenAILike
 from typing import List, Dict
 from modelscope import snapshot_download, AutoModel, AutoTokenizer
+from utils.model_registry import get_registry, RegistryKey
+from utils.ipex_model import get_shared_ipex_model
+from utils.vector_store import IncrementalFaissVectorStore, DEFAULT_INDEX_CONFIG
+from utils.kv_store import SqliteKVStore, SqliteDocumentStore, SqliteIndexStore
+from utils.embedding import CachedEmbedding, EmbeddingCache
+from utils.semantic_cache import SemanticCache
+from utils.spatial_index import EventSpatialIndex
 
 
 class RAG:
 
-    def __init__(self, api_key:str,persist_dir: str = './storage', embed_model_name: str = "models/AI-ModelScope/bge-small-zh-v1___5",model_type:str='deepseek'):
+    def __init__(self, api_key:str,persist_dir: str = './storage', embed_model_name: str = "models/AI-ModelScope/bge-small-zh-v1___5",model_type:str='deepseek', model_path: str = 'models/qwen2chat_int4',
+                 index_config: dict = None, embed_config: dict = None, answer_cache: dict = None):
         self.persist_dir = persist_dir
         self.embed_model_name = embed_model_name
         self.model_type = model_type
@@ -20,13 +36,31 @@ class RAG:
          # Check if the embedding model exists, if not, download it
         if not os.path.exists(self.embed_model_name):
             self.download_embedding_model()
-        # Initialize embedding model
-        self.embed_model = HuggingFaceEmbedding(model_name=self.embed_model_name)
+        # Initialize embedding model (shared across RAG instances in this process)
+        # 向量按内容哈希和模型版本缓存在 embeddings.sqlite 中；embed_config 为 batch_size、workers、pool
+        self.embed_model = get_registry().get(
+            "embedding", RegistryKey("huggingface", self.embed_model_name, ''),
+            lambda: CachedEmbedding(HuggingFaceEmbedding(model_name=self.embed_model_name), self.embed_model_name,
+                                    cache=EmbeddingCache(os.path.join(self.persist_dir, "embeddings.sqlite")),
+                                    **(embed_config or {})))
         Settings.embed_model = self.embed_model
-        # Initialize FAISS index
-        self.faiss_index = faiss.IndexFlatL2(512)
-        self.vector_store = FaissVectorStore(faiss_index=self.faiss_index)
-        self.storage_context = StorageContext.from_defaults(vector_store=self.vector_store)
+        # 每个数据文件的内容哈希及其文档ID，用于增量更新索引
+        self.manifest_path = os.path.join(self.persist_dir, "index_manifest.json")
+        # 每次持久化都会更新版本号，常驻内存的索引和查询引擎只在版本变化时重新加载
+        self.version_path = os.path.join(self.persist_dir, "index_version")
+        # 文档库和索引结构保存在 SQLite 中，节点文本在检索命中时才读取
+        self.kv_path = os.path.join(self.persist_dir, "index_store.sqlite")
+        # 向量索引类型及查询参数，见 utils.vector_store.DEFAULT_INDEX_CONFIG
+        self.index_config = dict(DEFAULT_INDEX_CONFIG, **(index_config or {}))
+        self.index_db = None
+        self.index_version = None
+        self._query_engine = None
+        # (索引, 每个源文件的节点 ID)，随常驻索引重新加载而失效
+        self._file_nodes = None
+        self._index_lock = threading.RLock()
+        # 相似问题的答案缓存(threshold、max_entries、ttl)，max_entries 为 0 时关闭
+        cache_config = answer_cache or {}
+        self.answer_cache = SemanticCache(**cache_config) if cache_config.get("max_entries", 1) > 0 else None
         if model_type == 'deepseek':
             self.llm = OpenAILike(
                 api_base="https://api.deepseek.com/beta", 
@@ -39,9 +73,13 @@ class RAG:
             Settings.llm = self.llm   
         elif model_type == 'ipex_llm':
             from llama_index.llms.ipex_llm import IpexLLM
-            self.llm = IpexLLM.from_model_id_low_bit(
-                model_name="models/qwen2chat_int4",
-                tokenizer_name="models/qwen2chat_int4",
+            # 复用 ModelBack 已加载的 int4 模型，不再二次加载权重
+            shared_model = get_shared_ipex_model(model_path)
+            self.llm = IpexLLM(
+                model=shared_model.model,
+                tokenizer=shared_model.tokenizer,
+                model_name=model_path,
+                tokenizer_name=model_path,
                 context_window=4096,
                 max_new_tokens=2048,
                 generate_kwargs={"temperature": 0.0, "do_sample": False},
@@ -49,6 +87,8 @@ class RAG:
                 messages_to_prompt=self.messages_to_prompt,
                 device_map="cpu",
             )
+            # IpexLLM 可能在初始化时替换模型引用，这里确保使用带锁的共享代理
+            self.llm._model = shared_model.model
             Settings.llm = self.llm   
 
     def download_embedding_model(self):
@@ -113,26 +153,266 @@ class RAG:
         return prompt
 
     
-    def build_index_from_file(self):
-        documents = SimpleDirectoryReader("./data").load_data()
-        index = VectorStoreIndex.from_documents(
-            documents, storage_context=self.storage_context
-        )
-        index.storage_context.persist() # 保存到本地，这里暂时屏蔽
-        self.index_db = index
-        
+    def has_index(self) -> bool:
+        """
+        本地是否已有持久化的向量索引
+        """
+        return os.path.exists(os.path.join(self.persist_dir, "default__vector_store.json"))
+
+    def build_index_from_file(self, data_dir: str = "./data"):
+        return self.sync_index(data_dir)
+
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def _read_version(self):
+        try:
+            with open(self.version_path, "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _bump_version(self) -> str:
+        version = uuid.uuid4().hex
+        tmp_path = f"{self.version_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp_path, self.version_path)
+        return version
+
+    def _open_kvstore(self, read_only: bool = False) -> SqliteKVStore:
+        """
+        打开文档库；首次使用时导入旧版的 docstore.json、index_store.json(原文件保留)
+        """
+        kvstore = SqliteKVStore(self.kv_path)
+        if kvstore.empty():
+            for name in ("docstore.json", "index_store.json"):
+                path = os.path.join(self.persist_dir, name)
+                if os.path.exists(path):
+                    print(f"导入旧版文档库 {path}：{kvstore.import_json(path)} 条")
+        if read_only:
+            kvstore.close()
+            kvstore = SqliteKVStore(self.kv_path, read_only=True)
+        return kvstore
+
+    @staticmethod
+    def _storage_context(vector_store, kvstore: SqliteKVStore) -> StorageContext:
+        return StorageContext.from_defaults(vector_store=vector_store, docstore=SqliteDocumentStore(kvstore),
+                                            index_store=SqliteIndexStore(kvstore))
+
+    def _open_index(self, kvstore: SqliteKVStore):
+        """
+        加载已持久化的增量索引和文件清单；没有清单、旧格式的索引或索引类型改变时新建空索引
+        """
+        if os.path.exists(self.manifest_path) and self.has_index():
+            try:
+                vector_store = IncrementalFaissVectorStore.from_persist_dir(self.persist_dir, config=self.index_config)
+                index = load_index_from_storage(storage_context=self._storage_context(vector_store, kvstore),
+                                                embed_model=self.embed_model)
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    return index, json.load(f)
+            except ValueError as e:
+                print(f"索引格式不兼容，重新构建: {e}")
+        # 清空旧文档库，与新索引在同一事务中提交
+        kvstore.clear()
+        storage_context = self._storage_context(IncrementalFaissVectorStore.create(512, config=self.index_config),
+                                                kvstore)
+        index = VectorStoreIndex([], storage_context=storage_context, embed_model=self.embed_model)
+        return index, {}
+
+    def sync_index(self, data_dir: str = "./data") -> dict:
+        """
+        增量同步索引与数据目录：只对新增或内容变化的文件计算向量，删除已移除文件的向量，
+        有变化时才持久化。同步在从磁盘加载的可写副本上进行，文档库的修改在持久化时
+        一次提交，不影响同时进行的查询；完成后下次查询以内存映射方式重新加载索引
+
+        Returns:
+            dict: added、updated、removed、unchanged 文件数
+        """
+        with self._index_lock:
+            kvstore = self._open_kvstore()
+            try:
+                return self._sync_index(kvstore, data_dir)
+            finally:
+                # 出错时未提交的修改随连接关闭丢弃
+                kvstore.close()
+
+    def _sync_index(self, kvstore: SqliteKVStore, data_dir: str) -> dict:
+        index, manifest = self._open_index(kvstore)
+        files = {}
+        for name in sorted(os.listdir(data_dir)):
+            path = os.path.join(data_dir, name)
+            if name.startswith(".") or name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            old = manifest.get(path)
+            # 大小和修改时间都没变时沿用上次的哈希，避免重复读文件
+            if old and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime:
+                sha = old["sha"]
+            else:
+                sha = self._file_sha256(path)
+            files[path] = {"sha": sha, "size": stat.st_size, "mtime": stat.st_mtime, "doc_ids": []}
+
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        for path, old in manifest.items():
+            if path in files and files[path]["sha"] == old["sha"]:
+                files[path]["doc_ids"] = old["doc_ids"]
+                stats["unchanged"] += 1
+                continue
+            for doc_id in old["doc_ids"]:
+                index.delete_ref_doc(doc_id, delete_from_docstore=True)
+            if path not in files:
+                stats["removed"] += 1
+
+        pending = []
+        for path, entry in files.items():
+            if path in manifest and manifest[path]["sha"] == entry["sha"]:
+                continue
+            try:
+                documents = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+            except Exception as e:
+                print(f"读取文件 {path} 时出错: {e}")
+                continue
+            pending.extend(documents)
+            entry["doc_ids"] = [document.doc_id for document in documents]
+            stats["updated" if path in manifest else "added"] += 1
+        if pending:
+            # 所有新增/变化文件的节点一次写入，向量模型可以按长度排序后整批计算
+            nodes = run_transformations(pending, Settings.transformations)
+            index.insert_nodes(nodes)
+            for document in pending:
+                index.docstore.set_document_hash(document.get_doc_id(), document.hash)
+
+        # 读取失败的文件不写入清单，下次同步时重试
+        files = {path: entry for path, entry in files.items() if entry["doc_ids"] or path in manifest}
+        if stats["added"] or stats["updated"] or stats["removed"] or not os.path.exists(self.manifest_path):
+            index.storage_context.persist(persist_dir=self.persist_dir)
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(files, f, ensure_ascii=False)
+            os.replace(tmp_path, self.manifest_path)
+            self._bump_version()
+            if self.answer_cache is not None:
+                self.answer_cache.invalidate()
+            # 可写副本占用完整内存，不作为常驻索引；由 get_query_engine 只读重新加载
+            self.index_db = None
+            self._query_engine = None
+        return stats
 
     # 加载本地向量数据库
     def load_index(self):
-        self.vector_store = FaissVectorStore.from_persist_dir(self.persist_dir)
-        self.storage_context = StorageContext.from_defaults(
-            vector_store=self.vector_store, persist_dir=self.persist_dir
-        )
-        return load_index_from_storage(storage_context=self.storage_context)
+        # 只加载已有索引，不因索引类型配置不同而拒绝；查询参数仍按当前配置。
+        # 向量索引以内存映射只读打开，节点文本在检索命中时才从 SQLite 读取
+        self.vector_store = IncrementalFaissVectorStore.from_persist_dir(
+            self.persist_dir, config={k: v for k, v in self.index_config.items() if k != "index_type"}, mmap=True)
+        self.storage_context = self._storage_context(self.vector_store, self._open_kvstore(read_only=True))
+        return load_index_from_storage(storage_context=self.storage_context, embed_model=self.embed_model)
+
+    def get_query_engine(self):
+        """
+        返回常驻的查询引擎；持久化的索引版本变化(其他会话或进程更新了索引)时才重新加载
+        """
+        with self._index_lock:
+            version = self._read_version()
+            if self.index_db is None or version != self.index_version:
+                self.index_db = self.load_index()
+                self.index_version = version
+                self._query_engine = None
+            if self._query_engine is None:
+                # 实例在进程内共享，显式传入 llm，避免全局 Settings.llm 被其他实例覆盖
+                self._query_engine = self.index_db.as_query_engine(llm=self.llm)
+            return self._query_engine
 
     # 检索内容
     def query_index(self, query: str):
-        index_db = self.load_index()
-        query_engine = index_db.as_query_engine()
+        query_engine = self.get_query_engine()
+        if self.answer_cache is None:
+            return query_engine.query(query)
+        # 问题向量有缓存，未命中时查询引擎检索用的是同一个向量，不会重复计算
+        embedding = self.embed_model.get_query_embedding(query)
+        version = self.index_version
+        cached = self.answer_cache.lookup(embedding, version)
+        if cached is not None:
+            response, info = cached
+            print(f"命中答案缓存(相似度 {info['similarity']:.3f})：{info['query']}")
+            return response
         response = query_engine.query(query)
+        self.answer_cache.store(query, embedding, response, version)
+        return response
+
+    @staticmethod
+    def _event_text(event: dict) -> str:
+        return f"{event.get('event_title', '')}（{event.get('address', '')}）：{event.get('event_content', '')}"
+
+    def query_geo(self, query: str, spatial_index: EventSpatialIndex, bbox=None, center=None, radius_km: float = None,
+                  top_k_events: int = 5, file_path: str = None):
+        """
+        地理范围预筛选的检索：先用空间索引取出范围内的事件，按与问题的向量相似度取前 top_k_events 个，
+        再只在这些事件所在原文的文本节点中做向量检索，连同事件摘要交给 LLM 回答。
+        事件的原文位置由抽取时记录的原文锚点(source.anchors)确定，没有锚点的旧事件按地名匹配；
+        范围内没有事件时退回普通检索
+
+        Args:
+            query (str): 用户问题
+            spatial_index (EventSpatialIndex): 当前书籍事件的空间索引
+            bbox (tuple): (min_lon, min_lat, max_lon, max_lat)，如当前地图视野
+            center (tuple): (纬度, 经度)，如地理编码得到的地点，与 radius_km 一起使用
+            radius_km (float): 圆形范围半径(km)
+            file_path (str): 事件所在书籍的文件，只在该文件的节点中匹配地名；为 None 时匹配全部节点
+
+        Returns:
+            Response: metadata["events"] 为参与回答的事件
+        """
+        if bbox is not None:
+            ids = spatial_index.query_bbox(*bbox)
+        elif center is not None and radius_km:
+            ids = spatial_index.query_radius(center[0], center[1], radius_km)
+        else:
+            ids = spatial_index.all()
+        events = spatial_index.get(ids)
+        if not events:
+            return self.query_index(query)
+
+        # 事件文本的向量有缓存，同一本书的事件只计算一次
+        query_embedding = np.asarray(self.embed_model.get_query_embedding(query), dtype="float32")
+        event_embeddings = np.asarray(self.embed_model.get_text_embedding_batch(
+            [self._event_text(event) for event in events]), dtype="float32")
+        scores = event_embeddings @ query_embedding / (
+            np.linalg.norm(event_embeddings, axis=1) * np.linalg.norm(query_embedding) + 1e-12)
+        top_events = [events[i] for i in np.argsort(-scores, kind="stable")[:top_k_events]]
+        context = "\n".join(f"- {self._event_text(event)}" for event in top_events)
+        prompt = f"{query}\n\n地图范围内的相关事件：\n{context}"
+
+        with self._index_lock:
+            # 同步索引时会替换 self.index_db，之后只使用这里取到的索引
+            self.get_query_engine()
+            index = self.index_db
+            if file_path is None:
+                candidates = None
+            else:
+                if self._file_nodes is None or self._file_nodes[0] is not index:
+                    self._file_nodes = (index, index.docstore.file_node_ids())
+                candidates = self._file_nodes[1].get(os.path.abspath(file_path), [])
+        # address 按提示词要求为英文现代地名，很少出现在中文原文中，优先用原文锚点定位节点
+        terms = set()
+        for event in top_events:
+            anchors = (event.get("source") or {}).get("anchors")
+            if anchors:
+                terms.update(anchors)
+            elif event.get("address"):
+                terms.add(event["address"])
+        node_ids = index.docstore.node_ids_containing(sorted(terms), node_ids=candidates)
+        if node_ids:
+            # 只在这些事件所在原文的节点中检索，检索仍使用原问题的向量
+            retriever = VectorIndexRetriever(index, node_ids=node_ids)
+            query_engine = RetrieverQueryEngine.from_args(retriever, llm=self.llm)
+            response = query_engine.query(QueryBundle(query_str=prompt, custom_embedding_strs=[query]))
+        else:
+            response = Response(response=str(self.llm.complete(prompt)), source_nodes=[])
+        response.metadata = dict(response.metadata or {}, events=top_events, candidates=len(events))
         return response
@@ -0,0 +1,61 @@
+import os
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    令牌桶限流器：以 rate 个/秒的速度补充令牌，最多积累 capacity 个。
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        """
+        获取令牌，不足时阻塞等待
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """
+        服务端返回限流时，清空令牌并在 seconds 秒内不再发放
+        """
+        with self._lock:
+            self._tokens = -seconds * self.rate
+            self._updated = time.monotonic()
+
+
+# 各服务商的请求速率(次/秒)，Nominatim 使用政策要求不超过 1 次/秒
+PROVIDER_RATES = {
+    "free": float(os.getenv("NOMINATIM_QPS", "1")),
+    "baidu": float(os.getenv("BAIDU_GEOCODE_QPS", "10")),
+}
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(provider: str) -> TokenBucket:
+    """
+    获取进程内共享的服务商令牌桶
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(provider)
+        if bucket is None:
+            rate = PROVIDER_RATES.get(provider, 1.0)
+            bucket = _buckets[provider] = TokenBucket(rate=rate, capacity=max(1.0, rate))
+        return bucket
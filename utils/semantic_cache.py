@@ -0,0 +1,107 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+
+class SemanticCache:
+    """
+    按问题向量查找的答案缓存。
+
+    新问题与缓存中某个问题的余弦相似度达到 threshold 时直接返回当时的回答
+    (含来源节点)，省去检索和 LLM 生成。缓存与索引版本绑定，索引更新后整体失效；
+    条目数超过 max_entries 时淘汰最久未命中的，超过 ttl 秒的条目不再命中。
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512, ttl: float = 3600):
+        """
+        Args:
+            threshold (float): 命中所需的最低余弦相似度
+            max_entries (int): 最多缓存的回答数
+            ttl (float): 条目有效期(秒)，0 表示不过期
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype="float32")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+            self._version = version
+
+    def _expire(self, now: float):
+        if not self.ttl:
+            return
+        expired = [key for key, entry in self._entries.items() if now - entry["created_at"] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        self.stats["evictions"] += len(expired)
+
+    def lookup(self, embedding, version):
+        """
+        查找相似问题的缓存回答
+
+        Args:
+            embedding (list): 问题向量
+            version (str): 当前索引版本，与缓存的版本不同时先清空缓存
+
+        Returns:
+            (object, dict) | None: 缓存的回答和命中信息(原问题、相似度)，未命中返回 None
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_version(version)
+            self._expire(time.time())
+            if not self._entries:
+                self.stats["misses"] += 1
+                return None
+            keys = list(self._entries)
+            similarities = np.vstack([self._entries[key]["vector"] for key in keys]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.stats["misses"] += 1
+                return None
+            key = keys[best]
+            self._entries.move_to_end(key)
+            entry = self._entries[key]
+            entry["hits"] += 1
+            self.stats["hits"] += 1
+            return entry["response"], {"query": entry["query"], "similarity": float(similarities[best])}
+
+    def store(self, query: str, embedding, response, version):
+        """
+        缓存一个回答；查询期间索引已更新(版本与 lookup 时不同)的回答不缓存
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            if version != self._version or self.max_entries <= 0:
+                return
+            self._entries[self._next_id] = {"query": query, "vector": vector, "response": response,
+                                            "created_at": time.time(), "hits": 0}
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            if self._entries:
+                self.stats["invalidations"] += 1
+            self._entries.clear()
+
+    def report(self) -> dict:
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), version=self._version)
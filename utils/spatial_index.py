@@ -0,0 +1,187 @@
+import math
+import numpy as np
+from shapely import STRtree, box, points
+
+# 地球平均半径(km)
+EARTH_RADIUS_KM = 6371.0088
+# 地图的最大缩放级别
+MAX_ZOOM = 22
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    球面大圆距离(km)，参数可以是标量或 numpy 数组
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def event_location(event: dict):
+    """
+    返回事件的 (纬度, 经度)，地理编码失败的事件返回 None
+    """
+    geocode = event.get("geocode") or {}
+    try:
+        latitude, longitude = float(geocode["latitude"]), float(geocode["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if math.isnan(latitude) or math.isnan(longitude):
+        return None
+    return latitude, longitude
+
+
+class EventSpatialIndex:
+    """
+    事件坐标的空间索引(shapely STRtree，R 树的一种)。
+
+    只索引地理编码成功的事件，查询返回事件在原列表中的下标(按原文顺序)，
+    支持矩形范围、圆形范围(球面距离)、k 近邻和地图视野查询。索引构建后不可修改，
+    事件列表变化时重新构建。
+    """
+
+    def __init__(self, events: list, cell_pixels: int = 48):
+        """
+        Args:
+            events (list): 事件列表
+            cell_pixels (int): 地图视野查询时每个网格的边长(像素)，同一网格内只绘制一个事件
+        """
+        self.events = events
+        self.cell_pixels = cell_pixels
+        self._levels = {}
+        located = [(i, loc) for i, loc in enumerate(map(event_location, events)) if loc is not None]
+        # 事件下标、纬度、经度
+        self._ids = np.array([i for i, _ in located], dtype="int64")
+        self._lat = np.array([loc[0] for _, loc in located], dtype="float64")
+        self._lon = np.array([loc[1] for _, loc in located], dtype="float64")
+        self._tree = STRtree(points(self._lon, self._lat)) if len(located) else None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, ids) -> list:
+        return [self.events[i] for i in ids]
+
+    def all(self) -> list:
+        return self._ids.tolist()
+
+    def route(self) -> list:
+        """
+        全部有坐标事件按原文顺序连成的路线 [[纬度, 经度], ...]，不受视野和抽稀影响
+        """
+        return np.column_stack((self._lat, self._lon)).tolist()
+
+    def _query_box(self, min_lon, min_lat, max_lon, max_lat) -> np.ndarray:
+        # 返回树中的位置(非事件下标)
+        if self._tree is None:
+            return np.zeros(0, dtype="int64")
+        return self._tree.query(box(min_lon, min_lat, max_lon, max_lat))
+
+    def query_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> list:
+        """
+        矩形范围内的事件；min_lon > max_lon 时视为跨越 180 度经线
+
+        Returns:
+            list: 事件下标，按原文顺序
+        """
+        if min_lon > max_lon:
+            positions = np.concatenate([self._query_box(min_lon, min_lat, 180, max_lat),
+                                        self._query_box(-180, min_lat, max_lon, max_lat)])
+        else:
+            positions = self._query_box(min_lon, min_lat, max_lon, max_lat)
+        return np.sort(self._ids[np.unique(positions)]).tolist()
+
+    def _radius_positions(self, latitude: float, longitude: float, radius_km: float):
+        # 先用外接矩形在树中粗筛，再按球面距离精确过滤
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(math.cos(math.radians(latitude)), 1e-6)
+        min_lon, max_lon = longitude - dlon, longitude + dlon
+        if min_lon < -180 or max_lon > 180:
+            # 跨越 180 度经线时粗筛整个经度范围
+            min_lon, max_lon = -180, 180
+        positions = self._query_box(min_lon, latitude - dlat, max_lon, latitude + dlat)
+        distances = haversine_km(latitude, longitude, self._lat[positions], self._lon[positions])
+        keep = distances <= radius_km
+        return positions[keep], distances[keep]
+
+    def query_radius(self, latitude: float, longitude: float, radius_km: float) -> list:
+        """
+        以 (latitude, longitude) 为中心、radius_km 为半径的圆内的事件
+
+        Returns:
+            list: 事件下标，按原文顺序
+        """
+        positions, _ = self._radius_positions(latitude, longitude, radius_km)
+        return np.sort(self._ids[positions]).tolist()
+
+    def nearest(self, latitude: float, longitude: float, k: int = 10) -> list:
+        """
+        距离最近的 k 个事件，逐步扩大搜索半径直到范围内的事件足够
+
+        Returns:
+            list: (事件下标, 距离 km)，按距离从近到远
+        """
+        k = min(k, len(self))
+        if k <= 0:
+            return []
+        radius_km = 10.0
+        while True:
+            positions, distances = self._radius_positions(latitude, longitude, radius_km)
+            # 半径覆盖半个地球周长时已包含全部事件
+            if len(positions) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                break
+            radius_km *= 4
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(int(self._ids[positions[i]]), float(distances[i])) for i in order]
+
+    def _zoom_level(self, zoom: int) -> np.ndarray:
+        # 该缩放级别下每个网格中原文最早的事件(树中的位置，按事件下标排序)，按级别缓存
+        positions = self._levels.get(zoom)
+        if positions is None:
+            # Web 墨卡托下 zoom 级别每像素对应的经度，纬度方向按同样的度数近似
+            cell = self.cell_pixels * 360 / (256 * 2 ** zoom)
+            col = np.floor((self._lon + 180) / cell).astype("int64")
+            row = np.floor((self._lat + 90) / cell).astype("int64")
+            _, first = np.unique(row * (int(360 / cell) + 2) + col, return_index=True)
+            positions = np.sort(first)
+            self._levels[zoom] = positions
+        return positions
+
+    def query_viewport(self, bbox, zoom: float, max_events: int = 2000, padding: float = 0.2,
+                       thin: bool = True) -> list:
+        """
+        地图视野内需要绘制的事件。按缩放级别把地图划成约 cell_pixels 像素见方的网格，
+        每格只保留原文中最早的事件，缩小地图时标记数随之减少，总数不超过 max_events；
+        视野向四周扩展 padding 比例，小幅平移时边缘的事件已经绘制
+
+        Args:
+            bbox (tuple): (min_lon, min_lat, max_lon, max_lat)，min_lon > max_lon 时视为跨越 180 度经线
+            zoom (float): 地图缩放级别
+            thin (bool): 是否按网格抽稀；地图在浏览器端聚合标记时传 False，聚合的计数才准确
+
+        Returns:
+            list: 事件下标，按原文顺序
+        """
+        if not len(self):
+            return []
+        min_lon, min_lat, max_lon, max_lat = bbox
+        width = (max_lon - min_lon) % 360 or 360
+        height = max_lat - min_lat
+        min_lat, max_lat = min_lat - height * padding, max_lat + height * padding
+        if thin:
+            positions = self._zoom_level(min(max(int(zoom), 0), MAX_ZOOM))
+        else:
+            positions = np.arange(len(self))
+        lat, lon = self._lat[positions], self._lon[positions]
+        keep = (lat >= min_lat) & (lat <= max_lat)
+        if width * (1 + 2 * padding) < 360:
+            min_lon = (min_lon - width * padding + 180) % 360 - 180
+            max_lon = (max_lon + width * padding + 180) % 360 - 180
+            if min_lon > max_lon:
+                keep &= (lon >= min_lon) | (lon <= max_lon)
+            else:
+                keep &= (lon >= min_lon) & (lon <= max_lon)
+        positions = positions[keep]
+        if len(positions) > max_events:
+            positions = positions[np.linspace(0, len(positions) - 1, max_events).astype("int64")]
+        return self._ids[positions].tolist()
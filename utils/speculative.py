@@ -0,0 +1,107 @@
+import torch
+
+
+def find_candidate_tokens(token_ids: torch.Tensor, max_ngram_size: int = 3, num_pred_tokens: int = 10) -> list:
+    """
+    提示词查找(n-gram 复制)：用序列末尾的 n-gram 在已有 token 中查找最近一次出现，
+    把其后面的 token 作为草稿。n 从 max_ngram_size 递减到 1。
+
+    Args:
+        token_ids (Tensor): 一维 token 序列(提示词 + 已生成部分)
+        max_ngram_size (int): 最大匹配 n-gram 长度
+        num_pred_tokens (int): 最多草拟的 token 数
+
+    Returns:
+        list: 草稿 token，找不到匹配时为空
+    """
+    length = token_ids.shape[0]
+    for n in range(min(max_ngram_size, length - 1), 0, -1):
+        ngram = token_ids[-n:]
+        windows = token_ids[:length - 1].unfold(0, n, 1)
+        matches = (windows == ngram).all(dim=1).nonzero().flatten()
+        # 从最近的匹配开始，跳过紧贴序列末尾、后面没有可复制内容的位置
+        for start in reversed(matches.tolist()):
+            end = start + n
+            if end < length:
+                return token_ids[end:end + num_pred_tokens].tolist()
+    return []
+
+
+def crop_cache(past_key_values, length: int):
+    """
+    把 KV 缓存截断到前 length 个位置，兼容旧版元组和新版 Cache 对象
+    """
+    if isinstance(past_key_values, tuple):
+        return tuple((k[:, :, :length], v[:, :, :length]) for k, v in past_key_values)
+    if hasattr(past_key_values, "crop"):
+        past_key_values.crop(length)
+        return past_key_values
+    for i in range(len(past_key_values.key_cache)):
+        past_key_values.key_cache[i] = past_key_values.key_cache[i][:, :, :length]
+        past_key_values.value_cache[i] = past_key_values.value_cache[i][:, :, :length]
+    if hasattr(past_key_values, "_seen_tokens"):
+        past_key_values._seen_tokens = length
+    return past_key_values
+
+
+@torch.inference_mode()
+def prompt_lookup_generate(model, input_ids: torch.Tensor, max_new_tokens: int, eos_token_id,
+                           max_ngram_size: int = 3, num_pred_tokens: int = 10,
+                           past_key_values=None, stats: dict = None) -> torch.Tensor:
+    """
+    基于提示词查找的投机解码(贪心)。
+
+    每一步从提示词中复制草稿 token，与最后一个已确认 token 一起做一次前向，
+    逐位比较模型的 argmax，接受最长一致前缀并额外得到一个模型自己的 token。
+    接受规则与逐 token 贪心解码完全相同，因此输出与贪心解码一致。
+
+    Args:
+        model: 因果语言模型
+        input_ids (Tensor): 形状为 (1, L) 的输入
+        max_new_tokens (int): 最大生成 token 数
+        eos_token_id (int | list): 结束 token
+        past_key_values: 可选，input_ids 某个前缀已经计算好的 KV 缓存(会被修改)
+        stats (dict): 可选，累计 forward 次数、草稿数和接受数
+
+    Returns:
+        Tensor: 形状为 (1, N) 的新生成 token
+    """
+    eos_ids = set(eos_token_id if isinstance(eos_token_id, (list, tuple)) else [eos_token_id])
+    if past_key_values is not None:
+        cached = past_key_values[0][0].shape[2] if isinstance(past_key_values, tuple) else past_key_values.get_seq_length()
+        outputs = model(input_ids[:, cached:], past_key_values=past_key_values, use_cache=True)
+    else:
+        outputs = model(input_ids, use_cache=True)
+    past = outputs.past_key_values
+    tokens = input_ids[0].tolist()
+    generated = [int(outputs.logits[0, -1].argmax())]
+    tokens.append(generated[0])
+    forwards, drafted, accepted_total = 1, 0, 0
+
+    while len(generated) < max_new_tokens and generated[-1] not in eos_ids:
+        candidates = find_candidate_tokens(torch.tensor(tokens), max_ngram_size, num_pred_tokens)
+        candidates = candidates[:max_new_tokens - len(generated) - 1]
+        verify_ids = torch.tensor([[tokens[-1]] + candidates], device=input_ids.device)
+        outputs = model(verify_ids, past_key_values=past, use_cache=True)
+        predictions = outputs.logits[0].argmax(dim=-1).tolist()
+        accepted = 0
+        while accepted < len(candidates) and candidates[accepted] == predictions[accepted]:
+            accepted += 1
+        # 缓存中保留已确认的 token：原有序列 + 被接受的草稿；额外 token 留到下一步再写入缓存
+        past = crop_cache(outputs.past_key_values, len(tokens) + accepted)
+        new_tokens = candidates[:accepted] + [predictions[accepted]]
+        for token in new_tokens:
+            generated.append(token)
+            tokens.append(token)
+            if token in eos_ids:
+                break
+        forwards += 1
+        drafted += len(candidates)
+        accepted_total += accepted
+
+    if stats is not None:
+        stats["forwards"] = stats.get("forwards", 0) + forwards
+        stats["drafted"] = stats.get("drafted", 0) + drafted
+        stats["accepted"] = stats.get("accepted", 0) + accepted_total
+        stats["tokens"] = stats.get("tokens", 0) + len(generated)
+    return torch.tensor([generated[:max_new_tokens]], device=input_ids.device)
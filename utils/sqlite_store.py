@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import hashlib
+import threading
+
+
+def content_hash(data) -> str:
+    """
+    内容的 SHA-256 十六进制摘要，字符串按 UTF-8 编码；上传文件、抽取任务和向量缓存都以它寻址
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class SqliteStore:
+    """
+    SQLite 存储的公共部分：数据库开启 WAL，每个线程使用独立连接，
+    多线程、多进程同时读写都是安全的。子类在构造时建表。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, **kwargs)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """
+        关闭当前线程的连接，之后的访问会重新打开
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
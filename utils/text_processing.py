@@ -1,23 +1,92 @@
+import os
+import multiprocessing
 import PyPDF2
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+
+# 每个子进程各自打开一次 PDF，按页码区间解析
+_worker_reader = None
+
+
+def _init_pdf_worker(path):
+    global _worker_reader
+    _worker_reader = PyPDF2.PdfReader(path)
+
+
+def _extract_pdf_pages(start, end):
+    return [_worker_reader.pages[i].extract_text() for i in range(start, end)]
+
 
 class FileProcessor:
-    def __init__(self):
-        pass
+    def __init__(self, max_workers: int = None, pages_per_task: int = 8, min_parallel_pages: int = 32):
+        """
+        Args:
+            max_workers (int): PDF 解析进程数，默认为 CPU 核数
+            pages_per_task (int): 每个子进程任务解析的页数
+            min_parallel_pages (int): 页数少于该值时在当前进程中逐页解析
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.min_parallel_pages = min_parallel_pages
 
     def extract_text_from_pdf(self, file):
+        return list(self.iter_pdf_pages(file))
+
+    def iter_pdf_pages(self, file):
+        """
+        按页码顺序逐页产出 PDF 文本，下游可以在后面的页还在解析时就开始处理前面的页
+
+        传入文件路径且页数较多时用进程池并行解析，子进程直接读取文件，
+        不复制上传内容；同时在途的任务数有上限，内存占用与总页数无关。
+
+        Args:
+            file (str | file-like): PDF 文件路径或文件对象
+
+        Yields:
+            str: 每一页的文本
+        """
         pdf_reader = PyPDF2.PdfReader(file)
-        text_pages = []
+        num_pages = len(pdf_reader.pages)
+        if not isinstance(file, (str, os.PathLike)) or self.max_workers <= 1 or num_pages < self.min_parallel_pages:
+            for page_num in range(num_pages):
+                yield pdf_reader.pages[page_num].extract_text()
+            return
+        del pdf_reader
+
+        ranges = [(start, min(start + self.pages_per_task, num_pages))
+                  for start in range(0, num_pages, self.pages_per_task)]
+        window = self.max_workers * 2
+        # 主进程中已有 torch、模型和注册表的线程，fork 可能死锁，使用 spawn；子进程只导入本模块和 PyPDF2
+        executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=_init_pdf_worker, initargs=(file,))
+        try:
+            futures = [executor.submit(_extract_pdf_pages, *r) for r in ranges[:window]]
+            next_range = len(futures)
+            for i in range(len(ranges)):
+                pages = futures[i].result()
+                futures[i] = None
+                if next_range < len(ranges):
+                    futures.append(executor.submit(_extract_pdf_pages, *ranges[next_range]))
+                    next_range += 1
+                yield from pages
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            page_text = page.extract_text()
-            text_pages.append(page_text)
+    def iter_text_from_txt(self, path: str, block_size: int = 5000):
+        """
+        分块读取文本文件，不把整个文件读入内存
 
-        return text_pages
+        Yields:
+            str: 最多 block_size 个字符的文本
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    return
+                yield block
 
     def extract_text_from_txt(self, file):
         text = file.read().decode("utf-8")
         chunk_size = 5000
         return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-        
\ No newline at end of file
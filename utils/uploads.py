@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import threading
+from utils.sqlite_store import SqliteStore, content_hash
+
+
+class UploadStore(SqliteStore):
+    """
+    按内容寻址的上传文件存储。
+
+    文件以 SHA-256 命名保存到 data_dir(<sha><扩展名>)，同一内容只保存一次，
+    不论上传时的文件名或会话；元数据(原始文件名、大小、是否已进入 RAG 索引)
+    记录在 SQLite 中，多个会话共用。
+    """
+
+    def __init__(self, data_dir: str = './data', path: str = './storage/uploads.sqlite'):
+        super().__init__(path)
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                " sha TEXT PRIMARY KEY, file_path TEXT NOT NULL, size INTEGER NOT NULL, names TEXT NOT NULL,"
+                " indexed INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, last_seen REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def _record(row):
+        if row is None:
+            return None
+        sha, file_path, size, names, indexed, created_at, last_seen = row
+        return {"sha": sha, "file_path": file_path, "size": size, "names": json.loads(names),
+                "indexed": bool(indexed), "created_at": created_at, "last_seen": last_seen}
+
+    def get(self, sha: str):
+        row = self._conn().execute(
+            "SELECT sha, file_path, size, names, indexed, created_at, last_seen FROM uploads WHERE sha=?",
+            (sha,)).fetchone()
+        return self._record(row)
+
+    def put(self, data: bytes, name: str):
+        """
+        保存上传的文件，内容已存在时只记录新的文件名
+
+        Returns:
+            tuple: (记录, 是否为新内容)
+        """
+        sha = content_hash(data)
+        now = time.time()
+        record = self.get(sha)
+        if record is None or not os.path.exists(record["file_path"]):
+            ext = os.path.splitext(name)[1].lower()
+            file_path = os.path.join(self.data_dir, f"{sha}{ext}")
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO uploads (sha, file_path, size, names, indexed, created_at, last_seen)"
+                    " VALUES (?, ?, ?, ?, 0, ?, ?)",
+                    (sha, file_path, len(data), json.dumps([name], ensure_ascii=False), now, now))
+            return self.get(sha), True
+        names = record["names"] if name in record["names"] else record["names"] + [name]
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE uploads SET names=?, last_seen=? WHERE sha=?",
+                         (json.dumps(names, ensure_ascii=False), now, sha))
+        return self.get(sha), False
+
+    def mark_indexed(self, shas=None):
+        """
+        标记文件已进入 RAG 索引，shas 为 None 时标记全部
+        """
+        conn = self._conn()
+        with conn:
+            if shas is None:
+                conn.execute("UPDATE uploads SET indexed=1")
+            else:
+                conn.executemany("UPDATE uploads SET indexed=1 WHERE sha=?", [(sha,) for sha in shas])
+
+
+_shared_stores = {}
+_shared_lock = threading.Lock()
+
+
+def get_upload_store(data_dir: str = './data', path: str = './storage/uploads.sqlite') -> UploadStore:
+    """
+    获取进程内共享的上传文件存储
+    """
+    with _shared_lock:
+        store = _shared_stores.get((data_dir, path))
+        if store is None:
+            store = _shared_stores[(data_dir, path)] = UploadStore(data_dir, path)
+        return store
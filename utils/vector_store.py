@@ -0,0 +1,384 @@
+import os
+import json
+import math
+import faiss
+import numpy as np
+from typing import Any, List
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
+from llama_index.vector_stores.faiss import FaissVectorStore
+from llama_index.vector_stores.faiss.base import DEFAULT_PERSIST_PATH
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+DEFAULT_INDEX_CONFIG = {
+    "index_type": "flat",
+    # IVF 聚类中心数，None 时按训练时的向量数取 4*sqrt(n)
+    "nlist": None,
+    # PQ 子向量个数，需要整除向量维度
+    "pq_m": 64,
+    # HNSW 每个节点的邻居数
+    "hnsw_m": 32,
+    # 查询参数：IVF 探查的聚类数、HNSW 的候选队列长度
+    "nprobe": 16,
+    "ef_search": 64,
+    # IVF 类索引在向量数达到该值后才训练，此前先用精确检索
+    "min_train": 2048,
+    # 向量数增长到上次训练时的该倍数后重新训练，聚类中心数随之增加；None 表示不再重新训练
+    "retrain_factor": 4,
+}
+
+
+def default_nlist(n_vectors: int) -> int:
+    # 每个聚类至少 39 个训练样本，避免 faiss 的训练样本不足警告
+    return max(1, min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // 39, 65536))
+
+
+def build_faiss_index(index_type: str, dim: int, n_vectors: int = 0, nlist: int = None, pq_m: int = 64,
+                      hnsw_m: int = 32):
+    """
+    按类型创建内积度量的 FAISS 索引；向量在写入和查询前做 L2 归一化，内积即余弦相似度
+
+    Args:
+        index_type (str): flat、ivf_flat、ivf_pq 或 hnsw
+        dim (int): 向量维度
+        n_vectors (int): 用于训练的向量数，决定默认的 nlist
+
+    Returns:
+        faiss.Index: IVF 类索引需要调用 train 后才能写入
+    """
+    if index_type == "flat":
+        description = "Flat"
+    elif index_type == "hnsw":
+        description = f"HNSW{hnsw_m},Flat"
+    elif index_type == "ivf_flat":
+        description = f"IVF{nlist or default_nlist(n_vectors)},Flat"
+    elif index_type == "ivf_pq":
+        description = f"IVF{nlist or default_nlist(n_vectors)},PQ{pq_m}"
+    else:
+        raise ValueError(f"Unsupported index_type: {index_type}, expected one of {INDEX_TYPES}")
+    return faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+
+
+def _build(index_type: str, dim: int, n_vectors: int, config: dict):
+    return build_faiss_index(index_type, dim, n_vectors, nlist=config["nlist"], pq_m=config["pq_m"],
+                             hnsw_m=config["hnsw_m"])
+
+
+def _inner(index):
+    return faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+
+
+def set_search_params(index, nprobe: int = 16, ef_search: int = 64, **_):
+    """
+    设置查询参数，索引可以被 IndexIDMap 包装
+    """
+    inner = _inner(index)
+    if hasattr(inner, "nprobe"):
+        inner.nprobe = nprobe
+    if hasattr(inner, "hnsw"):
+        inner.hnsw.efSearch = ef_search
+
+
+def _pack_strings(strings: list) -> np.ndarray:
+    return np.frombuffer("\0".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _unpack_strings(array: np.ndarray) -> list:
+    return array.tobytes().decode("utf-8").split("\0") if array.size else []
+
+
+def _save_mapping(persist_path: str, vector_ids: dict, ref_doc_nodes: dict, config: dict, tombstones,
+                  trained_size: int = 0) -> None:
+    # 每个节点一行：向量 ID、节点 ID、所属文档 ID；字符串以 \0 分隔打包为字节数组，避免逐项解析 JSON
+    ref_doc_ids = {node_id: ref_doc_id for ref_doc_id, node_ids in ref_doc_nodes.items() for node_id in node_ids}
+    node_ids = list(vector_ids)
+    tmp_path = f"{persist_path}.ids.npz.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f,
+                 vector_ids=np.array([vector_ids[node_id] for node_id in node_ids], dtype="int64"),
+                 node_ids=_pack_strings(node_ids),
+                 ref_doc_ids=_pack_strings([ref_doc_ids.get(node_id, node_id) for node_id in node_ids]),
+                 tombstones=np.array(sorted(tombstones), dtype="int64"),
+                 trained_size=np.array([trained_size], dtype="int64"),
+                 config=_pack_strings([json.dumps(config)]))
+    os.replace(tmp_path, f"{persist_path}.ids.npz")
+    # 旧版 JSON 映射已被取代
+    if os.path.exists(f"{persist_path}.ids.json"):
+        os.remove(f"{persist_path}.ids.json")
+
+
+def _load_mapping(persist_path: str, full: bool = True) -> dict:
+    """
+    读取 ID 映射；full=False 时只构建查询需要的向量 ID -> 节点 ID
+    """
+    npz_path, json_path = f"{persist_path}.ids.npz", f"{persist_path}.ids.json"
+    if os.path.exists(npz_path):
+        with np.load(npz_path) as data:
+            vector_ids = data["vector_ids"].tolist()
+            node_ids = _unpack_strings(data["node_ids"])
+            mapping = {"config": json.loads(_unpack_strings(data["config"])[0]),
+                       "tombstones": data["tombstones"].tolist()}
+            if "trained_size" in data:
+                mapping["trained_size"] = int(data["trained_size"][0])
+            if full:
+                ref_doc_nodes = {}
+                for node_id, ref_doc_id in zip(node_ids, _unpack_strings(data["ref_doc_ids"])):
+                    ref_doc_nodes.setdefault(ref_doc_id, []).append(node_id)
+                mapping["vector_ids"] = dict(zip(node_ids, vector_ids))
+                mapping["ref_doc_nodes"] = ref_doc_nodes
+            else:
+                mapping["node_ids"] = dict(zip(vector_ids, node_ids))
+        return mapping
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            mapping = json.load(f)
+        if not full:
+            mapping["node_ids"] = {v: k for k, v in (mapping.get("vector_ids") or {}).items()}
+        return mapping
+    return {}
+
+
+def _read_index_mmap(path: str):
+    """
+    以内存映射方式只读打开 FAISS 索引，向量数据按需从页缓存读取；
+    当前 faiss 版本不支持时退回普通读取
+    """
+    # IO_FLAG_MMAP_IFC 覆盖 Flat/HNSW/IVF 的向量数据(requirements.txt 固定的 faiss 版本提供)；
+    # faiss 1.8 等旧版本只有 IO_FLAG_MMAP，仅作用于 IVF 倒排表，Flat/HNSW 的向量仍整体读入内存
+    for flag in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        if hasattr(faiss, flag):
+            try:
+                return faiss.read_index(path, getattr(faiss, flag))
+            except RuntimeError as e:
+                print(f"内存映射加载索引失败({flag})：{e}")
+    return faiss.read_index(path)
+
+
+class IncrementalFaissVectorStore(FaissVectorStore):
+    """
+    支持增量写入和删除的 FAISS 向量存储。
+
+    FaissVectorStore 以向量在索引中的位置作为 ID，删除会使后续位置整体前移，
+    因此不支持删除。这里为每个向量分配固定的 int64 ID(Flat/HNSW 经 IndexIDMap2，
+    IVF 自身支持自定义 ID)，并记录
+    节点/文档到向量 ID 的映射，删除文档时只移除它的向量。对外(index_struct、
+    查询结果)使用节点 ID，与 VectorStoreIndex 删除文档时的约定一致。
+    映射和索引配置以紧凑的二进制格式保存在索引文件旁的 <索引文件>.ids.npz 中。
+    只读加载(mmap=True)时索引文件通过内存映射打开，只构建查询所需的向量 ID
+    到节点 ID 的映射，冷启动耗时和常驻内存与索引大小基本无关。
+
+    索引类型由 config 决定(见 DEFAULT_INDEX_CONFIG)。IVF 类索引在向量数达到
+    min_train 之前使用精确检索，达到后自动用已有向量训练并重建，此后向量数每增长
+    到上次训练时的 retrain_factor 倍再重新训练一次；HNSW 不支持
+    物理删除，被删除的向量只做标记，标记过多时重建。
+    """
+
+    # 节点 ID -> 向量 ID
+    _vector_ids: dict = PrivateAttr(default_factory=dict)
+    # 文档 ID -> 节点 ID 列表
+    _ref_doc_nodes: dict = PrivateAttr(default_factory=dict)
+    # 向量 ID -> 节点 ID
+    _node_ids: dict = PrivateAttr(default_factory=dict)
+    # 已删除但仍留在索引中的向量 ID
+    _tombstones: set = PrivateAttr(default_factory=set)
+    _next_id: int = PrivateAttr(default=0)
+    _config: dict = PrivateAttr(default_factory=dict)
+    # IVF 类索引上次训练时的向量数
+    _trained_size: int = PrivateAttr(default=0)
+    _read_only: bool = PrivateAttr(default=False)
+
+    def __init__(self, faiss_index: Any, vector_ids: dict = None, ref_doc_nodes: dict = None, config: dict = None,
+                 tombstones=None, node_ids: dict = None, trained_size: int = None) -> None:
+        """
+        Args:
+            node_ids (dict): 只读模式下传入向量 ID -> 节点 ID，不再传 vector_ids/ref_doc_nodes
+            trained_size (int): IVF 类索引训练时的向量数，未记录时按当前向量数计
+        """
+        if not isinstance(faiss_index, (faiss.IndexIDMap, faiss.IndexIDMap2, faiss.IndexIVF)):
+            if faiss_index.ntotal:
+                raise ValueError("Existing vectors have no stable ids, rebuild the index instead")
+            faiss_index = faiss.IndexIDMap2(faiss_index)
+        if faiss_index.metric_type != faiss.METRIC_INNER_PRODUCT:
+            raise ValueError("Index does not use inner product similarity, rebuild the index instead")
+        super().__init__(faiss_index=faiss_index)
+        self._config = dict(DEFAULT_INDEX_CONFIG, **(config or {}))
+        self._vector_ids = dict(vector_ids or {})
+        self._ref_doc_nodes = {k: list(v) for k, v in (ref_doc_nodes or {}).items()}
+        self._node_ids = {vector_id: node_id for node_id, vector_id in self._vector_ids.items()}
+        if node_ids is not None:
+            self._node_ids = node_ids
+            self._read_only = True
+        self._tombstones = set(tombstones or ())
+        self._next_id = max(list(self._vector_ids.values()) + list(self._tombstones), default=-1) + 1
+        if isinstance(faiss_index, faiss.IndexIVF):
+            self._trained_size = faiss_index.ntotal if trained_size is None else trained_size
+        set_search_params(self._faiss_index, **self._config)
+
+    @classmethod
+    def create(cls, dim: int = 512, config: dict = None) -> "IncrementalFaissVectorStore":
+        config = dict(DEFAULT_INDEX_CONFIG, **(config or {}))
+        index_type = config["index_type"]
+        # IVF 类索引先用精确检索积累训练数据
+        initial = "flat" if index_type.startswith("ivf") else index_type
+        return cls(_build(initial, dim, 0, config), config=config)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str = './storage', fs=None, config: dict = None,
+                         mmap: bool = False) -> "IncrementalFaissVectorStore":
+        return cls.from_persist_path(os.path.join(persist_dir, os.path.basename(DEFAULT_PERSIST_PATH)), config=config,
+                                     mmap=mmap)
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, fs=None, config: dict = None,
+                          mmap: bool = False) -> "IncrementalFaissVectorStore":
+        """
+        加载持久化的索引；config 中的查询参数覆盖保存的值，索引类型与保存的不一致时抛出 ValueError
+
+        Args:
+            mmap (bool): 以内存映射方式只读打开，用于查询；只读的存储不能写入、删除或持久化
+        """
+        if not os.path.exists(persist_path):
+            raise ValueError(f"No existing {__name__} found at {persist_path}.")
+        mapping = _load_mapping(persist_path, full=not mmap)
+        saved = mapping.get("config") or {}
+        if config and "index_type" in config and saved.get("index_type") != config["index_type"]:
+            raise ValueError(f"Index type changed from {saved.get('index_type')} to {config.get('index_type')}")
+        config = dict(saved, **(config or {}))
+        if mmap:
+            return cls(_read_index_mmap(persist_path), config=config, tombstones=mapping.get("tombstones"),
+                       node_ids=mapping.get("node_ids") or {})
+        faiss_index = faiss.read_index(persist_path)
+        return cls(faiss_index, mapping.get("vector_ids"), mapping.get("ref_doc_nodes"), config,
+                   mapping.get("tombstones"), trained_size=mapping.get("trained_size"))
+
+    @property
+    def config(self) -> dict:
+        return dict(self._config)
+
+    def _check_writable(self):
+        if self._read_only:
+            raise RuntimeError("Vector store was opened read-only (mmap), load it without mmap to modify")
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        self._check_writable()
+        if not nodes:
+            return []
+        ids = np.arange(self._next_id, self._next_id + len(nodes), dtype="int64")
+        embeddings = np.array([node.get_embedding() for node in nodes], dtype="float32")
+        faiss.normalize_L2(embeddings)
+        self._faiss_index.add_with_ids(embeddings, ids)
+        self._next_id += len(nodes)
+        for node, vector_id in zip(nodes, ids.tolist()):
+            self._vector_ids[node.node_id] = vector_id
+            self._node_ids[vector_id] = node.node_id
+            self._ref_doc_nodes.setdefault(node.ref_doc_id or node.node_id, []).append(node.node_id)
+        if self._needs_training():
+            self._rebuild(self._config["index_type"])
+        return [node.node_id for node in nodes]
+
+    def _needs_training(self) -> bool:
+        if not self._config["index_type"].startswith("ivf"):
+            return False
+        if isinstance(self._faiss_index, faiss.IndexIVF):
+            # 聚类中心只反映训练时的语料，语料成倍增长后各聚类过大、分布偏移，召回率和查询延迟都会变差；
+            # 按倍数触发使重新训练的总开销与向量数成线性
+            factor = self._config["retrain_factor"]
+            return factor is not None and len(self._node_ids) >= factor * max(self._trained_size, 1)
+        min_train = self._config["min_train"]
+        if self._config["index_type"] == "ivf_pq":
+            # 8 bit PQ 的每个码本有 256 个中心
+            min_train = max(min_train, 256 * 39)
+        return len(self._node_ids) >= min_train
+
+    def _rebuild(self, index_type: str):
+        """
+        用当前有效的向量重建索引(IVF 类索引同时完成训练)，丢弃已删除的向量
+        """
+        vector_ids = np.array(sorted(self._node_ids), dtype="int64")
+        dim = self._faiss_index.d
+        vectors = np.vstack([self._faiss_index.reconstruct(int(i)) for i in vector_ids]) if len(vector_ids) \
+            else np.zeros((0, dim), dtype="float32")
+        index = _build(index_type, dim, len(vector_ids), self._config)
+        if isinstance(index, faiss.IndexIVF):
+            index.train(vectors)
+            # IVF 直接使用自定义 ID；哈希直接映射支持按 ID 取回向量和删除
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        else:
+            index = faiss.IndexIDMap2(index)
+        if len(vector_ids):
+            index.add_with_ids(vectors, vector_ids)
+        set_search_params(index, **self._config)
+        self._faiss_index = index
+        self._tombstones = set()
+        self._trained_size = len(vector_ids) if isinstance(index, faiss.IndexIVF) else 0
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        """
+        按文档 ID 删除其全部向量；也接受单个节点 ID(VectorStoreIndex 删除文档时会逐个节点调用)
+        """
+        self._check_writable()
+        node_ids = self._ref_doc_nodes.pop(ref_doc_id, None)
+        if node_ids is None:
+            node_ids = [ref_doc_id]
+        vector_ids = [self._vector_ids.pop(node_id) for node_id in node_ids if node_id in self._vector_ids]
+        for vector_id in vector_ids:
+            self._node_ids.pop(vector_id, None)
+        if not vector_ids:
+            return
+        try:
+            self._faiss_index.remove_ids(np.array(vector_ids, dtype="int64"))
+        except RuntimeError:
+            # HNSW 不支持删除，只做标记，查询时过滤
+            self._tombstones.update(vector_ids)
+            if len(self._tombstones) > max(64, len(self._node_ids) // 5):
+                self._rebuild(self._config["index_type"])
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("Metadata filters not implemented for Faiss yet.")
+        ntotal = self._faiss_index.ntotal
+        if not ntotal:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        embedding = np.array(query.query_embedding, dtype="float32")[np.newaxis, :]
+        faiss.normalize_L2(embedding)
+        # VectorIndexRetriever 默认传入全部节点 ID，只有给定的是子集时才需要过滤
+        if query.node_ids is not None and len(query.node_ids) < len(self._node_ids):
+            # 只在给定节点中检索(如按地图范围预筛选的节点)
+            wanted = set(query.node_ids)
+            vector_ids = np.array([v for v, n in self._node_ids.items() if n in wanted], dtype="int64")
+            if not len(vector_ids):
+                return VectorStoreQueryResult(similarities=[], ids=[])
+            k = min(query.similarity_top_k, len(vector_ids))
+            similarities, vector_ids = self._faiss_index.search(
+                embedding, k, params=self._search_params(faiss.IDSelectorBatch(vector_ids)))
+        else:
+            # 有删除标记时多取一些，保证过滤后仍有 top_k 个结果
+            k = min(query.similarity_top_k + len(self._tombstones), ntotal)
+            similarities, vector_ids = self._faiss_index.search(embedding, k)
+        results = [(float(sim), self._node_ids.get(int(i))) for sim, i in zip(similarities[0], vector_ids[0]) if i >= 0]
+        results = [(sim, node_id) for sim, node_id in results if node_id is not None][:query.similarity_top_k]
+        return VectorStoreQueryResult(similarities=[sim for sim, _ in results], ids=[node_id for _, node_id in results])
+
+    def _search_params(self, selector):
+        inner = _inner(self._faiss_index)
+        if isinstance(inner, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self._config["nprobe"])
+        if hasattr(inner, "hnsw"):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self._config["ef_search"])
+        return faiss.SearchParameters(sel=selector)
+
+    def persist(self, persist_path: str = DEFAULT_PERSIST_PATH, fs=None) -> None:
+        """
+        写入 FAISS 二进制索引和 ID 映射；先写临时文件再替换，已通过 mmap 打开旧文件的查询不受影响
+        """
+        self._check_writable()
+        directory = os.path.dirname(persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{persist_path}.tmp"
+        faiss.write_index(self._faiss_index, tmp_path)
+        os.replace(tmp_path, persist_path)
+        _save_mapping(persist_path, self._vector_ids, self._ref_doc_nodes, self._config, self._tombstones,
+                      self._trained_size)